@@ -0,0 +1,395 @@
+# created: 2026-10-18
+# see 'parser' for expected command-line arguments
+
+# goal: MEASURE how FAST!!! we are, so that we notice when we get slower
+
+''' generates reproducible synthetic directory trees and times the main
+tools on them at several scales:
+
+python3 benchmark.py run --scales small medium --out /tmp/bench-new.json
+
+(the trees get generated once into --workdir and reused by later runs)
+then compare two reports, e.g., from before and after a change, and flag
+anything that got slower or bigger than --threshold:
+
+python3 benchmark.py compare /tmp/bench-old.json /tmp/bench-new.json
+
+or just generate a tree to play with:
+
+python3 benchmark.py generate /tmp/tree --depth 3 --fanout 5 --files_per_dir 20 --dup_ratio 0.2
+
+each benchmark runs in its own fresh python subprocess, so that its peak
+RSS is its own and not left over from an earlier one. tasks:
+
+  create_inventory           crawl the first tree (no hashing)
+  create_inventory_checksum  crawl the first tree with --checksum
+  parse_inventory_file       load the first tree's inventory
+  compare_inventories        compare the two trees' inventories (parsing
+                             both is NOT included in the time)
+  find_duplicates            find duplicates in the first tree
+  find_needle_in_haystack    look for the second tree's files in the first
+'''
+
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import time
+
+# requires python >= 3.6 for f-strings
+# (NB: compare version_info, since sys.version[:3] is '3.1' on python 3.10+)
+assert sys.version_info >= (3, 6)
+
+# number of dirs is fanout + fanout**2 + ... + fanout**depth (plus the root),
+# each with files_per_dir files
+SCALES = {'small': dict(depth=2, fanout=4, files_per_dir=20),      # ~420 files
+          'medium': dict(depth=3, fanout=6, files_per_dir=40),     # ~10k files
+          'large': dict(depth=4, fanout=8, files_per_dir=40)}      # ~190k files
+
+DEFAULT_SEED = 42
+
+# median file size in bytes, and the spread of the lognormal distribution
+# of file sizes around it (real trees have lots of small files and a few
+# huge ones)
+DEFAULT_MEDIAN_SIZE = 2048
+DEFAULT_SIZE_SIGMA = 2.0
+MAX_FILE_SIZE = 8 * 1024 * 1024
+
+# fraction of files that are copies of an earlier file
+DEFAULT_DUP_RATIO = 0.1
+
+# fraction of files that the second tree changes, adds, deletes, or moves
+DEFAULT_CHANGE_RATIO = 0.05
+
+TASKS = ('create_inventory', 'create_inventory_checksum', 'parse_inventory_file',
+         'compare_inventories', 'find_duplicates', 'find_needle_in_haystack')
+
+# a result counts as a regression if it's this much worse than before
+DEFAULT_THRESHOLD = 0.10
+
+# ... and the difference is bigger than timer/allocator noise
+MIN_SECS_CHANGE = 0.01
+MIN_RSS_KB_CHANGE = 1024
+
+# all generated files get modtimes within a year before this, so that
+# trees (and thus inventories) come out identical on every run; files that
+# mutate_tree changes or adds get modtimes within the year after it
+BASE_MTIME = 1546300800 # 2019-01-01
+
+# bumped whenever generate_tree or mutate_tree change what they make, so
+# that trees cached by prepare_trees get made again
+TREE_VERSION = 2
+
+
+# generates a directory tree at root that's exactly the same for the same
+# arguments; returns the number of files
+def generate_tree(root, depth, fanout, files_per_dir, seed=DEFAULT_SEED,
+                  median_size=DEFAULT_MEDIAN_SIZE, size_sigma=DEFAULT_SIZE_SIGMA,
+                  dup_ratio=DEFAULT_DUP_RATIO):
+    rng = random.Random(seed)
+    earlier_files = [] # (path, size) of every non-duplicate file so far
+
+    def write_file(path):
+        if earlier_files and rng.random() < dup_ratio:
+            src, size = rng.choice(earlier_files)
+            shutil.copyfile(src, path)
+        else:
+            size = min(int(rng.lognormvariate(0, size_sigma) * median_size), MAX_FILE_SIZE)
+            with open(path, 'wb') as f:
+                f.write(rng.getrandbits(8 * size).to_bytes(size, 'little') if size else b'')
+            earlier_files.append((path, size))
+        mtime = BASE_MTIME + rng.randrange(365 * 86400)
+        os.utime(path, (mtime, mtime))
+
+    n_files = 0
+    # breadth-first, so that every level gets filled in the same order
+    level = [root]
+    for d in range(depth + 1):
+        next_level = []
+        for dirpath in level:
+            os.makedirs(dirpath, exist_ok=True)
+            for i in range(files_per_dir):
+                ext = rng.choice(('.txt', '.jpg', '.py', '.dat', ''))
+                write_file(os.path.join(dirpath, f'file{i}{ext}'))
+                n_files += 1
+            if d < depth:
+                next_level.extend(os.path.join(dirpath, f'dir{j}') for j in range(fanout))
+        level = next_level
+    return n_files
+
+
+# changes about change_ratio of the files under root in place: some get
+# modified (different size), some deleted, some moved to another directory,
+# and as many get added. reproducible for the same seed
+def mutate_tree(root, change_ratio=DEFAULT_CHANGE_RATIO, seed=DEFAULT_SEED):
+    rng = random.Random(seed + 1)
+
+    def set_mtime(path):
+        mtime = BASE_MTIME + 365 * 86400 + rng.randrange(365 * 86400)
+        os.utime(path, (mtime, mtime))
+
+    all_files = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        all_files.extend(os.path.join(dirpath, fn) for fn in sorted(filenames))
+    all_dirs = sorted(set(os.path.dirname(p) for p in all_files))
+
+    n = int(len(all_files) * change_ratio)
+    for i, path in enumerate(rng.sample(all_files, n)):
+        op = i % 3
+        if op == 0:
+            with open(path, 'ab') as f:
+                f.write(b'changed' * (i + 1))
+            set_mtime(path)
+        elif op == 1:
+            os.remove(path)
+        else:
+            dst_dir = rng.choice(all_dirs)
+            os.rename(path, os.path.join(dst_dir, f'moved{i}_{os.path.basename(path)}'))
+    for i in range(n // 3):
+        path = os.path.join(rng.choice(all_dirs), f'added{i}.dat')
+        with open(path, 'wb') as f:
+            f.write(rng.getrandbits(8 * 100).to_bytes(100, 'little'))
+        set_mtime(path)
+
+
+def _tree_params(scale, seed):
+    return dict(SCALES[scale], seed=seed, tree_version=TREE_VERSION)
+
+
+# makes sure that workdir/<scale>/{first,second} exist for these params
+# (reusing them from an earlier run if possible), and returns their paths
+def prepare_trees(workdir, scale, seed=DEFAULT_SEED):
+    scale_dir = os.path.join(workdir, scale)
+    params_file = os.path.join(scale_dir, 'params.json')
+    params = _tree_params(scale, seed)
+    first = os.path.join(scale_dir, 'first')
+    second = os.path.join(scale_dir, 'second')
+
+    if os.path.exists(params_file):
+        with open(params_file) as f:
+            if json.load(f) == params:
+                return (first, second)
+    shutil.rmtree(scale_dir, ignore_errors=True)
+
+    print(f'generating {scale} trees in {scale_dir} ...', file=sys.stderr)
+    generate_tree(first, **SCALES[scale], seed=seed)
+    shutil.copytree(first, second, copy_function=shutil.copy2)
+    mutate_tree(second, seed=seed)
+    with open(params_file, 'w') as f:
+        json.dump(params, f)
+    return (first, second)
+
+
+# runs one task in THIS process and returns (n_files, wall_secs); called
+# in a fresh subprocess by run_task. everything that the task prints goes
+# to /dev/null
+def _run_task_here(task, first, second, inv_dir):
+    # (imported here so that importing benchmark.py itself stays cheap)
+    from compare_inventories import parse_inventory_file, compare_inventories, DEFAULT_SUMMARY_THRESHOLD
+    from containment_test import find_needle_in_haystack
+    from create_inventory import create_inventory
+    from find_duplicates import find_duplicates
+
+    first_inv = os.path.join(inv_dir, 'first.jsonl')
+    second_inv = os.path.join(inv_dir, 'second.jsonl')
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        if task in ('create_inventory', 'create_inventory_checksum'):
+            out = os.path.join(inv_dir, f'{task}.jsonl')
+            start = time.perf_counter()
+            create_inventory(first, 'bench', task == 'create_inventory_checksum', output=out)
+            secs = time.perf_counter() - start
+            n_files = sum(1 for line in open(out)) - 1
+        elif task == 'parse_inventory_file':
+            start = time.perf_counter()
+            inv = parse_inventory_file(first_inv)
+            secs = time.perf_counter() - start
+            n_files = len(inv)
+        elif task == 'compare_inventories':
+            a = parse_inventory_file(first_inv)
+            b = parse_inventory_file(second_inv)
+            start = time.perf_counter()
+            compare_inventories(a, b, DEFAULT_SUMMARY_THRESHOLD)
+            secs = time.perf_counter() - start
+            n_files = len(a) + len(b)
+        elif task == 'find_duplicates':
+            inv = parse_inventory_file(first_inv)
+            start = time.perf_counter()
+            find_duplicates(inv, first)
+            secs = time.perf_counter() - start
+            n_files = len(inv)
+        elif task == 'find_needle_in_haystack':
+            haystack = parse_inventory_file(first_inv)
+            needle = parse_inventory_file(second_inv)
+            start = time.perf_counter()
+            find_needle_in_haystack(needle, haystack)
+            secs = time.perf_counter() - start
+            n_files = len(needle) + len(haystack)
+        else:
+            assert False, f'unknown task: {task}'
+    return (n_files, secs)
+
+
+# NB: on linux, ru_maxrss survives exec(), so a fresh subprocess would
+# report its parent's peak if that was higher. the VmHWM ('high water mark')
+# in /proc starts over with every exec(), so use that if we can
+def _peak_rss_kb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # (it's in bytes on macOS but in KB on linux)
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+
+# runs task in a fresh python subprocess and returns its result dict
+def run_task(task, first, second, inv_dir):
+    out = subprocess.run([sys.executable, os.path.abspath(__file__), '_task',
+                          task, first, second, inv_dir],
+                         check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+    return json.loads(out.splitlines()[-1])
+
+
+# makes the (checksummed) inventories of both trees that the non-crawling
+# tasks start from
+def make_inventories(first, second, inv_dir):
+    from create_inventory import create_inventory
+    os.makedirs(inv_dir, exist_ok=True)
+    for tree, name in ((first, 'first'), (second, 'second')):
+        create_inventory(tree, name, True, output=os.path.join(inv_dir, f'{name}.jsonl'))
+
+
+# runs every task at every scale (repeat times each, keeping the fastest
+# wall time and smallest peak RSS) and returns the report dict
+def run_benchmarks(workdir, scales, tasks=TASKS, repeat=1, seed=DEFAULT_SEED):
+    results = []
+    for scale in scales:
+        first, second = prepare_trees(workdir, scale, seed)
+        inv_dir = os.path.join(workdir, scale, 'inventories')
+        make_inventories(first, second, inv_dir)
+        for task in tasks:
+            runs = [run_task(task, first, second, inv_dir) for i in range(repeat)]
+            secs = min(r['wall_secs'] for r in runs)
+            r = dict(scale=scale, task=task, n_files=runs[0]['n_files'],
+                     wall_secs=round(secs, 4),
+                     files_per_sec=round(runs[0]['n_files'] / secs) if secs > 0 else None,
+                     peak_rss_kb=min(r['peak_rss_kb'] for r in runs))
+            print(f'{scale:8} {task:27} {r["n_files"]:9} files  {r["wall_secs"]:9.3f}s  '
+                  f'{r["files_per_sec"] or 0:10} files/sec  {r["peak_rss_kb"]:9} KB peak RSS',
+                  file=sys.stderr)
+            results.append(r)
+
+    return dict(created=datetime.datetime.now().isoformat(timespec='seconds'),
+                commit=_git_commit(), python=platform.python_version(),
+                platform=platform.platform(), seed=seed, repeat=repeat,
+                results=results)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                              cwd=os.path.dirname(os.path.abspath(__file__)),
+                              check=True, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                              universal_newlines=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# prints how every (scale, task) result in new_report changed since
+# old_report, and returns the list of regressions: results whose wall time
+# or peak RSS got more than threshold (e.g., 0.1 = 10%) worse, by more than
+# MIN_SECS_CHANGE or MIN_RSS_KB_CHANGE
+def compare_reports(old_report, new_report, threshold=DEFAULT_THRESHOLD):
+    old = {(r['scale'], r['task']): r for r in old_report['results']}
+    print(f'old: {old_report.get("commit")} ({old_report.get("created")})')
+    print(f'new: {new_report.get("commit")} ({new_report.get("created")})')
+    regressions = []
+    for r in new_report['results']:
+        k = (r['scale'], r['task'])
+        if k not in old:
+            print(f'{k[0]:8} {k[1]:27} (new)')
+            continue
+        o = old[k]
+        flags = []
+        changes = []
+        for field, min_change in (('wall_secs', MIN_SECS_CHANGE), ('peak_rss_kb', MIN_RSS_KB_CHANGE)):
+            if o[field]:
+                change = r[field] / o[field] - 1
+                changes.append(f'{field} {o[field]} -> {r[field]} ({change:+.1%})')
+                if change > threshold and r[field] - o[field] > min_change:
+                    flags.append(field)
+        if flags:
+            regressions.append((k, flags))
+        print(f'{k[0]:8} {k[1]:27} {"  ".join(changes)}{"  <-- REGRESSION" if flags else ""}')
+    print(f'{len(regressions)} regressions (threshold: {threshold:.0%})')
+    return regressions
+
+
+if __name__ == '__main__':
+    # internal: run one task in this (fresh) process and print its result
+    if len(sys.argv) > 1 and sys.argv[1] == '_task':
+        task, first, second, inv_dir = sys.argv[2:6]
+        n_files, secs = _run_task_here(task, first, second, inv_dir)
+        print(json.dumps(dict(n_files=n_files, wall_secs=secs, peak_rss_kb=_peak_rss_kb())))
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    p = subparsers.add_parser('run', help="generate trees (if needed) and run the benchmarks")
+    p.add_argument("--scales", nargs='+', choices=list(SCALES), default=['small', 'medium'])
+    p.add_argument("--tasks", nargs='+', choices=TASKS, default=list(TASKS))
+    p.add_argument("--workdir", default='/tmp/directory-tree-inventory-benchmark',
+                   help="where to generate (and keep) the synthetic trees")
+    p.add_argument("--repeat", type=int, default=1, help="run each task N times and keep the best")
+    p.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    p.add_argument("--out", help="write the JSON report to this file (default: stdout)")
+
+    p = subparsers.add_parser('compare', help="compare two reports from 'run'")
+    p.add_argument("old_report")
+    p.add_argument("new_report")
+    p.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                   help="flag results that got more than this much worse (0.1 = 10%%)")
+
+    p = subparsers.add_parser('generate', help="generate one synthetic tree")
+    p.add_argument("root", help="directory to generate the tree in")
+    p.add_argument("--depth", type=int, default=SCALES['small']['depth'])
+    p.add_argument("--fanout", type=int, default=SCALES['small']['fanout'])
+    p.add_argument("--files_per_dir", type=int, default=SCALES['small']['files_per_dir'])
+    p.add_argument("--median_size", type=int, default=DEFAULT_MEDIAN_SIZE, help="median file size in bytes")
+    p.add_argument("--size_sigma", type=float, default=DEFAULT_SIZE_SIGMA, help="spread of the lognormal file size distribution")
+    p.add_argument("--dup_ratio", type=float, default=DEFAULT_DUP_RATIO, help="fraction of files that duplicate an earlier file")
+    p.add_argument("--seed", type=int, default=DEFAULT_SEED)
+
+    args = parser.parse_args()
+    if args.command == 'run':
+        report = run_benchmarks(args.workdir, args.scales, args.tasks, args.repeat, args.seed)
+        if args.out:
+            with open(args.out, 'w') as f:
+                json.dump(report, f, indent=1)
+        else:
+            print(json.dumps(report, indent=1))
+    elif args.command == 'compare':
+        with open(args.old_report) as f:
+            old_report = json.load(f)
+        with open(args.new_report) as f:
+            new_report = json.load(f)
+        regressions = compare_reports(old_report, new_report, args.threshold)
+        sys.exit(1 if regressions else 0)
+    else:
+        assert not os.path.exists(args.root), f'{args.root} already exists'
+        n = generate_tree(args.root, args.depth, args.fanout, args.files_per_dir, args.seed,
+                          args.median_size, args.size_sigma, args.dup_ratio)
+        print(f'generated {n} files in {args.root}')
@@ -0,0 +1,278 @@
+# created: 2026-10-18
+# see 'parser' for expected command-line arguments
+
+# goal: be FAST!!!
+
+''' compact binary/columnar alternative to the .jsonl inventory format
+
+convert an existing inventory with something like:
+
+python3 binary_inventory.py inventory-files_do-not-add-to-git/2018-12-01-mba.jsonl inventory-files_do-not-add-to-git/2018-12-01-mba.dtinv
+
+.jsonl inventories repeat every key name and the full directory string on
+every line, and loading them is dominated by json.loads. instead, this
+format stores:
+
+- each directory string ONCE in a directory table, referenced by integer id
+- each distinct file name ONCE in a name table, referenced by integer id
+- sizes, modtimes, and hashes in packed arrays (one column per field)
+
+layout (all integers little-endian):
+
+  MAGIC
+  then a sequence of sections, each one a uint64 byte length + payload:
+    metadata    json-encoded metadata dict (the first line of a .jsonl file)
+    dirs        '\\0'-separated directory strings
+    dir_mtimes  float64 per directory (NaN if there was no directory record)
+    names       '\\0'-separated file names
+    dir_ids     uint32 per file, index into dirs
+    name_ids    uint32 per file, index into names
+    sizes       int64 per file
+    mtimes      float64 per file
+    crc32s      int64 per file (-1 for none), or empty if no file has one
+    hashes      fixed-width raw digest bytes per file, or empty if none
+
+the numeric sections are plain arrays, so they can also be loaded with
+numpy.frombuffer(..., dtype='<u4') and friends
+
+paths are encoded with utf-8 + 'surrogatepass' so that any str that json
+could hold (including undecodable filenames) survives the round trip.
+file extensions aren't stored since they're just os.path.splitext(name)
+'''
+
+import argparse
+import json
+import os
+import struct
+import sys
+from array import array
+from inventory_io import iter_jsonl_inventory
+
+# requires python >= 3.6 for f-strings
+# (NB: compare version_info, since sys.version[:3] is '3.1' on python 3.10+)
+assert sys.version_info >= (3, 6)
+
+MAGIC = b'DTINV\x00\x01\n'
+
+# array typecodes for each numeric column
+DIR_ID_TYPECODE = 'I'
+NAME_ID_TYPECODE = 'I'
+SIZE_TYPECODE = 'q'
+MTIME_TYPECODE = 'd'
+CRC32_TYPECODE = 'q'
+
+NO_CRC32 = -1
+
+for tc in (DIR_ID_TYPECODE, NAME_ID_TYPECODE):
+    assert array(tc).itemsize == 4
+for tc in (SIZE_TYPECODE, MTIME_TYPECODE, CRC32_TYPECODE):
+    assert array(tc).itemsize == 8
+
+
+def is_binary_inventory(filename):
+    with open(filename, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def _encode_strings(strs):
+    return '\0'.join(strs).encode('utf-8', 'surrogatepass')
+
+
+def _decode_strings(b):
+    if not b:
+        return []
+    return bytes(b).decode('utf-8', 'surrogatepass').split('\0')
+
+
+def _array_to_bytes(a):
+    if sys.byteorder == 'big':
+        a = array(a.typecode, a)
+        a.byteswap()
+    return a.tobytes()
+
+
+def _array_from_bytes(typecode, b):
+    a = array(typecode)
+    a.frombytes(b)
+    if sys.byteorder == 'big':
+        a.byteswap()
+    return a
+
+
+# in-memory columns of one inventory; rows are files, in the same order as
+# the lines of the original .jsonl file
+class InventoryColumns:
+    def __init__(self, metadata):
+        self.metadata = metadata
+        self.dirs = []        # directory table
+        self.dir_mtimes = array(MTIME_TYPECODE)
+        self.names = []       # name table
+        self.dir_ids = array(DIR_ID_TYPECODE)
+        self.name_ids = array(NAME_ID_TYPECODE)
+        self.sizes = array(SIZE_TYPECODE)
+        self.mtimes = array(MTIME_TYPECODE)
+        self.crc32s = array(CRC32_TYPECODE)
+        # fixed-width raw digests of all files back to back, or None
+        self.hash_bytes = None
+        self.hash_width = 0
+
+    def __len__(self):
+        return len(self.sizes)
+
+    # hex string of the i'th file's 'h' hash, or None
+    def hash_at(self, i):
+        if self.hash_bytes is None:
+            return None
+        w = self.hash_width
+        return self.hash_bytes[i*w:(i+1)*w].hex()
+
+
+# builds InventoryColumns (or subclass cls) from the metadata and records of
+# a .jsonl inventory (including create_inventory.py --record_dirs records)
+def columns_from_records(metadata, records, cls=InventoryColumns):
+    cols = cls(metadata)
+    dir_index = {}
+    name_index = {}
+    any_crc32 = False
+    n_hashes = 0
+    hash_bytes = bytearray()
+
+    def dir_id(d):
+        try:
+            return dir_index[d]
+        except KeyError:
+            i = dir_index[d] = len(cols.dirs)
+            cols.dirs.append(d)
+            cols.dir_mtimes.append(float('nan'))
+            return i
+
+    for r in records:
+        if 'dir' in r:
+            cols.dir_mtimes[dir_id(r['dir'])] = r['mt']
+            continue
+
+        cols.dir_ids.append(dir_id(r['d']))
+        fn = r['f']
+        try:
+            cols.name_ids.append(name_index[fn])
+        except KeyError:
+            name_index[fn] = len(cols.names)
+            cols.name_ids.append(len(cols.names))
+            cols.names.append(fn)
+        cols.sizes.append(r['sz'])
+        cols.mtimes.append(r['mt'])
+        crc32_val = r.get('crc32')
+        if crc32_val is not None:
+            any_crc32 = True
+        cols.crc32s.append(NO_CRC32 if crc32_val is None else crc32_val)
+        h = r.get('h')
+        if h is not None:
+            n_hashes += 1
+            if not cols.hash_width:
+                cols.hash_width = len(h) // 2
+            assert len(h) == cols.hash_width * 2
+            hash_bytes += bytes.fromhex(h)
+
+    if not any_crc32:
+        cols.crc32s = array(CRC32_TYPECODE)
+    if n_hashes:
+        assert n_hashes == len(cols), "either all files or none must have an 'h' hash"
+        cols.hash_bytes = bytes(hash_bytes)
+    return cols
+
+
+def write_binary_inventory(cols, filename):
+    hashes_bytes = cols.hash_bytes or b''
+
+    sections = [json.dumps(cols.metadata).encode('utf-8'),
+                _encode_strings(cols.dirs),
+                _array_to_bytes(cols.dir_mtimes),
+                _encode_strings(cols.names),
+                _array_to_bytes(cols.dir_ids),
+                _array_to_bytes(cols.name_ids),
+                _array_to_bytes(cols.sizes),
+                _array_to_bytes(cols.mtimes),
+                _array_to_bytes(cols.crc32s),
+                hashes_bytes]
+    with open(filename, 'wb') as f:
+        f.write(MAGIC)
+        for s in sections:
+            f.write(struct.pack('<Q', len(s)))
+            f.write(s)
+
+
+# returns InventoryColumns (or subclass cls)
+def read_binary_inventory(filename, cls=InventoryColumns):
+    with open(filename, 'rb') as f:
+        data = f.read()
+    assert data[:len(MAGIC)] == MAGIC, f'{filename} is not a binary inventory'
+    view = memoryview(data)
+    sections = []
+    pos = len(MAGIC)
+    while pos < len(data):
+        (n,) = struct.unpack_from('<Q', data, pos)
+        pos += 8
+        sections.append(view[pos:pos+n])
+        pos += n
+    assert pos == len(data)
+    assert len(sections) == 10
+
+    cols = cls(json.loads(bytes(sections[0])))
+    cols.dirs = _decode_strings(sections[1])
+    cols.dir_mtimes = _array_from_bytes(MTIME_TYPECODE, sections[2])
+    cols.names = _decode_strings(sections[3])
+    cols.dir_ids = _array_from_bytes(DIR_ID_TYPECODE, sections[4])
+    cols.name_ids = _array_from_bytes(NAME_ID_TYPECODE, sections[5])
+    cols.sizes = _array_from_bytes(SIZE_TYPECODE, sections[6])
+    cols.mtimes = _array_from_bytes(MTIME_TYPECODE, sections[7])
+    cols.crc32s = _array_from_bytes(CRC32_TYPECODE, sections[8])
+    if len(sections[9]):
+        cols.hash_width = len(sections[9]) // len(cols)
+        cols.hash_bytes = bytes(sections[9])
+
+    assert len(cols.dir_mtimes) == len(cols.dirs)
+    for c in (cols.dir_ids, cols.name_ids, cols.mtimes):
+        assert len(c) == len(cols)
+    assert not cols.crc32s or len(cols.crc32s) == len(cols)
+    return cols
+
+
+# yields the metadata dict followed by one dict per file, exactly like
+# json.loads() of each line of the equivalent .jsonl inventory would
+# (minus --record_dirs directory records)
+def iter_binary_records(filename):
+    cols = read_binary_inventory(filename)
+    yield cols.metadata
+
+    dirs = cols.dirs
+    names = cols.names
+    exts = [os.path.splitext(fn)[1] for fn in names]
+    crc32s = cols.crc32s
+    has_hashes = cols.hash_bytes is not None
+    for i, (di, ni, sz, mt) in enumerate(zip(cols.dir_ids, cols.name_ids, cols.sizes, cols.mtimes)):
+        r = dict(d=dirs[di], f=names[ni], e=exts[ni], mt=mt, sz=sz)
+        if crc32s and crc32s[i] != NO_CRC32:
+            r['crc32'] = crc32s[i]
+        if has_hashes:
+            r['h'] = cols.hash_at(i)
+        yield r
+
+
+def convert_jsonl_to_binary(jsonl_filename, binary_filename):
+    records = iter_jsonl_inventory(jsonl_filename)
+    cols = columns_from_records(next(records), records)
+    write_binary_inventory(cols, binary_filename)
+    return cols
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+
+    # mandatory positional arguments:
+    parser.add_argument("jsonl_file", help=".jsonl inventory file created by create_inventory.py")
+    parser.add_argument("binary_file", help="binary inventory file to write")
+
+    args = parser.parse_args()
+    cols = convert_jsonl_to_binary(args.jsonl_file, args.binary_file)
+    print(f'{len(cols)} files, {len(cols.dirs)} dirs, {len(cols.names)} distinct names: '
+          f'{os.path.getsize(args.jsonl_file)} -> {os.path.getsize(args.binary_file)} bytes')
@@ -9,20 +9,11 @@ python3 compare_inventories.py inventory-files_do-not-add-to-git/2018-12-01-mba.
 python3 compare_inventories.py inventory-files_do-not-add-to-git/2018-12-01-imac-pro.jsonl inventory-files_do-not-add-to-git/2018-12-29-imac-pro.jsonl > /tmp/out
 python3 compare_inventories.py inventory-files_do-not-add-to-git/2018-12-15-imac-pro.jsonl inventory-files_do-not-add-to-git/2018-12-29-imac-pro.jsonl > /tmp/out
 
-TODOs:
+DONE:
 - use heuristics like file size and modtimes to see if those files were MOVED
+  (see detect_moves and rollup_dir_moves)
 '''
 
-# include slashes in dirnames to prevent spurious substring matches
-DEFAULT_IGNORE_DIRS = ['directory-tree-inventory/inventory-files_do-not-add-to-git',
-                       '/.git',
-                       '/node_modules',
-                       '/.dropbox.cache']
-
-DEFAULT_IGNORE_FILENAMES = ['Thumbs.db', 'thumbs.db', '.DS_Store', 'Icon\r'] # 'Icon\r' doesn't print properly anyhow, #weird
-
-DEFAULT_IGNORE_DIREXTS = ['pgbovine,.htm', 'pgbovine,.html']
-
 DEFAULT_SUMMARY_THRESHOLD = 10
 
 
@@ -32,256 +23,510 @@ import os
 import sys
 import time
 import datetime
-from collections import Counter, defaultdict
-
-# requires python >= 3.5 to get os.walk to use the MUCH faster os.scandir function
-assert float(sys.version[:3]) >= 3.5
+from collections import Counter, defaultdict, deque
+from binary_inventory import is_binary_inventory, iter_binary_records, read_binary_inventory, columns_from_records
+from dirtree_report import build_dirtree, make_report, TextReport, REPORT_FORMATS
+from instrumentation import RunStats, profiled
+from inventory import Inventory
+from inventory_io import iter_jsonl_inventory
+from ignore_rules import IgnoreRules, parse_rules, DEFAULT_IGNORE_DIRS, DEFAULT_IGNORE_FILENAMES, DEFAULT_IGNORE_DIREXTS
+
+# requires python >= 3.6 for f-strings
+# (NB: compare version_info, since sys.version[:3] is '3.1' on python 3.10+)
+assert sys.version_info >= (3, 6)
+
+
+# returns the hash algorithm that an inventory's records were hashed with
+# (see file_hashing.HASH_ALGORITHMS), or None if they have no hashes.
+# inventories from before --hash existed can only have crc32-prefix hashes
+def inventory_hash_algorithm(metadata):
+    if 'hash' in metadata:
+        return metadata['hash']
+    return 'crc32-prefix' if metadata.get('take_checksum') else None
+
+
+# yields the metadata dict and then one dict per record of an inventory
+# file, which can be either a .jsonl file from create_inventory.py (plain,
+# or compressed with --compress), the manifest of a sharded one from
+# sharded_crawl.py, or a binary one from binary_inventory.py
+def iter_inventory_records(filename):
+    if is_binary_inventory(filename):
+        yield from iter_binary_records(filename)
+    else:
+        yield from iter_jsonl_inventory(filename)
 
 
 # parses an inventory file created by create_inventory() in create_inventory.py
-# and returns a dict
+# (or converted by binary_inventory.py, or the manifest of a sharded one
+# from sharded_crawl.py) and returns an inventory.Inventory
 def parse_inventory_file(filename):
-    ret = {}
-
     assert os.path.isfile(filename)
-    metadata = None
-
-    # index the records in a few ways
-    records_by_path = {} # key: (dirname, filename) tuple
-
-    # key: modtime, value: list of records with this modtime
-    records_by_modtime = defaultdict(list)
-
-    # key: file size, value: list of records with this file size
-    records_by_filesize = defaultdict(list)
 
-    # key: crc32 hash value, value: list of records with this hash
-    records_by_crc32 = defaultdict(list)
+    if is_binary_inventory(filename):
+        inv = read_binary_inventory(filename, cls=Inventory)
+    else:
+        records = iter_inventory_records(filename)
+        metadata = next(records) # first line is metadata
+        # (columns_from_records skips create_inventory.py --record_dirs
+        # per-directory records)
+        inv = columns_from_records(metadata, records, cls=Inventory)
 
-    n_records = 0
-    for line in open(filename):
-        record = json.loads(line)
-        # first line is metadata
-        if not metadata:
-            metadata = record
-            continue # ok, next!
+    clean_up_metadata(inv.metadata)
+    return inv
 
-        n_records += 1
 
-        dn = record['d']
-        fn = record['f']
-        ext = record['e']
-        modtime = record['mt']
-        filesize = record['sz']
-
-        assert (dn, fn) not in records_by_path
-        records_by_path[(dn, fn)] = record
-
-        records_by_modtime[modtime].append(record)
-        records_by_filesize[filesize].append(record)
-
-        try:
-            crc32_val = record['crc32']
-            records_by_crc32[crc32_val].append(record)
-        except KeyError:
-            pass
-
-    # clean up metadata
+# makes inventory metadata more readable for printing
+def clean_up_metadata(metadata):
     metadata['dt'] = datetime.datetime.utcfromtimestamp(metadata['ts']).strftime('%Y-%m-%d %H:%M:%S UTC')
     del metadata['ts']
     if not metadata['ignore_dirs']:
         del metadata['ignore_dirs']
 
-    ret['metadata'] = metadata
-    ret['records_by_path'] = records_by_path
-    ret['records_by_modtime'] = records_by_modtime
-    ret['records_by_filesize'] = records_by_filesize
-    if records_by_crc32:
-        ret['records_by_crc32'] = records_by_crc32
 
-    assert len(records_by_path) == n_records
-    assert sum(len(e) for e in records_by_modtime.values()) == n_records
-    assert sum(len(e) for e in records_by_filesize.values()) == n_records
-    return ret
+# metadata minus the (long) create_inventory.py --stats stats, for printing
+def printable_metadata(metadata):
+    return {k: v for k, v in metadata.items() if k != 'stats'}
 
 
-# create a tree-like structure from a list of files, each one containing
-# a 'dirs' entry which is a list of directory path entries for that file
-def create_dirtree(files_lst):
-    rootdir = dict(files=[],
-                   subdirs={}, # key: name of one subdirectory level, value: its entry
-                   dirname='')
-    for e in files_lst:
-        path_entries = e['dirs']
-        if len(path_entries) == 1 and path_entries[0] == '': # top-level root dir
-            rootdir['files'].append(e)
-        else:
-            cur_entry = rootdir # always start at root
-
-            # traverse down path_entries and create children to the tree
-            # rooted at rootdir as necessary:
-            for p in path_entries:
-                if p not in cur_entry['subdirs']:
-                    cur_entry['subdirs'][p] = dict(dirname=p, files=[], subdirs={})
-                cur_entry = cur_entry['subdirs'][p]
-            cur_entry['files'].append(e)
-    return rootdir
+# sort key that defines 'path order' for sorted inventories: the order
+# in which a depth-first crawl that visits names in sorted order produces
+# files (i.e., create_inventory.py --sorted), which is NOT plain string
+# order of 'dir/file' since '/' sorts after characters like '-' and '.'
+def path_sort_key(dirname, filename):
+    return (dirname.split('/'), filename)
 
 
-# dt: created by create_dirtree
-def pretty_print_dirtree(dt, summary_threshold, aux_dict_repr):
-    def print_helper(cur_entry, level):
-        prefix = ('    ' * level)
-        prefix_plus_one = ('    ' * (level+1))
-        print(prefix + '/' + cur_entry['dirname']) # leading '/' for readability
-        n_files = len(cur_entry['files'])
-        if n_files > summary_threshold:
-            print(f'{prefix_plus_one}[{n_files} files]')
+# yields (path_sort_key, record) for all files in an inventory that's
+# sorted in path order, making sure that it really is sorted as we go
+def iter_sorted_records(filename, records=None):
+    if records is None:
+        records = iter_inventory_records(filename)
+        next(records) # skip metadata
+    prev_key = None
+    for r in records:
+        # skip per-directory records (create_inventory.py --record_dirs)
+        if 'dir' in r:
+            continue
+        key = path_sort_key(r['d'], r['f'])
+        assert prev_key is None or prev_key < key, \
+            f'{filename} is not sorted in path order at {r["d"]}/{r["f"]} (fix with sort_inventory.py)'
+        prev_key = key
+        yield (key, r)
+
+
+# merge-joins two streams of (key, record) pairs that are both sorted by key
+# (like iter_sorted_records produces) in a single pass, yielding
+# (key, first_record, second_record) where one of the records is None if
+# the key only exists on one side
+def merge_join(first_iter, second_iter):
+    first_iter = iter(first_iter)
+    second_iter = iter(second_iter)
+    a = next(first_iter, None)
+    b = next(second_iter, None)
+    while a is not None and b is not None:
+        if a[0] == b[0]:
+            yield (a[0], a[1], b[1])
+            a = next(first_iter, None)
+            b = next(second_iter, None)
+        elif a[0] < b[0]:
+            yield (a[0], a[1], None)
+            a = next(first_iter, None)
         else:
-            for f in cur_entry['files']:
-                print(f'{prefix_plus_one}{f["fn"]}    {aux_dict_repr(f)}')
-        for k in sorted(cur_entry['subdirs'].keys()):
-            print_helper(cur_entry['subdirs'][k], level+1)
-
-    print_helper(dt, 0)
+            yield (b[0], None, b[1])
+            b = next(second_iter, None)
+    while a is not None:
+        yield (a[0], a[1], None)
+        a = next(first_iter, None)
+    while b is not None:
+        yield (b[0], None, b[1])
+        b = next(second_iter, None)
+
+
+# create a tree-like structure (a dirtree_report.DirNode) from a list of
+# files, each one a dict containing a 'dirs' entry which is a list of
+# directory path entries for that file, 'fn', and optionally 'size'
+def create_dirtree(files_lst):
+    return build_dirtree(('/'.join(e['dirs']), e['fn'], e.get('size'), e) for e in files_lst)
 
 
-# compare inventories produced by parse_inventory_file
-# you can pass in optional paths to ignore
-def compare_inventories(first, second, summary_threshold,
-                        ignore_modtimes=False,
-                        ignore_dirs=[],
-                        ignore_filenames=[],
-                        ignore_exts=[],
-                        ignore_direxts=[]):
+# dt: created by create_dirtree (or dirtree_report.build_dirtree)
+def pretty_print_dirtree(dt, summary_threshold, aux_dict_repr):
+    report = TextReport(summary_threshold)
+    report.tree('', dt, aux_dict_repr)
+    report.close()
+
+
+# returns (should_ignore, ignore_dirs, ignore_filenames, ignore_exts,
+# ignore_direxts), where should_ignore(e) is True if e, a (dirname, filename)
+# pair, matches any of the ignore lists (with the defaults appended), any of
+# the gitignore-style ignore_globs, or any rule in ignore_rules_file (see
+# ignore_rules.py). should_ignore is an ignore_rules.IgnoreRules, which
+# compiles all of the rules up front and decides each directory only once
+def make_ignore_filter(ignore_dirs=[],
+                       ignore_filenames=[],
+                       ignore_exts=[],
+                       ignore_direxts=[],
+                       ignore_globs=[],
+                       ignore_rules_file=None):
     # make sure they start as empty lists
     if not ignore_dirs: ignore_dirs = []
     if not ignore_filenames: ignore_filenames = []
     if not ignore_exts: ignore_exts = []
     if not ignore_direxts: ignore_direxts = []
+    if not ignore_globs: ignore_globs = []
+
+    if ignore_rules_file:
+        with open(ignore_rules_file) as f:
+            rules = parse_rules(f)
+        ignore_globs += rules['globs']
+        ignore_dirs += rules['dir_substrings']
+        ignore_filenames += rules['filenames']
+        ignore_exts += rules['exts']
+        ignore_direxts += rules['direxts']
 
     # append defaults:
     ignore_dirs += DEFAULT_IGNORE_DIRS
     ignore_filenames += DEFAULT_IGNORE_FILENAMES
     ignore_direxts += DEFAULT_IGNORE_DIREXTS
 
-    # parse it:
+    should_ignore = IgnoreRules(ignore_globs, ignore_dirs, ignore_filenames,
+                                ignore_exts, ignore_direxts)
     ignore_direxts = [tuple(e.split(',')) for e in ignore_direxts]
-    for e in ignore_direxts: assert len(e) == 2
-
-    # make sure extensions start with '.'!
-    for e in ignore_exts:
-        assert e[0] == '.'
-
 
-    # e is a (dirname, filename) pair
-    def should_ignore(e):
-        for d in ignore_dirs:
-            if d in e[0]: # substring match
+    return (should_ignore, ignore_dirs, ignore_filenames, ignore_exts, ignore_direxts)
+
+
+# compares the records of the same file in two inventories and returns
+# (changed, modtimes_diff_secs, sizes_diff_bytes)
+def diff_file_records(first_data, second_data, ignore_modtimes=False):
+    modtimes_differ = False
+    modtimes_diff_secs = 0
+    sizes_differ = False
+    sizes_diff_bytes = 0
+
+    # use a heuristic for 'close enough' in terms of modtimes
+    # (within a minute)
+    if not ignore_modtimes:
+        modtimes_diff_secs = round(second_data['mt'] - first_data['mt'])
+        if abs(modtimes_diff_secs) > 60:
+            modtimes_differ = True
+
+    if first_data['sz'] != second_data['sz']:
+        sizes_differ = True
+        sizes_diff_bytes = second_data['sz'] - first_data['sz']
+
+    # only report a change if the SIZE differs
+    # (note that there may be false positives ... use a has to be
+    # really sure!!!)
+    #return (modtimes_differ or sizes_differ, ...)
+    return (sizes_differ, modtimes_diff_secs, sizes_diff_bytes)
+
+
+def changed_repr(f):
+    delta_bytes = None
+    if f["diff_bytes"] > 0:
+        delta_bytes = f'+{f["diff_bytes"]} bytes'
+    elif f["diff_bytes"] < 0:
+        delta_bytes = f'{f["diff_bytes"]} bytes'
+    else:
+        delta_bytes = 'NO SIZE CHANGE'
+    return f'({str(datetime.timedelta(seconds=f["diff_secs"]))}, {delta_bytes})'
+
+
+def plain_repr(f):
+    return f'({f["size"]} bytes, modtime: {int(f["modtime"])})'
+
+
+# parent directory of a canonical dirname, or None for the root ('')
+def parent_dir(dn):
+    if not dn:
+        return None
+    return dn.rpartition('/')[0]
+
+
+# finds files that were MOVED (or renamed) between two inventories, given
+# rows only_first (files only in first) and only_second (files only in
+# second). a file in first and one in second are assumed to be the same
+# file if they have the same size, modtime (unless ignore_modtimes), and
+# hash (if both inventories were hashed with the same algorithm). when
+# there are several candidates, prefer one with the same filename, and
+# skip files that are still ambiguous after that. with ignore_modtimes and
+# no hashes, the signature is just the size, which says nothing about
+# contents, so only files with the same name count as moved.
+#
+# indexes second's files ONCE by signature and then filename, and pops
+# matches off of that index, so it takes time linear in the number of
+# differing files (even when many of them share a signature, e.g., empty
+# files) rather than comparing all pairs.
+# returns (moves, remaining_only_first, remaining_only_second), where moves
+# is a sorted list of (row in first, row in second) pairs
+def detect_moves(first, second, only_first, only_second, ignore_modtimes=False):
+    use_hashes = (inventory_hash_algorithm(first.metadata) is not None and
+                  inventory_hash_algorithm(first.metadata) == inventory_hash_algorithm(second.metadata))
+    names_only = ignore_modtimes and not use_hashes
+
+    def signature(inv, i):
+        return (inv.sizes[i],
+                None if ignore_modtimes else inv.mtimes[i],
+                inv.hash_key(i) if use_hashes else None)
+
+    # key: signature, value: dict of filename -> deque of unmatched rows in
+    # second (names with no rows left get removed, so that a signature
+    # with a single unmatched row has a single name left)
+    second_by_sig = defaultdict(dict)
+    for j in only_second:
+        rows = second_by_sig[signature(second, j)].setdefault(second.names[second.name_ids[j]], deque())
+        rows.append(j)
+    # key: signature, value: number of its rows in second not matched yet
+    n_unmatched = Counter()
+    for sig, by_name in second_by_sig.items():
+        n_unmatched[sig] = sum(len(rows) for rows in by_name.values())
+
+    moves = []
+    moved_second = set()
+    remaining_only_first = []
+    for i in only_first:
+        sig = signature(first, i)
+        by_name = second_by_sig.get(sig)
+        if not by_name:
+            remaining_only_first.append(i)
+            continue
+        fn = first.names[first.name_ids[i]]
+        rows = by_name.get(fn)
+        if rows is None:
+            # (a single candidate with another name: unambiguous, unless
+            # the signature can't tell files apart)
+            if n_unmatched[sig] != 1 or names_only:
+                remaining_only_first.append(i)
+                continue
+            fn, rows = next(iter(by_name.items()))
+        match = rows.popleft()
+        if not rows:
+            del by_name[fn]
+        n_unmatched[sig] -= 1
+        moved_second.add(match)
+        moves.append((i, match))
+
+    remaining_only_second = [j for j in only_second if j not in moved_second]
+    return (moves, remaining_only_first, remaining_only_second)
+
+
+# rolls file-level moves from detect_moves up into directory-level moves:
+# directory D in first was moved to D2 in second if EVERY file in D's
+# subtree (that isn't ignored) moved to the same relative path under D2.
+#
+# each moved file votes for the pairs of directories it could have moved
+# along with, i.e., walking up both of its paths while their last
+# components match (plus the first pair where they don't, for renamed
+# directories), so this takes time linear in the number of moves times the
+# directory depth. returns (dir_moves, file_moves) where dir_moves is a
+# sorted list of (src dir, dst dir, n_files), keeping only the topmost of
+# nested directory moves, and file_moves are the moves NOT covered by them
+def rollup_dir_moves(first, second, moves, should_ignore):
+    # number of non-ignored files in each directory's subtree in first
+    subtree_counts = Counter()
+    for dn, names in first.by_path.items():
+        n = sum(1 for fn in names if not should_ignore((dn, fn)))
+        d = dn
+        while d is not None:
+            subtree_counts[d] += n
+            d = parent_dir(d)
+
+    votes = Counter()
+    for i, j in moves:
+        src_d, src_f = first.path(i)
+        dst_d, dst_f = second.path(j)
+        if src_f != dst_f:
+            continue # renamed files can't be part of a directory move
+        while src_d is not None and dst_d is not None and src_d != dst_d:
+            votes[(src_d, dst_d)] += 1
+            src_parent, _, src_name = src_d.rpartition('/')
+            dst_parent, _, dst_name = dst_d.rpartition('/')
+            if src_name != dst_name:
+                break
+            src_d = parent_dir(src_d)
+            dst_d = parent_dir(dst_d)
+
+    whole_dir_moves = {src: dst for (src, dst), n in votes.items() if n == subtree_counts[src]}
+
+    # keep only the topmost directory move in each chain of nested ones
+    def covered_by_parent(src, dst):
+        p_src = parent_dir(src)
+        p_dst = parent_dir(dst)
+        return (p_src is not None and p_dst is not None and
+                src.rpartition('/')[2] == dst.rpartition('/')[2] and
+                whole_dir_moves.get(p_src) == p_dst)
+
+    dir_moves = sorted((src, dst, subtree_counts[src]) for src, dst in whole_dir_moves.items()
+                       if not covered_by_parent(src, dst))
+
+    # a file move is covered if some ancestor of its source was moved
+    def is_covered(i):
+        d = first.path(i)[0]
+        while d is not None:
+            if d in whole_dir_moves:
                 return True
-        if e[1] in ignore_filenames:
-            return True
-
-        ext = os.path.splitext(e[1])[1].lower() # extension - LOWERCASE IT for simplicity
-        if ext in ignore_exts:
-            return True
-
-        # simultaneously match both a directory (e[0]) and an extension
-        if (e[0], ext) in ignore_direxts:
-            return True
-
+            d = parent_dir(d)
         return False
 
+    file_moves = [(i, j) for i, j in moves if not is_covered(i)]
+    return (dir_moves, file_moves)
 
-    print(f'ignore_dirs: {ignore_dirs}\nignore_filenames: {ignore_filenames}\nignore_exts: {ignore_exts}\nignore_direxts: {ignore_direxts}\nsummary_threshold: {summary_threshold}')
-    print('---')
-    print('First: ', first['metadata'])
-    print('Second:', second['metadata'])
-    print('---')
-
-    first_rbp = first['records_by_path']
-    second_rbp = second['records_by_path']
-
-    first_rbp_keys = set(first_rbp.keys())
-    second_rbp_keys = set(second_rbp.keys())
-
-    in_first_but_not_second = first_rbp_keys.difference(second_rbp_keys)
-    in_second_but_not_first = second_rbp_keys.difference(first_rbp_keys)
-    in_both = first_rbp_keys.intersection(second_rbp_keys)
 
+# compare inventories produced by parse_inventory_file
+# you can pass in optional paths to ignore
+#
+# report_format is one of dirtree_report.REPORT_FORMATS: the text report
+# below, or json/csv for other programs to read
+def compare_inventories(first, second, summary_threshold,
+                        ignore_modtimes=False,
+                        ignore_dirs=[],
+                        ignore_filenames=[],
+                        ignore_exts=[],
+                        ignore_direxts=[],
+                        ignore_globs=[],
+                        ignore_rules_file=None,
+                        find_moves=True,
+                        report_format='text'):
+    should_ignore, ignore_dirs, ignore_filenames, ignore_exts, ignore_direxts = \
+        make_ignore_filter(ignore_dirs, ignore_filenames, ignore_exts, ignore_direxts,
+                           ignore_globs, ignore_rules_file)
+
+    report = make_report(report_format, summary_threshold)
+    report.note(f'ignore_dirs: {ignore_dirs}\nignore_filenames: {ignore_filenames}\nignore_exts: {ignore_exts}\nignore_direxts: {ignore_direxts}\nignore_globs: {should_ignore.globs}\nsummary_threshold: {summary_threshold}')
+    report.note('---')
+    report.note(f'First:  {printable_metadata(first.metadata)}')
+    report.note(f'Second: {printable_metadata(second.metadata)}')
+    report.note('---')
+    report.metadata(first=printable_metadata(first.metadata), second=printable_metadata(second.metadata),
+                    ignore_globs=should_ignore.globs)
+
+    first_rbp = first.by_path
+    second_rbp = second.by_path
+
+    # each entry is ((dirname, filename), row in first, row in second)
+    in_first_but_not_second = []
+    in_second_but_not_first = []
+    in_both = []
+    for dn, first_names in first_rbp.items():
+        second_names = second_rbp.get(dn, {})
+        for fn, i in first_names.items():
+            j = second_names.get(fn)
+            if j is None:
+                in_first_but_not_second.append(((dn, fn), i, None))
+            else:
+                in_both.append(((dn, fn), i, j))
+    for dn, second_names in second_rbp.items():
+        first_names = first_rbp.get(dn, {})
+        for fn, j in second_names.items():
+            if fn not in first_names:
+                in_second_but_not_first.append(((dn, fn), None, j))
+
+    # entries for dirtree_report.build_dirtree: (dirname, filename, bytes,
+    # data), where bytes is the size change, so that directory totals are
+    # how much each one grew or shrank
     changed_files = []
     # for files in both first and second, compare their metadata
-    for e in in_both:
-        first_data = first_rbp[e]
-        second_data = second_rbp[e]
+    for e, i, j in sorted(in_both):
+        first_data = first[i]
+        second_data = second[j]
 
         if should_ignore(e):
             continue
 
-        modtimes_differ = False
-        modtimes_diff_secs = 0
-        sizes_differ = False
-        sizes_diff_bytes = 0
-
-        # use a heuristic for 'close enough' in terms of modtimes
-        # (within a minute)
-        if not ignore_modtimes:
-            modtimes_diff_secs = round(second_data['mt'] - first_data['mt'])
-            if abs(modtimes_diff_secs) > 60:
-                modtimes_differ = True
-
-        if first_data['sz'] != second_data['sz']:
-            sizes_differ = True
-            sizes_diff_bytes = second_data['sz'] - first_data['sz']
-
-        # only report a change if the SIZE differs
-        # (note that there may be false positives ... use a has to be
-        # really sure!!!)
-        #if modtimes_differ or sizes_differ:
-        if sizes_differ:
+        changed, modtimes_diff_secs, sizes_diff_bytes = diff_file_records(first_data, second_data, ignore_modtimes)
+        if changed:
             assert len(e) == 2
-            changed_files.append(dict(dirs=e[0].split('/'), fn=e[1], diff_secs=modtimes_diff_secs, diff_bytes=sizes_diff_bytes))
-
-    changed_tree = create_dirtree(changed_files)
-    print('files changed ...')
-    #print(json.dumps(changed_tree))
-
-    def changed_repr(f):
-        delta_bytes = None
-        if f["diff_bytes"] > 0:
-            delta_bytes = f'+{f["diff_bytes"]} bytes'
-        elif f["diff_bytes"] < 0:
-            delta_bytes = f'{f["diff_bytes"]} bytes'
-        else:
-            delta_bytes = 'NO SIZE CHANGE'
-        return f'({str(datetime.timedelta(seconds=f["diff_secs"]))}, {delta_bytes})'
+            changed_files.append((e[0], e[1], sizes_diff_bytes, dict(diff_secs=modtimes_diff_secs, diff_bytes=sizes_diff_bytes)))
 
-    pretty_print_dirtree(changed_tree, summary_threshold, changed_repr)
+    report.note('files changed ...')
+    report.tree('changed', build_dirtree(changed_files), changed_repr)
 
+    only_first = [i for e, i, j in sorted(in_first_but_not_second) if not should_ignore(e)]
+    only_second = [j for e, i, j in sorted(in_second_but_not_first) if not should_ignore(e)]
 
-    def plain_repr(f):
-        return f'({f["size"]} bytes, modtime: {int(f["modtime"])})'
+    if find_moves:
+        moves, only_first, only_second = detect_moves(first, second, only_first, only_second, ignore_modtimes)
+        dir_moves, file_moves = rollup_dir_moves(first, second, moves, should_ignore)
 
-    first_rbs = first['records_by_filesize']
-    second_rbs = second['records_by_filesize']
+        report.note('\ndirectories moved ...')
+        for src, dst, n_files in dir_moves:
+            report.row('dirs_moved', f'/{src} -> /{dst}    ({n_files} files)', dirname=src,
+                       detail=f'-> /{dst}    ({n_files} files)', src=src, dst=dst, n_files=n_files)
 
-    print('\nonly in first ...')
+        report.note('\nfiles moved ...')
+        moved_files = []
+        for i, j in file_moves:
+            dn, fn = first.path(i)
+            moved_files.append((dn, fn, first.sizes[i], dict(dst=os.path.join(*second.path(j)))))
+        report.tree('files_moved', build_dirtree(moved_files), lambda f: f'-> /{f["dst"]}')
+
+    report.note('\nonly in first ...')
     only_first_files = []
-    for e in sorted(in_first_but_not_second):
-        if not should_ignore(e):
-            assert len(e) == 2
-            only_first_files.append(dict(dirs=e[0].split('/'), fn=e[1], size=first_rbp[e]['sz'], modtime=first_rbp[e]['mt']))
-    only_first_tree = create_dirtree(only_first_files)
-    pretty_print_dirtree(only_first_tree, summary_threshold, plain_repr)
+    for i in only_first:
+        dn, fn = first.path(i)
+        sz = first.sizes[i]
+        only_first_files.append((dn, fn, sz, dict(size=sz, modtime=first.mtimes[i])))
+    report.tree('only_first', build_dirtree(only_first_files), plain_repr)
 
-    print('\nonly in second ...')
+    report.note('\nonly in second ...')
     only_second_files = []
-    for e in sorted(in_second_but_not_first):
-        if not should_ignore(e):
-            assert len(e) == 2
-            only_second_files.append(dict(dirs=e[0].split('/'), fn=e[1], size=second_rbp[e]['sz'], modtime=second_rbp[e]['mt']))
-    only_second_tree = create_dirtree(only_second_files)
-    pretty_print_dirtree(only_second_tree, summary_threshold, plain_repr)
+    for j in only_second:
+        dn, fn = second.path(j)
+        sz = second.sizes[j]
+        only_second_files.append((dn, fn, sz, dict(size=sz, modtime=second.mtimes[j])))
+    report.tree('only_second', build_dirtree(only_second_files), plain_repr)
+    report.close()
+
+
+# compare two inventory FILES that are both sorted in path order (see
+# path_sort_key) in a single streaming pass, using constant memory no matter
+# how large they are. unlike compare_inventories, this can't group results
+# into directory trees, so it prints one line per difference as soon as it
+# finds it
+def stream_compare_inventories(first_filename, second_filename,
+                               ignore_modtimes=False,
+                               ignore_dirs=[],
+                               ignore_filenames=[],
+                               ignore_exts=[],
+                               ignore_direxts=[],
+                               ignore_globs=[],
+                               ignore_rules_file=None):
+    should_ignore, ignore_dirs, ignore_filenames, ignore_exts, ignore_direxts = \
+        make_ignore_filter(ignore_dirs, ignore_filenames, ignore_exts, ignore_direxts,
+                           ignore_globs, ignore_rules_file)
+
+    first_records = iter_inventory_records(first_filename)
+    second_records = iter_inventory_records(second_filename)
+
+    print(f'ignore_dirs: {ignore_dirs}\nignore_filenames: {ignore_filenames}\nignore_exts: {ignore_exts}\nignore_direxts: {ignore_direxts}\nignore_globs: {should_ignore.globs}')
+    print('---')
+    print('First: ', next(first_records))
+    print('Second:', next(second_records))
+    print('---')
+
+    n_changed = n_only_first = n_only_second = 0
+    for key, first_data, second_data in merge_join(iter_sorted_records(first_filename, first_records),
+                                                   iter_sorted_records(second_filename, second_records)):
+        r = first_data or second_data
+        e = (r['d'], r['f'])
+        if should_ignore(e):
+            continue
+        path = os.path.join(*e)
+        if first_data is None:
+            n_only_second += 1
+            print(f'only in second: {path}    {plain_repr(dict(size=second_data["sz"], modtime=second_data["mt"]))}')
+        elif second_data is None:
+            n_only_first += 1
+            print(f'only in first: {path}    {plain_repr(dict(size=first_data["sz"], modtime=first_data["mt"]))}')
+        else:
+            changed, diff_secs, diff_bytes = diff_file_records(first_data, second_data, ignore_modtimes)
+            if changed:
+                n_changed += 1
+                print(f'changed: {path}    {changed_repr(dict(diff_secs=diff_secs, diff_bytes=diff_bytes))}')
+
+    print('---')
+    print(f'{n_changed} changed, {n_only_first} only in first, {n_only_second} only in second')
 
 
 if __name__ == '__main__':
@@ -295,13 +540,46 @@ if __name__ == '__main__':
     parser.add_argument("--ignore_files", nargs='+', help="ignore the following filenames: <list>")
     parser.add_argument("--ignore_exts", nargs='+', help="ignore the following file extensions: <list>")
     parser.add_argument("--ignore_direxts", nargs='+', help="ignore the following file extensions within directories: <list> of entries, each being 'dirname,extension'")
+    parser.add_argument("--ignore", nargs='+', dest="ignore_globs",
+                        help="ignore paths matching the following gitignore-style globs: <list>")
+    parser.add_argument("--ignore_rules", help="read more ignore rules from this file (see ignore_rules.py for its format)")
     parser.add_argument("--summary_threshold", action='store', help="summarize a directory when it has more than N files")
+    parser.add_argument("--stream", action="store_true",
+                        help="compare in one streaming pass with constant memory; both files must be sorted in path order (create_inventory.py --sorted or sort_inventory.py)")
+    parser.add_argument("--no_move_detection", action="store_true",
+                        help="don't try to detect moved files and directories")
+    parser.add_argument("--report_format", choices=REPORT_FORMATS, default='text',
+                        help="print the differences as an indented text tree (default), one json object per directory, or csv rows (see dirtree_report.py)")
+    parser.add_argument("--stats", action="store_true",
+                        help="print how long parsing and comparing took to stderr at the end")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="run under cProfile and tracemalloc, save the profile to FILE, and print the top functions and allocations to stderr (SLOW!)")
 
     args = parser.parse_args()
-    first = parse_inventory_file(args.first_file)
-    second = parse_inventory_file(args.second_file)
-    compare_inventories(first, second,
-                        int(args.summary_threshold) if args.summary_threshold else DEFAULT_SUMMARY_THRESHOLD, # argh!!!
-                        args.ignore_modtimes,
-                        args.ignore_dirs, args.ignore_files,
-                        args.ignore_exts, args.ignore_direxts)
+    assert not (args.stream and args.report_format != 'text'), '--stream only prints text reports'
+    stats = RunStats()
+    with profiled(args.profile):
+        if args.stream:
+            with stats.phase('stream_compare'):
+                stream_compare_inventories(args.first_file, args.second_file,
+                                           args.ignore_modtimes,
+                                           args.ignore_dirs, args.ignore_files,
+                                           args.ignore_exts, args.ignore_direxts,
+                                           args.ignore_globs, args.ignore_rules)
+        else:
+            with stats.phase('parse'):
+                first = parse_inventory_file(args.first_file)
+                second = parse_inventory_file(args.second_file)
+            stats.add(files=len(first) + len(second))
+            with stats.phase('compare'):
+                compare_inventories(first, second,
+                                    int(args.summary_threshold) if args.summary_threshold else DEFAULT_SUMMARY_THRESHOLD, # argh!!!
+                                    args.ignore_modtimes,
+                                    args.ignore_dirs, args.ignore_files,
+                                    args.ignore_exts, args.ignore_direxts,
+                                    args.ignore_globs, args.ignore_rules,
+                                    find_moves=not args.no_move_detection,
+                                    report_format=args.report_format)
+    if args.stats:
+        stats.finish()
+        stats.print_report()
@@ -1,15 +1,25 @@
 # created: 2019-02-10
 # see 'parser' for expected command-line arguments
 
-# goal: be FAST!!!
+# goal: be FAST!!! -- e.g., to check that a backup of 10M files really
+# contains everything:
+#
+# 1. index the haystack ONCE in a set, by (size, hash) if both inventories
+#    were hashed the same way, else by (basename, size)
+# 2. look up every needle file in that set, in one pass over the needle's
+#    columns (no per-file dicts)
+# 3. roll up the results per directory, so that whole subtrees that are
+#    fully contained or entirely missing show up as a single line
 
-# include slashes in dirnames to prevent spurious substring matches
-IGNORE_DIRS = ['directory-tree-inventory/inventory-files_do-not-add-to-git',
-               '/.git',
-               '/node_modules',
-               '/.dropbox.cache']
+''' checks whether every file in the 'needle' inventory exists somewhere in
+the 'haystack' inventory, no matter where (e.g., after reorganizing), and
+reports which needle directories are fully contained, partially contained,
+or entirely missing:
 
-IGNORE_FILENAMES = ['Thumbs.db', 'thumbs.db', '.DS_Store', 'Icon\r'] # 'Icon\r' doesn't print properly anyhow, #weird
+python3 containment_test.py laptop.jsonl backup.jsonl
+
+with --list_missing, just print each missing needle file instead
+'''
 
 DEFAULT_SUMMARY_THRESHOLD = 10
 
@@ -21,50 +31,240 @@ import sys
 import time
 import datetime
 from collections import Counter, defaultdict
-from compare_inventories import parse_inventory_file, pretty_print_dirtree
-
-# requires python >= 3.5 to get os.walk to use the MUCH faster os.scandir function
-assert float(sys.version[:3]) >= 3.5
-
-def find_needle_in_haystack(needle, haystack):
-    needle_rbp = needle['records_by_path']
-    haystack_rbp = haystack['records_by_path']
-
-    needle_rbcrc = needle['records_by_crc32']
-    haystack_rbcrc = haystack['records_by_crc32']
-
-    # starting in March 2019, use crc32 checksums to do a more accurate search
-    for k, v in needle_rbcrc.items(): # in py3, items() is an iterator
-        if k not in haystack_rbcrc: # can't find this needle's hash in haystack
-            for e in v:
-                if e['f'] not in IGNORE_FILENAMES:
-                    print(e)
-
-    # old path-based algorithm as of Feb 2019
-    '''
-    haystack_file_basenames_to_entries = defaultdict(list)
-    for k in haystack_rbp:
-        haystack_file_basenames_to_entries[k[-1]].append(haystack_rbp[k])
-
-    for k in needle_rbp:
-        needle_entry = needle_rbp[k]
-        bn = k[-1]
-        try:
-            haystack_entries = haystack_file_basenames_to_entries[bn]
-            if not haystack_entries:
-                print(os.path.join(*k), 'NOT in haystack')
+from itertools import repeat
+from compare_inventories import parse_inventory_file, inventory_hash_algorithm, parent_dir, plain_repr
+from binary_inventory import NO_CRC32
+from dirtree_report import build_dirtree, TextReport
+from ignore_rules import make_ignore_rules
+
+# requires python >= 3.6 for f-strings
+# (NB: compare version_info, since sys.version[:3] is '3.1' on python 3.10+)
+assert sys.version_info >= (3, 6)
+
+# per-file results of a containment test
+MISSING = 0
+CONTAINED = 1
+IGNORED = 2
+
+
+# yields the hash of each row of inventory inv (an inventory.Inventory) as
+# hashed by algorithm, or None for rows without one: raw digest bytes for
+# full-content hashes, ints for crc32-prefix
+def iter_hashes(inv, algorithm):
+    if algorithm == 'crc32-prefix':
+        if not inv.crc32s:
+            yield from repeat(None, len(inv))
+        for v in inv.crc32s:
+            yield None if v == NO_CRC32 else v
+    else:
+        hb = inv.hash_bytes
+        w = inv.hash_width
+        for i in range(len(inv)):
+            yield hb[i*w:(i+1)*w]
+
+
+# set of all files in a haystack inventory, looked up by (size, hash) if
+# hash_algorithm is given, and by (basename, size) for everything else (a
+# much weaker test: the same name and size, but possibly different contents)
+class HaystackIndex:
+    def __init__(self, haystack, hash_algorithm=None):
+        self.haystack = haystack
+        self.hash_algorithm = hash_algorithm
+        self.by_size_hash = set()
+        self._by_name_size = None
+        if hash_algorithm:
+            for sz, h in zip(haystack.sizes, iter_hashes(haystack, hash_algorithm)):
+                if h is not None:
+                    self.by_size_hash.add((sz, h))
+
+    # (only built if some needle files can't be looked up by hash, since
+    # it takes as much memory again)
+    @property
+    def by_name_size(self):
+        if self._by_name_size is None:
+            names = self.haystack.names
+            self._by_name_size = set((names[ni], sz) for ni, sz in zip(self.haystack.name_ids, self.haystack.sizes))
+        return self._by_name_size
+
+    def contains(self, name, size, h=None):
+        if h is not None:
+            return (size, h) in self.by_size_hash
+        return (name, size) in self.by_name_size
+
+
+# per-directory rollup of a containment test: numbers of files and bytes
+# in a directory and everything under it, and how many of those are in the
+# haystack
+class DirRollup:
+    __slots__ = ('n_files', 'n_contained', 'n_bytes', 'n_contained_bytes')
+
+    def __init__(self):
+        self.n_files = 0
+        self.n_contained = 0
+        self.n_bytes = 0
+        self.n_contained_bytes = 0
+
+    @property
+    def status(self):
+        if self.n_contained == self.n_files:
+            return 'contained'
+        return 'missing' if self.n_contained == 0 else 'partial'
+
+
+# the results of checking every file of needle against a haystack
+class Containment:
+    def __init__(self, needle, status, by_hash):
+        self.needle = needle
+        # MISSING, CONTAINED, or IGNORED for each row of needle
+        self.status = status
+        # True if files were matched by (size, hash), not (basename, size)
+        self.by_hash = by_hash
+
+    def missing_rows(self):
+        return [i for i, s in enumerate(self.status) if s == MISSING]
+
+    # returns a dict of canonical dirname -> DirRollup for every needle
+    # directory (and all of its ancestors) with at least one non-ignored
+    # file under it
+    def rollup_dirs(self):
+        needle = self.needle
+        # first the files directly in each directory ...
+        per_dir_id = [None] * len(needle.dirs)
+        for di, sz, s in zip(needle.dir_ids, needle.sizes, self.status):
+            if s == IGNORED:
+                continue
+            r = per_dir_id[di]
+            if r is None:
+                r = per_dir_id[di] = DirRollup()
+            r.n_files += 1
+            r.n_bytes += sz
+            if s == CONTAINED:
+                r.n_contained += 1
+                r.n_contained_bytes += sz
+
+        # ... then add those to every ancestor too
+        ret = defaultdict(DirRollup)
+        for dn, r in zip(needle.dirs, per_dir_id):
+            if r is None:
+                continue
+            d = dn
+            while d is not None:
+                total = ret[d]
+                total.n_files += r.n_files
+                total.n_contained += r.n_contained
+                total.n_bytes += r.n_bytes
+                total.n_contained_bytes += r.n_contained_bytes
+                d = parent_dir(d)
+        return dict(ret)
+
+
+# checks every file of needle against haystack (both inventory.Inventory
+# objects) and returns a Containment. if both were hashed with the same
+# algorithm, a needle file counts as contained if some haystack file has
+# the same size and hash; otherwise (or for files without a hash), if some
+# haystack file has the same basename and size
+#
+# ignore_rules is an ignore_rules.IgnoreRules (default: the same default
+# rules as compare_inventories.py); ignored needle files don't count
+def check_containment(needle, haystack, ignore_rules=None):
+    if ignore_rules is None:
+        ignore_rules = make_ignore_rules()
+
+    # hashes from different algorithms can never match each other
+    needle_hash = inventory_hash_algorithm(needle.metadata)
+    haystack_hash = inventory_hash_algorithm(haystack.metadata)
+    hash_algorithm = needle_hash if needle_hash == haystack_hash else None
+    if needle_hash != haystack_hash:
+        print(f'WARNING: needle hashed with {needle_hash} but haystack with {haystack_hash}, so only matching files by basename and size',
+              file=sys.stderr)
+
+    index = HaystackIndex(haystack, hash_algorithm)
+    dirs = needle.dirs
+    names = needle.names
+    hashes = iter_hashes(needle, hash_algorithm) if hash_algorithm else repeat(None)
+    by_size_hash = index.by_size_hash
+    ignore_file = ignore_rules.ignore_file
+    status = bytearray(len(needle))
+    for i, (di, ni, sz, h) in enumerate(zip(needle.dir_ids, needle.name_ids, needle.sizes, hashes)):
+        fn = names[ni]
+        if ignore_file(dirs[di], fn):
+            status[i] = IGNORED
+        # (the common case of HaystackIndex.contains, inlined)
+        elif (sz, h) in by_size_hash if h is not None else index.contains(fn, sz):
+            status[i] = CONTAINED
+    return Containment(needle, status, hash_algorithm is not None)
+
+
+# prints the needle directories of containment c as a tree: a subtree
+# that's fully contained or entirely missing gets one summary line, and
+# partially contained directories get expanded to show which of their
+# subdirectories and files are missing
+def print_containment_tree(c, summary_threshold=DEFAULT_SUMMARY_THRESHOLD):
+    needle = c.needle
+    rollups = c.rollup_dirs()
+    children = defaultdict(list)
+    for dn in rollups:
+        parent = parent_dir(dn)
+        if parent is not None:
+            children[parent].append(dn)
+    missing_files = defaultdict(list)
+    for i in c.missing_rows():
+        missing_files[needle.dirs[needle.dir_ids[i]]].append(i)
+
+    # entries for build_dirtree: missing files, and summaries of the
+    # fully contained and missing subtrees within partial directories
+    entries = []
+    stack = ['']
+    while stack:
+        dn = stack.pop()
+        for i in missing_files.get(dn, ()):
+            sz = needle.sizes[i]
+            entries.append((dn, needle.names[needle.name_ids[i]], sz, dict(size=sz, modtime=needle.mtimes[i])))
+        for child in sorted(children.get(dn, ())):
+            r = rollups[child]
+            if r.status == 'partial':
+                stack.append(child)
             else:
-                sz = needle_entry['sz']
-                match_found = False
-                for e in haystack_entries:
-                    if e['sz'] == sz:
-                        match_found = True
-                        break
-                if not match_found:
-                    print(os.path.join(*k), 'in haystack but DIFFERENT SIZE')
-        except KeyError:
-            print(os.path.join(*k), 'NOT in haystack')
-    '''
+                entries.append((dn, child.rpartition('/')[2] + '/', r.n_bytes - r.n_contained_bytes, dict(rollup=r)))
+
+    def entry_repr(e):
+        if 'rollup' not in e:
+            return f'MISSING {plain_repr(e)}'
+        r = e['rollup']
+        if r.status == 'missing':
+            return f'[MISSING: {r.n_files} files, {r.n_bytes} bytes]'
+        return f'[contained: {r.n_files} files]'
+
+    report = TextReport(summary_threshold)
+    report.tree('missing', build_dirtree(entries), entry_repr)
+    report.close()
+
+
+# prints which files of needle aren't anywhere in haystack (see
+# check_containment), rolled up by directory, and returns the Containment.
+# with list_missing=True, print every missing needle record instead
+def find_needle_in_haystack(needle, haystack, ignore_rules=None,
+                            summary_threshold=DEFAULT_SUMMARY_THRESHOLD, list_missing=False):
+    c = check_containment(needle, haystack, ignore_rules)
+    if list_missing:
+        for i in c.missing_rows():
+            print(needle[i])
+        return c
+
+    rollups = c.rollup_dirs()
+    root = rollups.get('')
+    print(f'matched by: {"size and hash" if c.by_hash else "basename and size (NOT contents!)"}')
+    if root is None:
+        print('no needle files to look for')
+        return c
+    print(f'{root.n_contained} of {root.n_files} needle files ({root.n_contained_bytes} of {root.n_bytes} bytes) are in the haystack')
+    n_dirs = Counter(r.status for r in rollups.values())
+    print(f'directories: {n_dirs["contained"]} fully contained, {n_dirs["partial"]} partially contained, {n_dirs["missing"]} missing')
+    if root.status != 'contained':
+        print('---')
+        print_containment_tree(c, summary_threshold)
+    return c
+
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
@@ -72,8 +272,16 @@ if __name__ == '__main__':
     # mandatory positional arguments:
     parser.add_argument("needle_file", help="inventory file to use as the 'needles' to find in haystack")
     parser.add_argument("haystack_file", help="inventory file to use as haystack")
+    parser.add_argument("--ignore", nargs='+', dest="ignore_globs",
+                        help="also ignore needles matching the following gitignore-style globs: <list>")
+    parser.add_argument("--ignore_rules", help="read more ignore rules from this file (see ignore_rules.py for its format)")
+    parser.add_argument("--summary_threshold", type=int, default=DEFAULT_SUMMARY_THRESHOLD,
+                        help="summarize a directory when it has more than N missing files and subdirectories")
+    parser.add_argument("--list_missing", action="store_true",
+                        help="just print every missing needle file, one per line")
 
     args = parser.parse_args()
     needle = parse_inventory_file(args.needle_file)
     haystack = parse_inventory_file(args.haystack_file)
-    find_needle_in_haystack(needle, haystack)
+    ignore_rules = make_ignore_rules(globs=args.ignore_globs, rules_file=args.ignore_rules)
+    find_needle_in_haystack(needle, haystack, ignore_rules, args.summary_threshold, args.list_missing)
@@ -4,97 +4,555 @@
 # goal: be FAST!!!
 
 '''
-TODOs
-
+DONE:
+- add a 'slow mode' that takes the md5 (or other) hash of each file's
+  contents, for more accurate diffing at the expense of being slower
+  - to make this not as slow, read in only the first N bytes and take a
+    super fast hash of it (crc32?)
+  -> see --checksum (crc32 of the first N bytes) and --hash (full contents)
 - allow for a comparison of a directory tree against an existing
   inventory file
 - allow for direct comparisons of two directory trees without writing to
   an inventory file
+  -> see direct_compare.py
 - compare today's inventory against the last archived entry, and if you
   'accept' the changes, then set today as the most recent archive. this
   way, you can run the script every day interactively as a routine check
 - store consecutive inventory files as diffs to save space (optimization)
-
-- add a 'slow mode' that takes the md5 (or other) hash of each file's
-  contents, for more accurate diffing at the expense of being slower
-  - to make this not as slow, read in only the first N bytes and take a
-    super fast hash of it (crc32?)
+  -> see inventory_archive.py (review, and base snapshots + deltas)
 '''
 
 import argparse
-import binascii
 import json
 import os
+import queue
 import sys
+import threading
 import time
-from collections import Counter
+from collections import Counter, defaultdict
+from file_hashing import (HASH_ALGORITHMS, N_BYTES_FOR_CHECKSUM, DEFAULT_HASH_CHUNK_BYTES,
+                          DEFAULT_HASH_THREADS, hash_records)
+from hash_cache import HashCache
+from ignore_rules import make_ignore_rules
+from instrumentation import RunStats, ProgressReporter, profiled, DEFAULT_PROGRESS_INTERVAL
+from io_engine import IOEngine
+from inventory_io import RecordWriter, COMPRESSIONS, STATS_LINE_PREFIX, detect_compression, is_manifest
 
-# requires python >= 3.5 to get os.walk to use the MUCH faster os.scandir function
-assert float(sys.version[:3]) >= 3.5
+# requires python >= 3.6 for os.scandir to work as a context manager
+# (NB: compare version_info, since sys.version[:3] is '3.1' on python 3.10+)
+assert sys.version_info >= (3, 6)
 
 # which directories NOT to recurse into
-# TODO: pass in a custom list as a command-line arg
+# (for anything fancier than exact names, see --ignore and --ignore_rules)
 # (.ptvs is python tools for visual studio)
 #DEFAULT_IGNORE_DIRS = ('.git', '.ptvs', 'node_modules')
 DEFAULT_IGNORE_DIRS = ()
 
-# don't read too few bytes, or else lots of files look identical due to
-# their file type headers being the same
-# (NB: it doesn't take much more time to read slightly more bytes,
-# since just opening each file takes a bunch of time)
-N_BYTES_FOR_CHECKSUM = 100
 
+# max number of directories waiting to be crawled (and of per-directory
+# results waiting to be written) when crawling with --workers
+DEFAULT_WORK_QUEUE_SIZE = 1024
+
+
+# lists a single directory exactly once with os.scandir and splits its
+# entries into (file_entries, subdir_names). directories named in
+# ignore_dirs are pruned here so that we never descend into them.
+# returns None if the directory can't be listed (os.walk silently skips
+# those too, so we do the same)
+def scan_directory(dirpath, ignore_dirs):
+    file_entries = []
+    subdir_names = []
+    try:
+        with os.scandir(dirpath) as it:
+            for entry in it:
+                # is_dir()/is_file() use the d_type from the directory listing
+                # when the filesystem provides it, so no extra stat() here
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                if is_dir:
+                    # like os.walk(followlinks=False), don't follow symlinks
+                    # to directories, and prune ignored names before descent
+                    if entry.name not in ignore_dirs and not entry.is_symlink():
+                        subdir_names.append(entry.name)
+                elif entry.is_file():
+                    file_entries.append(entry)
+    except OSError:
+        return None
+    return (file_entries, subdir_names)
+
+
+# returns the (dirpath, canonical_dirpath) pair of subdirectory name
+def child_dir(dirpath, canonical_dirpath, name):
+    if canonical_dirpath:
+        return (os.path.join(dirpath, name), canonical_dirpath + '/' + name)
+    else:
+        return (os.path.join(dirpath, name), name)
+
+
+# iterative replacement for os.walk(rootdir, topdown=True) that lists each
+# directory only ONCE and yields (dirpath, canonical_dirpath, file_entries)
+# tuples, where canonical_dirpath is relative to rootdir (no leading '/')
+# and file_entries are os.DirEntry objects (which cache their stat results)
+#
+# directories are visited in the same order as os.walk so that inventories
+# come out identical to the ones we used to produce
+#
+# list_dir(dirpath, canonical_dirpath) can optionally replace
+# scan_directory(); it returns (payload, subdir_names) or None, and payload
+# gets yielded in place of file_entries
+#
+# canonical_root is the canonical_dirpath of rootdir itself, for crawling
+# one part of a bigger tree (see sharded_crawl.py)
+def walk_tree(rootdir, ignore_dirs=DEFAULT_IGNORE_DIRS, list_dir=None, canonical_root=''):
+    if list_dir is None:
+        list_dir = lambda dirpath, canonical_dirpath: scan_directory(dirpath, ignore_dirs)
+
+    # explicit stack of (dirpath, canonical_dirpath) instead of recursion
+    stack = [(rootdir, canonical_root)]
+    while stack:
+        dirpath, canonical_dirpath = stack.pop()
+        listing = list_dir(dirpath, canonical_dirpath)
+        if listing is None:
+            continue
+        payload, subdir_names = listing
+        yield (dirpath, canonical_dirpath, payload)
+
+        # push in reverse so that subdirs get popped in listing order
+        for name in reversed(subdir_names):
+            stack.append(child_dir(dirpath, canonical_dirpath, name))
+
+
+# parallel version of walk_tree() for high-latency filesystems (NFS/SMB)
+# where each scandir/stat call spends most of its time waiting: n_workers
+# threads pull directories off a bounded work queue, list them, and run
+# process_dir(dirpath, canonical_dirpath, file_entries) on the results (so
+# per-file stat calls happen on the worker threads too). yields whatever
+# process_dir returns, one item per directory, in NO particular order
+#
+# list_dir and canonical_root work just like in walk_tree()
+def parallel_walk_tree(rootdir, ignore_dirs, n_workers, process_dir,
+                       queue_size=DEFAULT_WORK_QUEUE_SIZE, list_dir=None, canonical_root=''):
+    assert n_workers >= 1
+    if list_dir is None:
+        list_dir = lambda dirpath, canonical_dirpath: scan_directory(dirpath, ignore_dirs)
+    dir_queue = queue.Queue(maxsize=queue_size)
+    results = queue.Queue(maxsize=queue_size)
+    done_sentinel = object()
+
+    # number of directories that have been discovered but not yet processed;
+    # when it drops to zero, the whole tree has been crawled
+    pending_lock = threading.Lock()
+    pending = [1]
+
+    def worker():
+        # when the shared work queue is full, workers keep the overflow on
+        # their own local stack instead of blocking (which could deadlock
+        # if every worker were waiting on a full queue at once)
+        local_stack = []
+        while True:
+            if local_stack:
+                dirpath, canonical_dirpath = local_stack.pop()
+            else:
+                item = dir_queue.get()
+                if item is None: # no more work
+                    return
+                dirpath, canonical_dirpath = item
+
+            try:
+                listing = list_dir(dirpath, canonical_dirpath)
+                if listing is not None:
+                    payload, subdir_names = listing
+                    with pending_lock:
+                        pending[0] += len(subdir_names)
+                    for name in subdir_names:
+                        child = child_dir(dirpath, canonical_dirpath, name)
+                        try:
+                            dir_queue.put_nowait(child)
+                        except queue.Full:
+                            local_stack.append(child)
+                    results.put(process_dir(dirpath, canonical_dirpath, payload))
+            except Exception as e:
+                # hand the error to the consuming thread so it can re-raise
+                results.put(e)
+                return
+
+            with pending_lock:
+                pending[0] -= 1
+                finished = (pending[0] == 0)
+            if finished:
+                results.put(done_sentinel)
+
+    dir_queue.put((rootdir, canonical_root))
+    # daemon threads so that an error in the consumer never hangs the process
+    threads = [threading.Thread(target=worker, daemon=True) for i in range(n_workers)]
+    for t in threads:
+        t.start()
+
+    while True:
+        r = results.get()
+        if r is done_sentinel:
+            break
+        if isinstance(r, Exception):
+            raise r
+        yield r
+
+    # everything is done, so tell all the idle workers to exit
+    for t in threads:
+        dir_queue.put(None)
+    for t in threads:
+        t.join()
 
-# creates an inventory starting at rootdir and prints .jsonl result to stdout,
-# containing a line for each file's metadata (first line has overall metadata)
-def create_inventory(rootdir, label, take_checksum=False, ignore_dirs=DEFAULT_IGNORE_DIRS):
+
+STATS_LINE_PREFIX_BYTES = STATS_LINE_PREFIX.encode('ascii')
+
+
+# the directory structure of an earlier inventory made with record_dirs=True,
+# for create_inventory(incremental_from=...). that inventory has a
+# {"dir": canonical_dirpath, "mt": modtime} record right before the records
+# of the files in each directory, so we only remember where in the file each
+# directory's block of records lives and read it back on demand
+class PreviousInventory:
+    def __init__(self, filename):
+        # key: canonical_dirpath, value: (modtime, offset, length) of the
+        # bytes holding that directory's file records
+        self.dirs = {}
+        # key: canonical_dirpath, value: list of subdirectory names
+        self.children = defaultdict(list)
+        self.n_reused = 0
+        self.reused_lock = threading.Lock()
+
+        # (we read records back by byte offset, which needs a plain file)
+        assert detect_compression(filename) is None, f'{filename} is compressed; decompress it to use it with --incremental'
+        assert not is_manifest(filename), f'{filename} is a sharded inventory, which can\'t be used with --incremental'
+        self.f = open(filename, 'rb')
+        self.metadata = json.loads(self.f.readline())
+        offset = self.f.tell()
+        cur_dir = None
+        for line in self.f:
+            if line.startswith(STATS_LINE_PREFIX_BYTES):
+                break # (always the last line)
+            if line.startswith(b'{"dir": '):
+                record = json.loads(line)
+                cur_dir = record['dir']
+                assert cur_dir not in self.dirs
+                self.dirs[cur_dir] = (record['mt'], offset + len(line), 0)
+                if cur_dir:
+                    parent, _, name = cur_dir.rpartition('/')
+                    self.children[parent].append(name)
+            elif cur_dir is not None:
+                mt, start, length = self.dirs[cur_dir]
+                self.dirs[cur_dir] = (mt, start, length + len(line))
+            offset += len(line)
+
+    # if canonical_dirpath was in the previous inventory with the same
+    # modtime, returns (records, subdir_names) from back then; else None
+    def lookup(self, canonical_dirpath, modtime):
+        try:
+            mt, start, length = self.dirs[canonical_dirpath]
+        except KeyError:
+            return None
+        if mt != modtime:
+            return None
+        # pread is thread-safe, unlike seek+read, so workers can share self.f
+        data = os.pread(self.f.fileno(), length, start)
+        records = [json.loads(line) for line in data.splitlines()]
+        for r in records:
+            assert r['d'] == canonical_dirpath
+        with self.reused_lock:
+            self.n_reused += 1
+        return (records, self.children.get(canonical_dirpath, []))
+
+    def close(self):
+        self.f.close()
+
+
+# converts the os.DirEntry objects of files within one directory into
+# a list of (record, fullpath, stat_key) tuples, where each record is a dict
+# and stat_key is the signature that hash_cache.HashCache looks files up by
+def make_records(canonical_dirpath, file_entries):
+    records = []
+    for entry in file_entries:
+        s = entry.stat() # cached on the DirEntry after the first call
+        modtime = s.st_mtime # last modification timestamp
+        filesize = s.st_size # how large is this file?
+
+        base, ext = os.path.splitext(entry.name)
+        # use short key names to save space :0
+        data = dict(d=canonical_dirpath, f=entry.name,
+                    e=ext, mt=modtime, sz=filesize)
+        stat_key = (s.st_dev, s.st_ino, filesize, s.st_mtime_ns)
+        records.append((data, entry.path, stat_key))
+    return records
+
+
+# creates an inventory starting at rootdir and yields the overall metadata
+# dict followed by one dict per file, exactly like json.loads() of each line
+# of the equivalent .jsonl inventory file would (see create_inventory).
+# records get yielded as soon as they're ready, so other code (e.g.,
+# direct_compare.py) can consume a crawl without going through a file, and
+# stop early by closing the generator
+#
+# if n_workers > 1, crawl with that many threads; records then come out in
+# a different order than a serial crawl, but the SAME records once sorted
+#
+# hash_algorithm is one of file_hashing.HASH_ALGORITHMS (or None for no
+# hashing); take_checksum=True is shorthand for 'crc32-prefix'. files get
+# hashed on n_hash_threads threads while the crawl keeps going
+#
+# if hash_cache_file is given, reuse hashes from previous runs (kept in that
+# sqlite file) for files whose stat signature hasn't changed since
+#
+# if record_dirs is True, also write a {"dir": ..., "mt": ...} record with
+# the modtime of each directory before the records of its files. an
+# inventory like that can later be passed in as incremental_from, and then
+# any directory whose modtime hasn't changed since doesn't get listed again;
+# its records get copied over from the old inventory instead (implies
+# record_dirs). NB: a directory's modtime only changes when entries are
+# created, deleted, or renamed in it, so files modified IN PLACE inside an
+# otherwise unchanged directory keep their old records. the previous
+# inventory must be of the same rootdir (and canonical_root): a COPY of a
+# tree (cp -a, rsync) keeps the directory modtimes but not necessarily the
+# files, so reusing another tree's records would silently be wrong. if the
+# tree really is the same one, just moved or mounted elsewhere, pass
+# allow_other_root=True
+#
+# if sort_paths is True, visit files and subdirectories in sorted order of
+# their names, so the inventory comes out in path order (see
+# compare_inventories.path_sort_key) for compare_inventories.py --stream.
+# only works with a serial crawl (n_workers=1)
+#
+# ignore_rules is an optional ignore_rules.IgnoreRules; ignored files are
+# left out, and ignored directories are pruned before we descend into them
+#
+# if io_threads is given, keep up to max_in_flight stat() calls (and file
+# reads for hashing, which then also use those threads instead of
+# n_hash_threads) in flight at once on an io_engine.IOEngine with that many
+# threads, and report the achieved ops/sec to stderr at the end. that helps
+# on filesystems with high per-call latency (cloud mounts, FUSE, NFS/SMB).
+# with n_workers > 1, stat() calls already happen on the crawl threads, so
+# only the reads go through the engine
+#
+# if stats is an instrumentation.RunStats, count directories and files,
+# track the slowest directories, and time the 'walk' (listing directories),
+# 'stat' (stat-ing files), and hashing phases in it as the crawl goes
+#
+# if canonical_root is given, rootdir is that directory of a bigger tree,
+# and all canonical paths (and ignore_rules) are relative to that tree's
+# root instead of to rootdir (see sharded_crawl.py)
+def iter_inventory(rootdir, label, take_checksum=False, ignore_dirs=DEFAULT_IGNORE_DIRS,
+                   n_workers=1, hash_algorithm=None, n_hash_threads=DEFAULT_HASH_THREADS,
+                   hash_chunk_bytes=DEFAULT_HASH_CHUNK_BYTES, hash_cache_file=None,
+                   record_dirs=False, incremental_from=None, sort_paths=False,
+                   ignore_rules=None, io_threads=None, max_in_flight=None, stats=None,
+                   canonical_root='', allow_other_root=False):
     assert os.path.isdir(rootdir)
+    if take_checksum and not hash_algorithm:
+        hash_algorithm = 'crc32-prefix'
+    take_checksum = bool(hash_algorithm)
+    assert hash_algorithm or not hash_cache_file, 'a hash cache needs --checksum or --hash'
+    assert not (sort_paths and n_workers > 1), 'a parallel crawl can\'t produce sorted output'
+
+    previous = None
+    if incremental_from:
+        record_dirs = True
+        previous = PreviousInventory(incremental_from)
+        # reused records must be of the same tree ...
+        assert allow_other_root or previous.metadata['rootdir'] == os.path.abspath(rootdir), \
+            f'previous inventory is of {previous.metadata["rootdir"]}, not {os.path.abspath(rootdir)} (use --incremental_other_root if that\'s the same tree)'
+        assert previous.metadata.get('canonical_root', '') == canonical_root, 'previous inventory used a different canonical_root'
+        # ... and the same kind as freshly made ones
+        assert previous.metadata.get('hash') == hash_algorithm, 'previous inventory used a different hash algorithm'
+        assert previous.metadata['ignore_dirs'] == list(ignore_dirs), 'previous inventory used different ignore_dirs'
+        assert previous.metadata.get('ignore_rules', []) == (ignore_rules.as_rules_list() if ignore_rules else []), \
+            'previous inventory used different ignore_rules'
+        if not previous.dirs:
+            print(f'WARNING: {incremental_from} has no directory records, so nothing can be reused', file=sys.stderr)
 
     # first line metadata
     metadata = dict(ts=time.time(), ignore_dirs=ignore_dirs,
                     take_checksum=take_checksum, checksum_bytes=N_BYTES_FOR_CHECKSUM,
                     label=label, rootdir=os.path.abspath(rootdir))
-    print(json.dumps(metadata))
+    if hash_algorithm:
+        metadata['hash'] = hash_algorithm
+        metadata['hash_chunk_bytes'] = hash_chunk_bytes
+    if record_dirs:
+        metadata['record_dirs'] = True
+    if sort_paths:
+        metadata['sorted'] = True
+    if ignore_rules:
+        metadata['ignore_rules'] = ignore_rules.as_rules_list()
+    if canonical_root:
+        metadata['canonical_root'] = canonical_root
+    yield metadata
 
-    for dirpath, dirnames, filenames in os.walk(rootdir, topdown=True):
-        # canonicalize dirpath relative to rootdir
-        assert dirpath.startswith(rootdir)
-        canonical_dirpath = dirpath[len(rootdir):]
-        if canonical_dirpath and canonical_dirpath[0] == '/':
-            canonical_dirpath = canonical_dirpath[1:]
-            assert canonical_dirpath[0] != '/'
-
-        with os.scandir(dirpath) as it:
-            for entry in it:
-                if entry.is_file():
-                    s = entry.stat()
-                    modtime = s.st_mtime # last modification timestamp
-                    filesize = s.st_size # how large is this file?
-
-                    base, ext = os.path.splitext(entry.name)
-                    # use short key names to save space :0
-                    data = dict(d=canonical_dirpath, f=entry.name,
-                                e=ext, mt=modtime, sz=filesize)
-
-                    # do a crude approximation by reading only the first N bytes
-                    if take_checksum:
-                        fullpath = os.path.join(dirpath, entry.name)
-                        with open(fullpath, 'rb') as f:
-                            first_N_bytes = f.read(N_BYTES_FOR_CHECKSUM)
-                            data['crc32'] = binascii.crc32(first_N_bytes)
-
-                    print(json.dumps(data))
-
-        # from https://docs.python.org/3/library/os.html#os.walk
-        # When topdown is True, the caller can modify the dirnames list
-        # in-place (perhaps using del or slice assignment), and walk() will
-        # only recurse into the subdirectories whose names remain in dirnames;
-        # this can be used to prune the search
-        for d in ignore_dirs:
+    # returns ((dir_modtime, file_entries, reused_records), subdir_names)
+    def list_dir(dirpath, canonical_dirpath):
+        dir_modtime = None
+        if record_dirs:
+            # stat BEFORE listing, so that if the directory changes while
+            # we list it, the next incremental run sees a newer modtime
             try:
-                dirnames.remove(d)
-            except ValueError:
-                pass
+                dir_modtime = os.stat(dirpath).st_mtime
+            except OSError:
+                return None
+            if previous is not None:
+                reused = previous.lookup(canonical_dirpath, dir_modtime)
+                if reused is not None:
+                    reused_records, subdir_names = reused
+                    subdir_names = [e for e in subdir_names if e not in ignore_dirs]
+                    if ignore_rules:
+                        subdir_names = [e for e in subdir_names
+                                        if not ignore_rules.ignore_subdir(canonical_dirpath, e)]
+                    if sort_paths:
+                        reused_records.sort(key=lambda r: r['f'])
+                        subdir_names.sort()
+                    return ((dir_modtime, None, reused_records), subdir_names)
+
+        listing = scan_directory(dirpath, ignore_dirs)
+        if listing is None:
+            return None
+        file_entries, subdir_names = listing
+        if ignore_rules:
+            subdir_names = [e for e in subdir_names
+                            if not ignore_rules.ignore_subdir(canonical_dirpath, e)]
+            file_entries = [e for e in file_entries
+                            if not ignore_rules.ignore_file(canonical_dirpath, e.name)]
+        if sort_paths:
+            file_entries.sort(key=lambda e: e.name)
+            subdir_names.sort()
+        return ((dir_modtime, file_entries, None), subdir_names)
+
+    if stats is not None:
+        untimed_list_dir = list_dir
+
+        # (adds how long listing took to the end of the payload)
+        def list_dir(dirpath, canonical_dirpath):
+            t = time.perf_counter()
+            listing = untimed_list_dir(dirpath, canonical_dirpath)
+            secs = time.perf_counter() - t
+            stats.add_secs('walk', secs)
+            if listing is None:
+                return None
+            payload, subdir_names = listing
+            return (payload + (secs,), subdir_names)
+
+    def process_dir(dirpath, canonical_dirpath, payload):
+        t = time.perf_counter()
+        dir_modtime, file_entries, reused_records = payload[:3]
+        batch = []
+        # fullpath=None means 'don't hash', since there's nothing to hash
+        # for directories and reused records already have their hashes
+        if record_dirs:
+            batch.append((dict(dir=canonical_dirpath, mt=dir_modtime), None, None))
+        if reused_records is not None:
+            batch.extend((r, None, None) for r in reused_records)
+        else:
+            batch.extend(make_records(canonical_dirpath, file_entries))
+
+        if stats is not None:
+            secs = time.perf_counter() - t
+            stats.add_secs('stat', secs)
+            if reused_records is not None:
+                stats.add(dirs_reused=1)
+            stats.dir_done(canonical_dirpath, payload[3] + secs, len(batch) - record_dirs)
+        return batch
+
+    engine = None
+    if io_threads:
+        engine = IOEngine(io_threads, max_in_flight)
+
+    if n_workers > 1:
+        records_by_dir = parallel_walk_tree(rootdir, ignore_dirs, n_workers, process_dir,
+                                            list_dir=list_dir, canonical_root=canonical_root)
+    else:
+        walk = walk_tree(rootdir, ignore_dirs, list_dir, canonical_root)
+        if engine is not None:
+            # stat every listed file on the engine's threads; DirEntry caches
+            # the result, so process_dir's own stat() calls then return at once
+            walk = engine.prefetch('stat', walk, lambda e: e[2][1] or (),
+                                   lambda entry: entry.stat())
+        records_by_dir = (process_dir(*e) for e in walk)
+
+    cache = None
+    if hash_cache_file:
+        cache = HashCache(hash_cache_file, hash_algorithm, metadata['rootdir'])
+
+    items = (item for batch in records_by_dir for item in batch)
+    if hash_algorithm:
+        records = hash_records(items, hash_algorithm, n_hash_threads, hash_chunk_bytes,
+                               cache=cache, engine=engine, stats=stats)
+    else:
+        records = (data for data, fullpath, stat_key in items)
+
+    # records only ever get yielded from the consumer's thread
+    completed = False
+    try:
+        for data in records:
+            yield data
+        completed = True
+    finally:
+        # only evict after a complete crawl, or else we'd drop entries for
+        # files that we just never got around to (which includes the ones in
+        # directories that were reused from a previous inventory)
+        if cache is not None:
+            cache.close(evict=(completed and previous is None))
+            cache.print_report()
+
+        if engine is not None:
+            engine.close()
+            engine.print_report()
+
+        if previous is not None:
+            print(f'incremental: reused {previous.n_reused} of {len(previous.dirs)} directories from {incremental_from}',
+                  file=sys.stderr)
+            previous.close()
+
+
+# creates an inventory starting at rootdir and writes .jsonl result to
+# output (default: stdout), containing a line for each file's metadata
+# (first line has overall metadata), compressed with compression (see
+# inventory_io.COMPRESSIONS; by default implied by output's extension)
+#
+# if record_stats is True, print where the time went (see
+# instrumentation.RunStats) to stderr at the end, and also write those
+# stats as of the end of the crawl as a last {"stats": ...} line, which
+# compare_inventories.iter_inventory_records merges into the metadata
+# (they're only known at the very end, so they can't go in the first line).
+# they're taken once every record before that line has been written, so
+# they include all of the writer's phases; only writing that line itself
+# (and the compressor's final flush) isn't in them
+#
+# if progress_interval is given, print a progress line to stderr every
+# that many seconds
+#
+# takes the same other arguments as iter_inventory, and returns the
+# instrumentation.RunStats of the run
+def create_inventory(rootdir, label, *args, output=None, compression=None,
+                     record_stats=False, progress_interval=None, **kwargs):
+    stats = RunStats()
+    progress = None
+    if progress_interval:
+        progress = ProgressReporter(stats, progress_interval).start()
+    try:
+        with RecordWriter(output, compression, stats=stats) as writer:
+            for data in iter_inventory(rootdir, label, *args, stats=stats, **kwargs):
+                writer.write(data)
+            if record_stats:
+                writer.drain()
+                stats.finish()
+                # (the stats line itself doesn't count, so that it says the
+                # same as the report on stderr)
+                writer.stats = None
+                writer.write(dict(stats=stats.as_dict()))
+    finally:
+        if progress is not None:
+            progress.stop()
+    stats.finish()
+    if record_stats:
+        stats.print_report()
+    return stats
 
 
 if __name__ == '__main__':
@@ -105,6 +563,51 @@ if __name__ == '__main__':
     parser.add_argument("label", help="label name for this inventory")
     parser.add_argument("--checksum", help="take a crc32 checksum of first N bytes of files (SLOW!)",
                         action="store_true")
+    parser.add_argument("--hash", choices=HASH_ALGORITHMS,
+                        help="hash files with this algorithm; all but crc32-prefix read the FULL contents (SLOWER!)")
+    parser.add_argument("--hash_threads", type=int, default=DEFAULT_HASH_THREADS,
+                        help="number of threads to hash files on")
+    parser.add_argument("--hash_cache", metavar="FILE",
+                        help="sqlite file to cache hashes in across runs, so only new/changed files get re-read")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="crawl with N threads (helps a lot on network filesystems)")
+    parser.add_argument("--record_dirs", action="store_true",
+                        help="also record each directory's modtime, so this inventory can be used with --incremental later")
+    parser.add_argument("--incremental", metavar="PREV_FILE",
+                        help="reuse records from PREV_FILE (made with --record_dirs or --incremental) for directories whose modtime hasn't changed")
+    parser.add_argument("--incremental_other_root", action="store_true",
+                        help="allow --incremental with an inventory of a different root directory (ONLY if it's the same tree, moved or mounted elsewhere)")
+    parser.add_argument("--sorted", action="store_true",
+                        help="write files in path order, for compare_inventories.py --stream (can't be used with --workers)")
+    parser.add_argument("--io_threads", type=int,
+                        help="keep many stat/read calls in flight at once on this many threads, and report ops/sec (helps on high-latency filesystems)")
+    parser.add_argument("--max_in_flight", type=int,
+                        help="max number of stat/read calls in flight with --io_threads (default: 8 per thread)")
+    parser.add_argument("--output", "-o", metavar="FILE",
+                        help="write the inventory to FILE instead of stdout (compressed if it ends in .gz, .bz2, or .xz)")
+    parser.add_argument("--compress", choices=sorted(COMPRESSIONS),
+                        help="compress the inventory on the fly")
+    parser.add_argument("--ignore", nargs='+', dest="ignore_globs",
+                        help="don't inventory paths matching the following gitignore-style globs: <list>")
+    parser.add_argument("--ignore_rules", help="read more ignore rules from this file (see ignore_rules.py for its format)")
+    parser.add_argument("--stats", action="store_true",
+                        help="print where the time went (per phase, slowest directories) to stderr at the end, and record it in the inventory")
+    parser.add_argument("--progress", type=float, nargs='?', const=DEFAULT_PROGRESS_INTERVAL, metavar="SECS",
+                        help=f"print progress to stderr every SECS seconds (default: {DEFAULT_PROGRESS_INTERVAL})")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="run under cProfile and tracemalloc, save the profile to FILE, and print the top functions and allocations to stderr (SLOW!)")
 
     args = parser.parse_args()
-    create_inventory(args.root, args.label, args.checksum)
+    ignore_rules = None
+    if args.ignore_globs or args.ignore_rules:
+        ignore_rules = make_ignore_rules(globs=args.ignore_globs, rules_file=args.ignore_rules,
+                                         use_defaults=False)
+    with profiled(args.profile):
+        create_inventory(args.root, args.label, args.checksum, n_workers=args.workers,
+                         hash_algorithm=args.hash, n_hash_threads=args.hash_threads,
+                         hash_cache_file=args.hash_cache,
+                         record_dirs=args.record_dirs, incremental_from=args.incremental,
+                         allow_other_root=args.incremental_other_root, sort_paths=args.sorted, ignore_rules=ignore_rules,
+                         io_threads=args.io_threads, max_in_flight=args.max_in_flight,
+                         output=args.output, compression=args.compress,
+                         record_stats=args.stats, progress_interval=args.progress)
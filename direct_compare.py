@@ -0,0 +1,259 @@
+# created: 2026-10-18
+# see 'parser' for expected command-line arguments
+
+# goal: be FAST!!!
+
+''' compares two directory trees, or a directory tree against an existing
+inventory file, directly in one process without writing inventories to
+disk and parsing them back first:
+
+python3 direct_compare.py ~/Dropbox /Volumes/backup/Dropbox > /tmp/out
+python3 direct_compare.py ~/Dropbox inventory-files_do-not-add-to-git/2018-12-01-mba.jsonl > /tmp/out
+python3 direct_compare.py --quiet ~/Dropbox /Volumes/backup/Dropbox && echo same
+
+each side gets crawled on its own thread, so both trees are crawled
+concurrently, and records go straight into the same comparison code that
+compare_inventories.py uses. ignored directories are pruned during the
+crawl, so they never get listed at all
+
+with --quiet, print nothing and exit with status 0 if both sides are the
+same and 1 if they differ. both trees then get crawled in path order and
+merge-joined as the records arrive (like compare_inventories.py --stream),
+so the crawls stop at the first difference
+'''
+
+import argparse
+import os
+import queue
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from binary_inventory import columns_from_records
+from compare_inventories import (iter_inventory_records, iter_sorted_records, path_sort_key,
+                                 merge_join, make_ignore_filter, diff_file_records,
+                                 compare_inventories, clean_up_metadata, DEFAULT_SUMMARY_THRESHOLD)
+from create_inventory import iter_inventory
+from instrumentation import RunStats, ProgressReporter, profiled, DEFAULT_PROGRESS_INTERVAL
+from inventory import Inventory
+
+# requires python >= 3.8 for inventory.Inventory
+# (NB: compare version_info, since sys.version[:3] is '3.1' on python 3.10+)
+assert sys.version_info >= (3, 8)
+
+# records travel between threads in batches of this many, since a
+# queue.Queue round trip per record costs more than making the record
+RECORD_BATCH_SIZE = 1000
+
+# max number of batches waiting for the consumer
+DEFAULT_QUEUE_SIZE = 64
+
+
+# yields the metadata dict and then the records of one side of a
+# comparison: a crawl of path if it's a directory, else the inventory file
+# at path. sort_paths=True crawls in path order (see create_inventory), and
+# a crawl adds its counts and timings to stats (an instrumentation.RunStats),
+# if given
+def iter_side(path, label, ignore_rules=None, n_workers=1, sort_paths=False, stats=None):
+    if os.path.isdir(path):
+        return iter_inventory(path, label, n_workers=n_workers, sort_paths=sort_paths,
+                              ignore_rules=ignore_rules, stats=stats)
+    return iter_inventory_records(path)
+
+
+# runs the records generator on its own (daemon) thread and yields its
+# items in the calling thread, so that a crawl keeps going while the caller
+# is busy with something else. if the caller stops early (e.g., by closing
+# this generator), the producer thread stops too
+def iter_in_thread(records, queue_size=DEFAULT_QUEUE_SIZE):
+    results = queue.Queue(maxsize=queue_size)
+    done_sentinel = object()
+    stop = threading.Event()
+
+    # returns False if the consumer went away
+    def put(item):
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def producer():
+        try:
+            batch = []
+            for r in records:
+                batch.append(r)
+                if len(batch) >= RECORD_BATCH_SIZE:
+                    if not put(batch):
+                        return
+                    batch = []
+            if put(batch):
+                put(done_sentinel)
+        except Exception as e:
+            # hand the error to the consuming thread so it can re-raise
+            put(e)
+        finally:
+            # (lets iter_inventory clean up, e.g., close its hash cache)
+            if hasattr(records, 'close'):
+                records.close()
+
+    t = threading.Thread(target=producer, daemon=True)
+    t.start()
+    try:
+        while True:
+            batch = results.get()
+            if batch is done_sentinel:
+                break
+            if isinstance(batch, Exception):
+                raise batch
+            yield from batch
+    finally:
+        stop.set()
+
+
+# loads one side of a comparison (see iter_side) into an inventory.Inventory
+def load_side(path, label, ignore_rules=None, n_workers=1, stats=None):
+    records = iter_side(path, label, ignore_rules, n_workers, stats=stats)
+    metadata = next(records)
+    inv = columns_from_records(metadata, records, cls=Inventory)
+    clean_up_metadata(inv.metadata)
+    return inv
+
+
+# yields (path_sort_key, record) for all files of one side of a comparison
+# in path order, crawling it on its own thread. inventory files that
+# weren't created with create_inventory.py --sorted get sorted in memory
+def iter_sorted_side(path, label, ignore_rules=None):
+    records = iter_in_thread(iter_side(path, label, ignore_rules, sort_paths=True))
+    metadata = next(records)
+    if metadata.get('sorted'):
+        return iter_sorted_records(path, records)
+    keyed = [(path_sort_key(r['d'], r['f']), r) for r in records if 'dir' not in r]
+    keyed.sort(key=lambda e: e[0])
+    return keyed
+
+
+# returns the first (key, first_record, second_record) where the two sides
+# differ (one of the records is None if only one side has that file), or
+# None if they're the same. stops crawling as soon as it finds one
+def find_first_difference(first_path, second_path, should_ignore, ignore_modtimes=False):
+    first_iter = iter_sorted_side(first_path, 'first', should_ignore)
+    second_iter = iter_sorted_side(second_path, 'second', should_ignore)
+    try:
+        for key, first_data, second_data in merge_join(first_iter, second_iter):
+            r = first_data or second_data
+            if should_ignore((r['d'], r['f'])):
+                continue
+            if first_data is None or second_data is None:
+                return (key, first_data, second_data)
+            if diff_file_records(first_data, second_data, ignore_modtimes)[0]:
+                return (key, first_data, second_data)
+        return None
+    finally:
+        # stop both crawls right away instead of when garbage-collected
+        for it in (first_iter, second_iter):
+            if hasattr(it, 'close'):
+                it.close()
+
+
+# first_path and second_path are each either a directory to crawl or an
+# inventory file; prints the same report as compare_inventories.py
+#
+# if stats is an instrumentation.RunStats, both crawls add their counts and
+# timings to it (see create_inventory.iter_inventory), and the comparison
+# itself gets timed as the 'compare' phase
+def direct_compare(first_path, second_path, summary_threshold,
+                   ignore_modtimes=False,
+                   ignore_dirs=[],
+                   ignore_filenames=[],
+                   ignore_exts=[],
+                   ignore_direxts=[],
+                   ignore_globs=[],
+                   ignore_rules_file=None,
+                   find_moves=True,
+                   n_workers=1,
+                   stats=None):
+    # (copies, since make_ignore_filter appends the defaults to its
+    # arguments, and compare_inventories calls it again)
+    should_ignore = make_ignore_filter(list(ignore_dirs or []), list(ignore_filenames or []),
+                                       list(ignore_exts or []), list(ignore_direxts or []),
+                                       list(ignore_globs or []), ignore_rules_file)[0]
+
+    # crawl (or load) both sides at the same time
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        first_future = pool.submit(load_side, first_path, 'first', should_ignore, n_workers, stats)
+        second_future = pool.submit(load_side, second_path, 'second', should_ignore, n_workers, stats)
+        first = first_future.result()
+        second = second_future.result()
+
+    if stats is None:
+        stats = RunStats()
+    with stats.phase('compare'):
+        compare_inventories(first, second, summary_threshold,
+                            ignore_modtimes,
+                            ignore_dirs, ignore_filenames,
+                            ignore_exts, ignore_direxts,
+                            ignore_globs, ignore_rules_file,
+                            find_moves=find_moves)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+
+    # mandatory positional arguments:
+    parser.add_argument("first", help="first directory tree (or inventory file) to compare")
+    parser.add_argument("second", help="second directory tree (or inventory file) to compare")
+    parser.add_argument("--quiet", action="store_true",
+                        help="print nothing; exit with status 0 if both sides are the same, 1 if not (stops at the first difference)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="crawl each tree with N threads (can't be used with --quiet)")
+    parser.add_argument("--ignore_modtimes", help="ignore modification times", action="store_true")
+    parser.add_argument("--ignore_dirs", nargs='+', help="ignore the following directories: <list>")
+    parser.add_argument("--ignore_files", nargs='+', help="ignore the following filenames: <list>")
+    parser.add_argument("--ignore_exts", nargs='+', help="ignore the following file extensions: <list>")
+    parser.add_argument("--ignore_direxts", nargs='+', help="ignore the following file extensions within directories: <list> of entries, each being 'dirname,extension'")
+    parser.add_argument("--ignore", nargs='+', dest="ignore_globs",
+                        help="ignore paths matching the following gitignore-style globs: <list>")
+    parser.add_argument("--ignore_rules", help="read more ignore rules from this file (see ignore_rules.py for its format)")
+    parser.add_argument("--summary_threshold", type=int, default=DEFAULT_SUMMARY_THRESHOLD,
+                        help="summarize a directory when it has more than N files")
+    parser.add_argument("--no_move_detection", action="store_true",
+                        help="don't try to detect moved files and directories")
+    parser.add_argument("--stats", action="store_true",
+                        help="print where the time went (both crawls together, and the comparison) to stderr at the end")
+    parser.add_argument("--progress", type=float, nargs='?', const=DEFAULT_PROGRESS_INTERVAL, metavar="SECS",
+                        help=f"print progress of both crawls to stderr every SECS seconds (default: {DEFAULT_PROGRESS_INTERVAL})")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="run under cProfile and tracemalloc, save the profile to FILE, and print the top functions and allocations to stderr (SLOW!)")
+
+    args = parser.parse_args()
+    for p in (args.first, args.second):
+        assert os.path.exists(p), f'{p} does not exist'
+
+    if args.quiet:
+        assert args.workers == 1, 'a parallel crawl can\'t produce sorted output for --quiet'
+        should_ignore = make_ignore_filter(args.ignore_dirs, args.ignore_files,
+                                           args.ignore_exts, args.ignore_direxts,
+                                           args.ignore_globs, args.ignore_rules)[0]
+        diff = find_first_difference(args.first, args.second, should_ignore, args.ignore_modtimes)
+        sys.exit(0 if diff is None else 1)
+    else:
+        stats = RunStats()
+        progress = ProgressReporter(stats, args.progress).start() if args.progress else None
+        try:
+            with profiled(args.profile):
+                direct_compare(args.first, args.second, args.summary_threshold,
+                               args.ignore_modtimes,
+                               args.ignore_dirs, args.ignore_files,
+                               args.ignore_exts, args.ignore_direxts,
+                               args.ignore_globs, args.ignore_rules,
+                               find_moves=not args.no_move_detection,
+                               n_workers=args.workers,
+                               stats=stats)
+        finally:
+            if progress is not None:
+                progress.stop()
+        if args.stats:
+            stats.finish()
+            stats.print_report()
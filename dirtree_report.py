@@ -0,0 +1,224 @@
+# created: 2026-10-18
+# builds and renders the directory trees in compare_inventories.py,
+# containment_test.py, and inventory_db.py reports
+
+# goal: be FAST!!! -- a diff of two big crawls can have millions of
+# changed files. so instead of one nested dict per path component and one
+# recursive print() per line:
+#
+# 1. group entries by their canonical dirname (a single dict lookup each,
+#    no splitting), then build the tree from the SORTED distinct dirnames in
+#    one pass, keeping the current path on a stack so that dirnames with a
+#    shared prefix reuse its nodes
+# 2. add up each directory's file counts and bytes (and everything under
+#    it) as that pass leaves it, so collapsing a directory with
+#    summary_threshold never needs to look at its files
+# 3. render with an explicit stack (no recursion limit on deep trees) into
+#    a buffer that's written out in big chunks
+
+''' report formats (see make_report):
+
+text   the indented tree, with directories that have more than
+       summary_threshold files collapsed to one line
+json   one json object per line: per section, one per directory, with its
+       files and the totals of its whole subtree; other lines (e.g., moved
+       directories, metadata) have their own fields
+csv    one row per file: section,dir,name,bytes,detail
+'''
+
+import csv
+import json
+import sys
+
+# requires python >= 3.6 for f-strings
+# (NB: compare version_info, since sys.version[:3] is '3.1' on python 3.10+)
+assert sys.version_info >= (3, 6)
+
+REPORT_FORMATS = ('text', 'json', 'csv')
+
+INDENT = '    '
+
+# number of buffered lines to write out at once
+FLUSH_LINES = 8192
+
+
+# one directory of a tree built by build_dirtree
+class DirNode:
+    __slots__ = ('name', 'path', 'files', 'subdirs', 'n_bytes', 'total_files', 'total_bytes')
+
+    def __init__(self, name, path):
+        self.name = name # last component of path ('' for the root)
+        self.path = path # canonical dirname
+        # (filename, bytes, data) of each file directly in it, in the order
+        # they were given
+        self.files = []
+        self.subdirs = [] # DirNodes, sorted by name
+        self.n_bytes = 0 # bytes of files directly in it
+        # files and bytes in it and everything under it
+        self.total_files = 0
+        self.total_bytes = 0
+
+    # yields (node, depth) for this node and everything under it, parents
+    # before children and subdirectories in sorted order
+    def walk(self):
+        stack = [(self, 0)]
+        while stack:
+            node, depth = stack.pop()
+            yield (node, depth)
+            for child in reversed(node.subdirs):
+                stack.append((child, depth + 1))
+
+
+# builds a tree of DirNodes from entries, each a (canonical dirname,
+# filename, bytes, data) tuple, where bytes is what gets added up per
+# directory (None counts as 0) and data is whatever the report needs for
+# that file. returns the root DirNode
+def build_dirtree(entries):
+    by_dir = {}
+    for dn, fn, sz, data in entries:
+        files = by_dir.get(dn)
+        if files is None:
+            files = by_dir[dn] = []
+        files.append((fn, sz or 0, data))
+
+    root = DirNode('', '')
+    # the root, then one node per component of the current directory
+    stack = [root]
+    parts = [] # components of the current directory
+
+    # a node's totals are complete once we leave it, so add them to its parent
+    def pop():
+        node = stack.pop()
+        parent = stack[-1]
+        parent.total_files += node.total_files
+        parent.total_bytes += node.total_bytes
+
+    # (sorted by components, so that every directory comes right before
+    # everything under it, and siblings come in name order)
+    for dn in sorted(by_dir, key=lambda d: d.split('/') if d else []):
+        new_parts = dn.split('/') if dn else []
+        n_shared = 0
+        for a, b in zip(parts, new_parts):
+            if a != b:
+                break
+            n_shared += 1
+        while len(stack) > n_shared + 1:
+            pop()
+        for i in range(n_shared, len(new_parts)):
+            child = DirNode(new_parts[i], '/'.join(new_parts[:i+1]))
+            stack[-1].subdirs.append(child)
+            stack.append(child)
+        parts = new_parts
+
+        node = stack[-1]
+        node.files = by_dir[dn]
+        node.n_bytes = sum(f[1] for f in node.files)
+        node.total_files += len(node.files)
+        node.total_bytes += node.n_bytes
+    while len(stack) > 1:
+        pop()
+    return root
+
+
+# writes a report to file in one of REPORT_FORMATS (see the module
+# docstring). lines are buffered until flush() or close(), so don't print()
+# to the same file in between
+class TextReport:
+    def __init__(self, summary_threshold, file=None):
+        self.summary_threshold = summary_threshold
+        # (looked up now, not at import time, in case it's been redirected)
+        self.file = file if file is not None else sys.stdout
+        self.lines = []
+
+    def write_line(self, line):
+        self.lines.append(line)
+        if len(self.lines) >= FLUSH_LINES:
+            self.flush()
+
+    def flush(self):
+        if self.lines:
+            self.lines.append('')
+            self.file.write('\n'.join(self.lines))
+            self.lines = []
+
+    def close(self):
+        self.flush()
+        self.file.flush()
+
+    # a line of free text, e.g., a heading (only in text reports)
+    def note(self, text):
+        self.write_line(text)
+
+    # metadata about the whole report (only in json reports)
+    def metadata(self, **fields):
+        pass
+
+    # a line that isn't part of a tree: text in text reports, and fields in
+    # json ones (plus dirname, name, and detail for csv ones)
+    def row(self, section, text, dirname='', name='', detail='', **fields):
+        self.write_line(text)
+
+    # root: a DirNode from build_dirtree, entry_repr(data): text for a file.
+    # prints each directory as /name (indented by its depth), then its files,
+    # or how many there are if more than summary_threshold
+    def tree(self, section, root, entry_repr):
+        write_line = self.write_line
+        threshold = self.summary_threshold
+        for node, depth in root.walk():
+            prefix = INDENT * depth
+            write_line(f'{prefix}/{node.name}') # leading '/' for readability
+            files = node.files
+            if len(files) > threshold:
+                write_line(f'{prefix}{INDENT}[{len(files)} files]')
+            else:
+                for fn, sz, data in files:
+                    write_line(f'{prefix}{INDENT}{fn}    {entry_repr(data)}')
+
+
+class JsonReport(TextReport):
+    def note(self, text):
+        pass
+
+    def metadata(self, **fields):
+        self.write_line(json.dumps(dict(section='metadata', **fields)))
+
+    def row(self, section, text, dirname='', name='', detail='', **fields):
+        self.write_line(json.dumps(dict(section=section, **fields)))
+
+    # (every directory, with all of its files: nothing gets collapsed)
+    def tree(self, section, root, entry_repr):
+        dumps = json.dumps
+        for node, depth in root.walk():
+            files = [dict(name=fn, bytes=sz, detail=entry_repr(data)) for fn, sz, data in node.files]
+            self.write_line(dumps(dict(section=section, dir=node.path, n_files=len(files), n_bytes=node.n_bytes,
+                                       total_files=node.total_files, total_bytes=node.total_bytes,
+                                       files=files)))
+
+
+class CsvReport(TextReport):
+    def __init__(self, summary_threshold, file=None):
+        super().__init__(summary_threshold, file)
+        # (writes each row to self.write, which buffers it as one line)
+        self.writer = csv.writer(self, lineterminator='')
+        self.writer.writerow(('section', 'dir', 'name', 'bytes', 'detail'))
+
+    def write(self, row):
+        self.write_line(row)
+
+    def note(self, text):
+        pass
+
+    def row(self, section, text, dirname='', name='', detail='', **fields):
+        self.writer.writerow((section, dirname, name, '', detail))
+
+    def tree(self, section, root, entry_repr):
+        writerow = self.writer.writerow
+        for node, depth in root.walk():
+            for fn, sz, data in node.files:
+                writerow((section, node.path, fn, sz, entry_repr(data)))
+
+
+def make_report(report_format, summary_threshold, file=None):
+    assert report_format in REPORT_FORMATS, f'unknown report format {report_format}'
+    cls = dict(text=TextReport, json=JsonReport, csv=CsvReport)[report_format]
+    return cls(summary_threshold, file)
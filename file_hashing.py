@@ -0,0 +1,179 @@
+# created: 2026-10-18
+# file content hashing for create_inventory.py (and friends)
+
+# goal: be FAST!!! -- hashing runs on a thread pool separate from the
+# directory walk so that disk I/O, hashing CPU, and crawling all overlap
+# (zlib and hashlib both release the GIL while chewing on large buffers)
+
+import binascii
+import hashlib
+import threading
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# - crc32-prefix: the original crude approximation, crc32 of only the
+#   first N_BYTES_FOR_CHECKSUM bytes of each file (stored as 'crc32')
+# - xxhash-style: a fast non-cryptographic 64-bit hash of the FULL file
+#   contents (stored as 'h'). xxhash itself isn't in the standard library,
+#   so this combines zlib's crc32 and adler32, which both run in C at
+#   multiple GB/s -- plenty to spot duplicates and changes, but NOT
+#   collision-resistant against anyone trying to fool it
+# - sha256: cryptographic hash of the full file contents (stored as 'h')
+HASH_ALGORITHMS = ('crc32-prefix', 'xxhash-style', 'sha256')
+
+# don't read too few bytes, or else lots of files look identical due to
+# their file type headers being the same
+# (NB: it doesn't take much more time to read slightly more bytes,
+# since just opening each file takes a bunch of time)
+N_BYTES_FOR_CHECKSUM = 100
+
+# read full files in large fixed-size chunks into a reusable buffer
+DEFAULT_HASH_CHUNK_BYTES = 1024 * 1024
+
+DEFAULT_HASH_THREADS = 4
+
+# per-thread reusable read buffers, so we don't allocate one per file
+_thread_local = threading.local()
+
+
+def _get_buffer(chunk_bytes):
+    buf = getattr(_thread_local, 'buf', None)
+    if buf is None or len(buf) != chunk_bytes:
+        buf = bytearray(chunk_bytes)
+        _thread_local.buf = buf
+    return buf
+
+
+# yields successive memoryview chunks of the file at path (valid only until
+# the next chunk is requested, since the underlying buffer gets reused)
+def _iter_chunks(path, chunk_bytes):
+    buf = _get_buffer(chunk_bytes)
+    view = memoryview(buf)
+    with open(path, 'rb', buffering=0) as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            yield view[:n]
+
+
+# returns (key, value) where key is the inventory record key to store
+# value under ('crc32' or 'h')
+def hash_file(path, algorithm, chunk_bytes=DEFAULT_HASH_CHUNK_BYTES):
+    if algorithm == 'crc32-prefix':
+        with open(path, 'rb') as f:
+            first_N_bytes = f.read(N_BYTES_FOR_CHECKSUM)
+        return ('crc32', binascii.crc32(first_N_bytes))
+    elif algorithm == 'xxhash-style':
+        crc = 0
+        adler = 1
+        for chunk in _iter_chunks(path, chunk_bytes):
+            crc = zlib.crc32(chunk, crc)
+            adler = zlib.adler32(chunk, adler)
+        return ('h', f'{crc:08x}{adler:08x}')
+    elif algorithm == 'sha256':
+        h = hashlib.sha256()
+        for chunk in _iter_chunks(path, chunk_bytes):
+            h.update(chunk)
+        return ('h', h.hexdigest())
+    else:
+        assert False, f'unknown hash algorithm: {algorithm}'
+
+
+# sha256 hex digest of at most the first n_bytes of the file at path; if
+# the file is no longer than n_bytes, that's the same as hashing all of it
+def hash_file_prefix(path, n_bytes):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read(n_bytes)).hexdigest()
+
+
+# the record key that a given algorithm stores its value under
+def hash_record_key(algorithm):
+    return 'crc32' if algorithm == 'crc32-prefix' else 'h'
+
+
+# takes an iterable of (record, fullpath, stat_key) tuples and yields the
+# records, in the SAME order, after adding their hash value. the actual
+# hashing happens on n_threads background threads with at most
+# max_in_flight files queued up, so the caller (the directory walk) keeps
+# running in the meantime
+#
+# if cache is a hash_cache.HashCache, files whose stat_key (see
+# hash_cache.py) is already in the cache don't get read at all
+#
+# records whose fullpath is None get passed through untouched
+#
+# if engine is an io_engine.IOEngine, hash on its threads instead (with its
+# max_in_flight by default), so that reads get counted in its report
+#
+# if stats is an instrumentation.RunStats, count hashed files and bytes, and
+# time the 'hash' phase (on the hash threads) and the 'hash_wait' phase
+# (the caller waiting on results)
+def hash_records(items, algorithm, n_threads=DEFAULT_HASH_THREADS,
+                 chunk_bytes=DEFAULT_HASH_CHUNK_BYTES, max_in_flight=None, cache=None,
+                 engine=None, stats=None):
+    assert algorithm in HASH_ALGORITHMS
+    if max_in_flight is None:
+        max_in_flight = engine.max_in_flight if engine is not None else n_threads * 64
+    key = hash_record_key(algorithm)
+
+    hash_fn = hash_file
+    if stats is not None:
+        def hash_fn(path, algorithm, chunk_bytes, n_bytes):
+            t = time.perf_counter()
+            ret = hash_file(path, algorithm, chunk_bytes)
+            stats.add_secs('hash', time.perf_counter() - t)
+            stats.add(files_hashed=1, bytes_hashed=n_bytes)
+            return ret
+
+    in_flight = deque() # (record, future, stat_key) tuples, oldest first
+
+    def finish_oldest():
+        r, fut, stat_key = in_flight.popleft()
+        if fut is None: # cache hit (or nothing to hash)
+            return r
+        if stats is not None and not fut.done():
+            with stats.phase('hash_wait'):
+                k, v = fut.result()
+        else:
+            k, v = fut.result()
+        r[k] = v
+        if cache is not None:
+            cache.store(stat_key, v)
+        return r
+
+    pool = None
+    if engine is None:
+        pool = ThreadPoolExecutor(max_workers=n_threads)
+        submit = pool.submit
+    else:
+        submit = lambda *args: engine.submit('read', *args)
+
+    try:
+        for record, fullpath, stat_key in items:
+            cached_value = None
+            if fullpath is not None and cache is not None:
+                cached_value = cache.lookup(stat_key)
+
+            if fullpath is None:
+                in_flight.append((record, None, None))
+            elif cached_value is not None:
+                record[key] = cached_value
+                in_flight.append((record, None, stat_key))
+            elif stats is None:
+                in_flight.append((record, submit(hash_fn, fullpath, algorithm, chunk_bytes), stat_key))
+            else:
+                # (roughly how much hash_file is going to read)
+                n_bytes = record['sz'] if algorithm != 'crc32-prefix' else min(record['sz'], N_BYTES_FOR_CHECKSUM)
+                in_flight.append((record, submit(hash_fn, fullpath, algorithm, chunk_bytes, n_bytes), stat_key))
+            # drain finished work from the front to keep memory bounded
+            while in_flight and (len(in_flight) >= max_in_flight or
+                                 in_flight[0][1] is None or in_flight[0][1].done()):
+                yield finish_oldest()
+        while in_flight:
+            yield finish_oldest()
+    finally:
+        if pool is not None:
+            pool.shutdown()
@@ -1,39 +1,187 @@
 # created: 2019-02-10
 # see 'parser' for expected command-line arguments
 
+# goal: be FAST!!! -- find duplicates in stages, so that we only ever
+# touch the files that could possibly be duplicates:
+#
+# 1. group files by size, straight from the inventory (free). files with a
+#    unique size (usually the vast majority) can't have duplicates
+# 2. within each size group, group by a hash of the first
+#    DEDUPE_PREFIX_BYTES of each file (or by the inventory's own hashes, if
+#    it has them, which is free again)
+# 3. within each group that still collides, group by a full-content hash.
+#    files no longer than DEDUPE_PREFIX_BYTES skip this, since their prefix
+#    hash already covered all of their contents
+#
+# stages 2 and 3 read files on a thread pool, since that's mostly waiting on I/O
+
 import argparse
 import json
 import os
 import sys
 from collections import Counter, defaultdict
-from compare_inventories import parse_inventory_file, DEFAULT_IGNORE_FILENAMES, DEFAULT_IGNORE_DIRS
+from concurrent.futures import ThreadPoolExecutor
+from compare_inventories import parse_inventory_file, inventory_hash_algorithm
+from ignore_rules import make_ignore_rules
+from instrumentation import RunStats, ProgressReporter, profiled, DEFAULT_PROGRESS_INTERVAL
+from file_hashing import hash_file, hash_file_prefix, DEFAULT_HASH_THREADS
+
+# requires python >= 3.6 for f-strings
+# (NB: compare version_info, since sys.version[:3] is '3.1' on python 3.10+)
+assert sys.version_info >= (3, 6)
+
+# how much of each file to read in stage 2. reading 64KB costs about the
+# same as reading 100 bytes (opening the file dominates), and it lets all
+# files up to this size skip stage 3 entirely
+DEDUPE_PREFIX_BYTES = 64 * 1024
+
+
+# splits each group of rows into subgroups by key_fn(row), dropping rows
+# that key_fn returns None for and subgroups of only one row. runs key_fn on
+# n_threads threads, since it usually reads files
+def split_groups(groups, key_fn, n_threads):
+    rows = [i for g in groups for i in g]
+    with ThreadPoolExecutor(max_workers=n_threads) as pool:
+        keys = dict(zip(rows, pool.map(key_fn, rows)))
+
+    ret = []
+    for g in groups:
+        subgroups = defaultdict(list)
+        for i in g:
+            if keys[i] is not None:
+                subgroups[keys[i]].append(i)
+        ret.extend(sg for sg in subgroups.values() if len(sg) > 1)
+    return ret
+
+
+# returns a list of groups of duplicate files in inventory inv (an
+# inventory.Inventory), each group being a list of rows, sorted so that
+# the groups with the most reclaimable bytes come first
+#
+# root is where the inventoried tree lives now (defaults to its rootdir at
+# inventory time). if read_files is False, never touch the filesystem and
+# only rely on sizes and whatever hashes the inventory has, which can give
+# false positives
+#
+# ignore_rules is an ignore_rules.IgnoreRules (default: the same default
+# rules as compare_inventories.py)
+#
+# if stats is an instrumentation.RunStats, time each stage in it and count
+# the files and bytes read
+def find_duplicates(inv, root=None, read_files=True, n_threads=DEFAULT_HASH_THREADS,
+                    min_size=1, ignore_rules=None, stats=None):
+    if root is None:
+        root = inv.metadata['rootdir']
+    if ignore_rules is None:
+        ignore_rules = make_ignore_rules()
+    if stats is None:
+        stats = RunStats()
+
+    def is_ignored(i):
+        return ignore_rules.ignore_file(*inv.path(i))
+
+    def fullpath(i):
+        return os.path.join(root, *inv.path(i))
+
+    # (returns None for files that can't be read anymore, which drops them)
+    def prefix_hash(i):
+        try:
+            ret = hash_file_prefix(fullpath(i), DEDUPE_PREFIX_BYTES)
+        except OSError as e:
+            print(f'WARNING: {e}', file=sys.stderr)
+            return None
+        stats.add(files_read=1, bytes_read=min(inv.sizes[i], DEDUPE_PREFIX_BYTES))
+        return ret
+
+    def full_hash(i):
+        try:
+            ret = hash_file(fullpath(i), 'sha256')[1]
+        except OSError as e:
+            print(f'WARNING: {e}', file=sys.stderr)
+            return None
+        stats.add(files_read=1, bytes_read=inv.sizes[i])
+        return ret
+
+    # stage 1: sizes
+    with stats.phase('sizes'):
+        groups = []
+        for sz, rows in inv.by_filesize.items():
+            if sz >= min_size and len(rows) > 1:
+                rows = [i for i in rows if not is_ignored(i)]
+                if len(rows) > 1:
+                    groups.append(rows)
+
+    # stage 2: the inventory's own hashes, if any, then prefix hashes
+    hash_algorithm = inventory_hash_algorithm(inv.metadata)
+    if hash_algorithm:
+        with stats.phase('inventory_hashes'):
+            groups = split_groups(groups, inv.hash_key, 1)
+    if read_files and hash_algorithm in (None, 'crc32-prefix'):
+        with stats.phase('prefix_hashes'):
+            groups = split_groups(groups, prefix_hash, n_threads)
+
+        # stage 3: full hashes, only for files too big for stage 2 to
+        # have covered (all files in a group have the same size)
+        with stats.phase('full_hashes'):
+            small = [g for g in groups if inv.sizes[g[0]] <= DEDUPE_PREFIX_BYTES]
+            big = [g for g in groups if inv.sizes[g[0]] > DEDUPE_PREFIX_BYTES]
+            groups = small + split_groups(big, full_hash, n_threads)
+
+    groups = [sorted(g, key=inv.path) for g in groups]
+    groups.sort(key=lambda g: (-reclaimable_bytes(inv, g), inv.path(g[0])))
+    return groups
+
+
+# bytes freed by keeping only one file out of group g
+def reclaimable_bytes(inv, g):
+    return inv.sizes[g[0]] * (len(g) - 1)
 
-# requires python >= 3.5 to get os.walk to use the MUCH faster os.scandir function
-assert float(sys.version[:3]) >= 3.5
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
 
     # mandatory positional arguments:
     parser.add_argument("inventory_file", help="inventory file in which to find duplicates")
+    parser.add_argument("--root", help="where the inventoried directory tree is now (default: its rootdir when inventoried)")
+    parser.add_argument("--no_read", action="store_true",
+                        help="don't read any files, only use sizes and hashes from the inventory (may give false positives)")
+    parser.add_argument("--threads", type=int, default=DEFAULT_HASH_THREADS,
+                        help="number of threads to read files on")
+    parser.add_argument("--min_size", type=int, default=1,
+                        help="ignore files smaller than this many bytes (default skips empty files)")
+    parser.add_argument("--ignore", nargs='+', dest="ignore_globs",
+                        help="also ignore paths matching the following gitignore-style globs: <list>")
+    parser.add_argument("--ignore_rules", help="read more ignore rules from this file (see ignore_rules.py for its format)")
+    parser.add_argument("--stats", action="store_true",
+                        help="print how long each stage took to stderr at the end")
+    parser.add_argument("--progress", type=float, nargs='?', const=DEFAULT_PROGRESS_INTERVAL, metavar="SECS",
+                        help=f"print progress to stderr every SECS seconds (default: {DEFAULT_PROGRESS_INTERVAL})")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="run under cProfile and tracemalloc, save the profile to FILE, and print the top functions and allocations to stderr (SLOW!)")
 
     args = parser.parse_args()
-    inv = parse_inventory_file(args.inventory_file)
-
-    rbcrc = inv['records_by_crc32']
-
-    for k, v in rbcrc.items(): # in py3, items() is an iterator
-        if len(v) > 1:
-            entries_by_size = defaultdict(list)
-            for e in v:
-                if e['f'] not in DEFAULT_IGNORE_FILENAMES:
-                    for d in DEFAULT_IGNORE_DIRS:
-                        if d in e['d']:
-                            break # get out and don't run the 'else' clause
-                    else:
-                        entries_by_size[e['sz']].append(e)
-            for sz, possible_dups in entries_by_size.items():
-                if len(possible_dups) > 1:
-                    for pd in possible_dups:
-                        print(os.path.join(pd['d'], pd['f']))
-                    print()
+    stats = RunStats()
+    with profiled(args.profile):
+        with stats.phase('parse'):
+            inv = parse_inventory_file(args.inventory_file)
+
+        ignore_rules = make_ignore_rules(globs=args.ignore_globs, rules_file=args.ignore_rules)
+        progress = ProgressReporter(stats, args.progress).start() if args.progress else None
+        try:
+            groups = find_duplicates(inv, args.root, not args.no_read, args.threads, args.min_size,
+                                     ignore_rules, stats)
+        finally:
+            if progress is not None:
+                progress.stop()
+    if args.stats:
+        stats.finish()
+        stats.print_report()
+    total_reclaimable = 0
+    for g in groups:
+        r = reclaimable_bytes(inv, g)
+        total_reclaimable += r
+        print(f'[{len(g)} copies of {inv.sizes[g[0]]} bytes, {r} bytes reclaimable]')
+        for i in g:
+            print(os.path.join(*inv.path(i)))
+        print()
+    print(f'{len(groups)} groups of duplicates, {total_reclaimable} bytes reclaimable in total')
@@ -0,0 +1,94 @@
+# created: 2026-10-18
+# persistent on-disk cache of file hashes for create_inventory.py --hash_cache
+
+# goal: be FAST!!! -- when re-inventorying the same tree every night, most
+# files haven't changed, so reuse their hashes from last time instead of
+# reading them all again. a file is considered unchanged if its
+# (device, inode, size, mtime in nanoseconds) stat signature is the same,
+# which is the same heuristic that tools like git and rsync rely on
+
+import sqlite3
+import sys
+import time
+
+# how many pending writes to buffer up before flushing them to sqlite
+FLUSH_BATCH_SIZE = 10000
+
+
+class HashCache:
+    # filename: sqlite database file (created if it doesn't exist)
+    # algorithm: one of file_hashing.HASH_ALGORITHMS; entries for different
+    #            algorithms live side by side in the same file
+    # rootdir: absolute path of the tree being crawled, so that evicting
+    #          vanished files from one tree doesn't wipe out another's
+    def __init__(self, filename, algorithm, rootdir):
+        self.algorithm = algorithm
+        self.rootdir = rootdir
+        # every entry that we look up or store during this run gets stamped
+        # with run_id; whatever is left with an older stamp at the end
+        # belongs to files that have vanished (or changed)
+        self.run_id = time.time()
+
+        self.conn = sqlite3.connect(filename)
+        # it's only a cache, so trade durability for speed
+        self.conn.execute('PRAGMA synchronous=OFF')
+        self.conn.execute('''CREATE TABLE IF NOT EXISTS hashes (
+                               dev INTEGER, ino INTEGER, size INTEGER, mtime_ns INTEGER,
+                               algorithm TEXT, root TEXT, value, seen REAL,
+                               PRIMARY KEY (dev, ino, size, mtime_ns, algorithm))''')
+
+        self.n_hits = 0
+        self.n_misses = 0
+        self.n_evicted = 0
+        self.pending_seen = []
+        self.pending_stores = []
+
+    # stat_key is a (st_dev, st_ino, st_size, st_mtime_ns) tuple;
+    # returns the cached hash value, or None if there isn't one
+    def lookup(self, stat_key):
+        row = self.conn.execute('SELECT value FROM hashes WHERE dev=? AND ino=? AND size=? AND mtime_ns=? AND algorithm=?',
+                                stat_key + (self.algorithm,)).fetchone()
+        if row is None:
+            self.n_misses += 1
+            return None
+        self.n_hits += 1
+        self.pending_seen.append(stat_key)
+        if len(self.pending_seen) >= FLUSH_BATCH_SIZE:
+            self.flush()
+        return row[0]
+
+    def store(self, stat_key, value):
+        self.pending_stores.append(stat_key + (self.algorithm, self.rootdir, value, self.run_id))
+        if len(self.pending_stores) >= FLUSH_BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        with self.conn:
+            self.conn.executemany('UPDATE hashes SET seen=?, root=? WHERE dev=? AND ino=? AND size=? AND mtime_ns=? AND algorithm=?',
+                                  ((self.run_id, self.rootdir) + k + (self.algorithm,) for k in self.pending_seen))
+            self.conn.executemany('INSERT OR REPLACE INTO hashes VALUES (?,?,?,?,?,?,?,?)',
+                                  self.pending_stores)
+        self.pending_seen = []
+        self.pending_stores = []
+
+    # call after a COMPLETE crawl of rootdir: if evict is True, drop entries
+    # for files under rootdir that weren't seen this time around
+    def close(self, evict=True):
+        self.flush()
+        if evict:
+            with self.conn:
+                cur = self.conn.execute('DELETE FROM hashes WHERE root=? AND algorithm=? AND seen<?',
+                                        (self.rootdir, self.algorithm, self.run_id))
+                self.n_evicted = cur.rowcount
+        self.conn.close()
+
+    def report(self):
+        n_lookups = self.n_hits + self.n_misses
+        hit_rate = (100.0 * self.n_hits / n_lookups) if n_lookups else 0.0
+        return dict(hits=self.n_hits, misses=self.n_misses,
+                    hit_rate=round(hit_rate, 2), evicted=self.n_evicted)
+
+    def print_report(self, file=sys.stderr):
+        r = self.report()
+        print(f'hash cache: {r["hits"]} hits, {r["misses"]} misses ({r["hit_rate"]}% hit rate), {r["evicted"]} evicted',
+              file=file)
@@ -0,0 +1,309 @@
+# created: 2026-10-18
+# ignore rules shared by create_inventory.py, compare_inventories.py,
+# find_duplicates.py, and containment_test.py
+
+# goal: be FAST!!! -- with hundreds of rules and millions of paths, looping
+# over every rule for every path dominates the running time. instead,
+# compile all rules ONCE (into sets, tuples of suffixes/prefixes, and
+# regexes; see NameMatcher), and decide each directory only once no matter
+# how many files it holds
+
+''' rules come in a few flavors:
+
+- gitignore-style globs, e.g., '*.tmp', 'build/', '/top-level-only',
+  'photos/**/*.raw'
+  - '*' and '?' don't match '/', '**' matches across directories
+  - a glob without a '/' (other than a trailing one) matches the name of a
+    file or directory at any depth; otherwise it's anchored at the root
+  - a trailing '/' only matches directories
+  - anything under an ignored directory is ignored, too
+  - negation ('!pattern') isn't supported
+- directory substrings (the original DEFAULT_IGNORE_DIRS rules), which
+  ignore any directory whose path contains the substring
+- exact filenames
+- file extensions (case-insensitive)
+- 'dirname,extension' pairs, which ignore files with that extension
+  directly inside that directory
+
+a rules file has one rule per line, with '#' comments:
+
+  # globs
+  *.pyc
+  node_modules/
+  # directory substrings, filenames, extensions, and dir+extension pairs
+  dirsubstr:/.dropbox.cache
+  file:Thumbs.db
+  ext:.tmp
+  dirext:pgbovine,.html
+'''
+
+import os
+import re
+import sys
+
+# requires python >= 3.6 for f-strings
+# (NB: compare version_info, since sys.version[:3] is '3.1' on python 3.10+)
+assert sys.version_info >= (3, 6)
+
+# include slashes in dirnames to prevent spurious substring matches
+DEFAULT_IGNORE_DIRS = ['directory-tree-inventory/inventory-files_do-not-add-to-git',
+                       '/.git',
+                       '/node_modules',
+                       '/.dropbox.cache']
+
+DEFAULT_IGNORE_FILENAMES = ['Thumbs.db', 'thumbs.db', '.DS_Store', 'Icon\r'] # 'Icon\r' doesn't print properly anyhow, #weird
+
+DEFAULT_IGNORE_DIREXTS = ['pgbovine,.htm', 'pgbovine,.html']
+
+
+GLOB_SPECIAL_CHARS = '*?['
+
+
+# translates a single glob into regex source, where '*' and '?' don't match
+# '/' but '**' does
+def _glob_to_regex_source(pattern):
+    out = []
+    i = 0
+    n = len(pattern)
+    while i < n:
+        c = pattern[i]
+        if pattern.startswith('**/', i):
+            out.append('(?:.*/)?')
+            i += 3
+        elif pattern.startswith('**', i):
+            out.append('.*')
+            i += 2
+        elif c == '*':
+            out.append('[^/]*')
+            i += 1
+        elif c == '?':
+            out.append('[^/]')
+            i += 1
+        elif c == '[':
+            j = pattern.find(']', i + 2)
+            if j == -1:
+                out.append(re.escape(c))
+                i += 1
+            else:
+                cls = pattern[i+1:j]
+                if cls.startswith('!'):
+                    cls = '^' + cls[1:]
+                out.append('[' + cls.replace('\\', '\\\\') + ']')
+                i = j + 1
+        else:
+            out.append(re.escape(c))
+            i += 1
+    return ''.join(out)
+
+
+# splits one gitignore-style glob into (anchored, pattern, dirs_only), where
+# anchored patterns are matched against the whole path relative to the root
+# and the rest only against a single file or directory name
+def parse_glob(pattern):
+    assert not pattern.startswith('!'), f'negated ignore patterns are not supported: {pattern}'
+    dirs_only = pattern.endswith('/')
+    pattern = pattern.rstrip('/')
+    assert pattern, 'empty ignore pattern'
+    if '/' in pattern:
+        return (True, pattern.lstrip('/'), dirs_only)
+    return (False, pattern, dirs_only)
+
+
+# joins regex sources into a single compiled alternation, or None
+def _compile_alternation(sources):
+    if not sources:
+        return None
+    return re.compile('(?:' + '|'.join(sources) + r')\Z', re.DOTALL)
+
+
+# matches a single name against many name globs at once. instead of one
+# giant regex alternation (which python's backtracking regex engine tries
+# branch by branch, so it gets slower with every rule), sort globs by shape:
+# the common shapes -- exact names, '*.ext', '*suffix', and 'prefix*' --
+# become set lookups and C-level str.endswith/str.startswith calls over
+# tuples, and only the leftovers go into a regex
+class NameMatcher:
+    def __init__(self, globs):
+        exact = set()
+        exts = set()
+        suffixes = []
+        prefixes = []
+        regex_sources = []
+        for g in globs:
+            if not any(c in g for c in GLOB_SPECIAL_CHARS):
+                exact.add(g)
+            elif g[0] == '*' and not any(c in g[1:] for c in GLOB_SPECIAL_CHARS):
+                # '*.ext' matches exactly the names whose last '.' starts '.ext'
+                # (and '*' alone is the suffix '', which matches everything)
+                if len(g) > 1 and g[1] == '.' and '.' not in g[2:]:
+                    exts.add(g[1:])
+                else:
+                    suffixes.append(g[1:])
+            elif g[-1] == '*' and not any(c in g[:-1] for c in GLOB_SPECIAL_CHARS):
+                prefixes.append(g[:-1])
+            else:
+                regex_sources.append(_glob_to_regex_source(g))
+        self.exact = exact
+        self.exts = exts
+        self.suffixes = tuple(suffixes)
+        self.prefixes = tuple(prefixes)
+        self.regex = _compile_alternation(regex_sources)
+
+    def match(self, name):
+        return (name in self.exact or
+                (self.exts and name[name.rfind('.'):] in self.exts) or
+                (self.suffixes and name.endswith(self.suffixes)) or
+                (self.prefixes and name.startswith(self.prefixes)) or
+                (self.regex is not None and self.regex.match(name) is not None))
+
+
+# all ignore rules of one tool run, compiled. call it on a (dirname,
+# filename) pair, or use ignore_dir/ignore_subdir/ignore_file; dirnames are
+# canonical (relative to the root, no leading '/'), like in inventories
+class IgnoreRules:
+    def __init__(self, globs=(), dir_substrings=(), filenames=(), exts=(), direxts=()):
+        self.globs = list(globs)
+        self.dir_substrings = list(dir_substrings)
+        self.filenames = set(filenames)
+        for e in exts:
+            assert e[0] == '.', f"extensions must start with '.': {e}"
+        self.exts = set(e.lower() for e in exts)
+        # each is 'dirname,extension'
+        self.direxts = set()
+        for e in direxts:
+            pair = tuple(e.split(','))
+            assert len(pair) == 2, f"expected 'dirname,extension': {e}"
+            self.direxts.add((pair[0], pair[1].lower()))
+        # so that files in all other directories skip computing extensions
+        self.dirext_dirs = set(d for d, ext in self.direxts)
+
+        # name globs match the last path component; anchored globs match
+        # the whole path, so they go into a regex
+        dir_name_globs = []
+        file_name_globs = []
+        dir_sources = []
+        file_sources = []
+        for g in self.globs:
+            anchored, pattern, dirs_only = parse_glob(g)
+            if anchored:
+                src = _glob_to_regex_source(pattern)
+                dir_sources.append(src)
+                if not dirs_only:
+                    file_sources.append(src)
+            else:
+                dir_name_globs.append(pattern)
+                if not dirs_only:
+                    file_name_globs.append(pattern)
+        self.dir_names = NameMatcher(dir_name_globs) if dir_name_globs else None
+        self.file_names = NameMatcher(file_name_globs) if file_name_globs else None
+        self.dir_regex = _compile_alternation(dir_sources)
+        self.file_regex = _compile_alternation(file_sources)
+        if self.dir_substrings:
+            self.dir_substring_regex = re.compile('|'.join(re.escape(d) for d in self.dir_substrings))
+        else:
+            self.dir_substring_regex = None
+
+        # key: canonical dirname, value: whether it (or any ancestor) is ignored
+        self.dir_cache = {}
+
+    # True if canonical dirname (relative to the root, '' for the root itself)
+    # is ignored, either directly or because one of its ancestors is
+    def ignore_dir(self, dirname):
+        try:
+            return self.dir_cache[dirname]
+        except KeyError:
+            pass
+        if self.dir_substring_regex and self.dir_substring_regex.search(dirname):
+            ret = True
+        elif not dirname:
+            ret = False
+        elif self.dir_names and self.dir_names.match(dirname.rpartition('/')[2]):
+            ret = True
+        elif self.dir_regex and self.dir_regex.match(dirname):
+            ret = True
+        else:
+            ret = self.ignore_dir(dirname.rpartition('/')[0])
+        self.dir_cache[dirname] = ret
+        return ret
+
+    # True if subdirectory name of canonical dirname is ignored, i.e.,
+    # whether to prune it before descending into it
+    def ignore_subdir(self, dirname, name):
+        return self.ignore_dir(dirname + '/' + name if dirname else name)
+
+    def ignore_file(self, dirname, filename):
+        ignored = self.dir_cache.get(dirname)
+        if ignored is None:
+            ignored = self.ignore_dir(dirname)
+        if ignored or filename in self.filenames:
+            return True
+        if self.exts or dirname in self.dirext_dirs:
+            ext = os.path.splitext(filename)[1].lower()
+            if ext in self.exts or (dirname, ext) in self.direxts:
+                return True
+        if self.file_names and self.file_names.match(filename):
+            return True
+        if self.file_regex:
+            path = dirname + '/' + filename if dirname else filename
+            if self.file_regex.match(path):
+                return True
+        return False
+
+    # drop-in replacement for the old should_ignore(e) functions, where e is
+    # a (dirname, filename) pair
+    def __call__(self, e):
+        return self.ignore_file(e[0], e[1])
+
+    def __bool__(self):
+        return bool(self.globs or self.dir_substrings or self.filenames or
+                    self.exts or self.direxts)
+
+    # all rules in rules-file syntax, e.g., for inventory metadata
+    def as_rules_list(self):
+        return (self.globs +
+                ['dirsubstr:' + d for d in self.dir_substrings] +
+                ['file:' + f for f in sorted(self.filenames)] +
+                ['ext:' + e for e in sorted(self.exts)] +
+                ['dirext:' + ','.join(e) for e in sorted(self.direxts)])
+
+
+# parses rules in rules-file syntax (see top of file) into a dict of
+# IgnoreRules constructor arguments
+def parse_rules(lines):
+    ret = dict(globs=[], dir_substrings=[], filenames=[], exts=[], direxts=[])
+    for line in lines:
+        line = line.rstrip('\n')
+        if not line.strip() or line.lstrip().startswith('#'):
+            continue
+        if line.startswith('dirsubstr:'):
+            ret['dir_substrings'].append(line[len('dirsubstr:'):])
+        elif line.startswith('file:'):
+            ret['filenames'].append(line[len('file:'):])
+        elif line.startswith('ext:'):
+            ret['exts'].append(line[len('ext:'):])
+        elif line.startswith('dirext:'):
+            ret['direxts'].append(line[len('dirext:'):])
+        else:
+            ret['globs'].append(line.strip())
+    return ret
+
+
+# builds IgnoreRules from any combination of the command-line style lists
+# and a rules file; if use_defaults is True, the DEFAULT_* lists are
+# included, like compare_inventories.py has always done
+def make_ignore_rules(globs=None, dir_substrings=None, filenames=None, exts=None,
+                      direxts=None, rules_file=None, use_defaults=True):
+    kwargs = dict(globs=list(globs or []),
+                  dir_substrings=list(dir_substrings or []),
+                  filenames=list(filenames or []),
+                  exts=list(exts or []),
+                  direxts=list(direxts or []))
+    if rules_file:
+        with open(rules_file) as f:
+            for k, v in parse_rules(f).items():
+                kwargs[k] += v
+    if use_defaults:
+        kwargs['dir_substrings'] += DEFAULT_IGNORE_DIRS
+        kwargs['filenames'] += DEFAULT_IGNORE_FILENAMES
+        kwargs['direxts'] += DEFAULT_IGNORE_DIREXTS
+    return IgnoreRules(**kwargs)
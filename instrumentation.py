@@ -0,0 +1,224 @@
+# created: 2026-10-18
+# progress reporting, phase timers, and profiling for long-running crawls
+# (create_inventory.py) and the tools that work on their inventories
+
+# goal: find out WHY a run is slow, so we know what to make FAST!!! -- a
+# multi-hour crawl can be bound by metadata calls (listing directories and
+# stat-ing files), by hashing, or by encoding and writing its output, and
+# each of those needs a different fix
+#
+# everything here gets updated at most once per directory (or per hashed
+# file, or per batch of written records), never once per plain file, so
+# that it costs nothing noticeable even when it's always on
+
+import contextlib
+import cProfile
+import heapq
+import io
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+# how many of the slowest directories to remember
+DEFAULT_N_SLOWEST_DIRS = 10
+
+# seconds between progress lines
+DEFAULT_PROGRESS_INTERVAL = 10
+
+# how many functions/allocation sites to print with --profile
+N_PROFILE_LINES = 25
+
+
+def format_bytes(n):
+    for unit in ('B', 'KB', 'MB', 'GB', 'TB'):
+        if n < 1024 or unit == 'TB':
+            return f'{n:.1f} {unit}' if unit != 'B' else f'{n:.0f} B'
+        n /= 1024
+
+
+# counters, per-phase timers, and the slowest directories of one run.
+# safe to update from any thread
+#
+# phases are named by what they spend time on, e.g.:
+#   walk       listing directories (scandir, plus ignore rules)
+#   stat       stat-ing files and making their records
+#   hash       reading and hashing files (on the hash threads)
+#   hash_wait  the crawl waiting for hashes to come back
+#   encode     formatting records as json lines
+#   write      writing (and compressing) them (on the writer thread)
+#   write_wait the crawl waiting for the writer to catch up
+# NB: phases that run on several threads at once add up their busy time,
+# so they can add up to more than the wall time. the *_wait phases show
+# what the crawl itself is stuck on
+class RunStats:
+    def __init__(self, n_slowest_dirs=DEFAULT_N_SLOWEST_DIRS):
+        self.lock = threading.Lock()
+        self.start_time = time.perf_counter()
+        self.end_time = None
+        # key: what got counted (e.g., 'dirs', 'files', 'bytes_hashed')
+        self.counts = Counter()
+        # key: phase name, value: total seconds spent in it
+        self.phase_secs = Counter()
+        # min-heap of (secs, canonical_dirpath) of the slowest directories
+        self.n_slowest_dirs = n_slowest_dirs
+        self.slowest_dirs = []
+        self.cur_dir = None
+        self.max_depth = 0
+
+    def add(self, **counts):
+        with self.lock:
+            self.counts.update(counts)
+
+    def add_secs(self, phase, secs):
+        with self.lock:
+            self.phase_secs[phase] += secs
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_secs(name, time.perf_counter() - t)
+
+    # records that directory canonical_dirpath (with n_files files) took
+    # secs to list and stat
+    def dir_done(self, canonical_dirpath, secs, n_files):
+        depth = canonical_dirpath.count('/') + 1 if canonical_dirpath else 0
+        with self.lock:
+            self.counts['dirs'] += 1
+            self.counts['files'] += n_files
+            self.cur_dir = canonical_dirpath
+            if depth > self.max_depth:
+                self.max_depth = depth
+            if len(self.slowest_dirs) < self.n_slowest_dirs:
+                heapq.heappush(self.slowest_dirs, (secs, canonical_dirpath))
+            elif secs > self.slowest_dirs[0][0]:
+                heapq.heapreplace(self.slowest_dirs, (secs, canonical_dirpath))
+
+    def finish(self):
+        if self.end_time is None:
+            self.end_time = time.perf_counter()
+
+    def elapsed(self):
+        end = self.end_time if self.end_time is not None else time.perf_counter()
+        return end - self.start_time
+
+    # returns a json-able dict of everything so far, e.g., for the
+    # inventory's metadata
+    def as_dict(self):
+        secs = self.elapsed()
+        with self.lock:
+            counts = dict(self.counts)
+            phase_secs = {k: round(v, 3) for k, v in sorted(self.phase_secs.items())}
+            slowest = sorted(self.slowest_dirs, reverse=True)
+            max_depth = self.max_depth
+        ret = dict(wall_secs=round(secs, 3), **counts, max_depth=max_depth,
+                   phase_secs=phase_secs,
+                   slowest_dirs=[dict(dir=d, secs=round(s, 3)) for s, d in slowest])
+        for k in ('dirs', 'files', 'bytes_hashed'):
+            if k in counts and secs > 0:
+                ret[f'{k}_per_sec'] = round(counts[k] / secs)
+        return ret
+
+    def print_report(self, file=sys.stderr):
+        d = self.as_dict()
+        secs = d['wall_secs']
+        counts = ', '.join(f'{d[k]} {k}' for k in sorted(self.counts))
+        depth = f' (max depth {d["max_depth"]})' if 'dirs' in self.counts else ''
+        print(f'stats: {counts or "done"} in {secs}s{depth}', file=file)
+        for phase, phase_secs in d['phase_secs'].items():
+            share = f' ({phase_secs / secs:.0%} of wall time)' if secs > 0 else ''
+            print(f'  {phase:<16} {phase_secs:10.3f}s{share}', file=file)
+        if d['slowest_dirs']:
+            print('  slowest directories:', file=file)
+            for e in d['slowest_dirs']:
+                print(f'    {e["secs"]:8.3f}s  {e["dir"] or "."}', file=file)
+
+
+# prints a progress line for stats to file every interval seconds on a
+# background thread, with rates since the previous line. use it as a
+# context manager, or call start() and stop()
+class ProgressReporter:
+    def __init__(self, stats, interval=DEFAULT_PROGRESS_INTERVAL, file=sys.stderr):
+        self.stats = stats
+        self.interval = interval
+        self.file = file
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.prev_counts = Counter()
+        self.prev_time = stats.start_time
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self.print_line()
+
+    def print_line(self):
+        s = self.stats
+        now = time.perf_counter()
+        with s.lock:
+            counts = Counter(s.counts)
+            cur_dir = s.cur_dir
+            max_depth = s.max_depth
+        secs = now - self.prev_time
+        parts = []
+        for k in sorted(counts):
+            rate = (counts[k] - self.prev_counts[k]) / secs if secs > 0 else 0
+            if k.startswith('bytes'):
+                parts.append(f'{format_bytes(counts[k])} {k[6:]} ({format_bytes(rate)}/s)')
+            else:
+                parts.append(f'{counts[k]} {k} ({rate:.0f}/s)')
+        depth = cur_dir.count('/') + 1 if cur_dir else 0
+        where = f', depth {depth} (max {max_depth}) at {cur_dir or "."}' if cur_dir is not None else ''
+        print(f'progress [{s.elapsed():.0f}s]: {", ".join(parts)}{where}', file=self.file, flush=True)
+        self.prev_counts = counts
+        self.prev_time = now
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+# runs the body of the with statement under cProfile and tracemalloc if
+# filename is given (and does nothing otherwise). afterwards, saves the
+# profile to filename (for pstats, snakeviz, etc.) and prints the functions
+# with the most cumulative time, the biggest allocation sites, and the
+# peak traced memory to file. NB: both make everything run a lot slower,
+# so use the times only relative to each other
+@contextlib.contextmanager
+def profiled(filename=None, file=sys.stderr):
+    if not filename:
+        yield
+        return
+    tracemalloc.start()
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        profiler.dump_stats(filename)
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(N_PROFILE_LINES)
+        print(f'profile (saved to {filename}):', file=file)
+        print(out.getvalue(), file=file)
+        print(f'memory: peak {format_bytes(peak)} traced, {format_bytes(current)} still allocated; top allocation sites:', file=file)
+        for stat in snapshot.statistics('lineno')[:N_PROFILE_LINES]:
+            print(f'  {stat}', file=file)
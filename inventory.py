@@ -0,0 +1,170 @@
+# created: 2026-10-18
+# memory-efficient in-memory representation of a parsed inventory file
+
+# goal: be FAST!!! (and small) -- a 10M-file inventory loaded as one dict
+# per record, plus lists of those dicts in four different indexes, needs
+# tens of GB of RAM. instead, keep every field in a packed parallel array
+# (see binary_inventory.InventoryColumns), store each directory string
+# only once, and only build the indexes that a tool actually asks for
+
+import os
+import sys
+from collections import defaultdict
+from functools import cached_property
+from binary_inventory import InventoryColumns, NO_CRC32
+
+# requires python >= 3.8 for functools.cached_property
+assert sys.version_info >= (3, 8)
+
+
+# lightweight read-only view of row i of an Inventory, which looks enough
+# like the old per-record dicts (record['sz'], record.get('crc32'), etc.)
+# that code written against those keeps working
+class Record:
+    __slots__ = ('inv', 'i')
+
+    KEYS = ('d', 'f', 'e', 'mt', 'sz', 'crc32', 'h')
+
+    def __init__(self, inv, i):
+        self.inv = inv
+        self.i = i
+
+    @property
+    def d(self):
+        return self.inv.dirs[self.inv.dir_ids[self.i]]
+
+    @property
+    def f(self):
+        return self.inv.names[self.inv.name_ids[self.i]]
+
+    @property
+    def e(self):
+        return os.path.splitext(self.f)[1]
+
+    @property
+    def mt(self):
+        return self.inv.mtimes[self.i]
+
+    @property
+    def sz(self):
+        return self.inv.sizes[self.i]
+
+    @property
+    def crc32(self):
+        return self.inv.crc32_at(self.i)
+
+    @property
+    def h(self):
+        return self.inv.hash_at(self.i)
+
+    # like the old dicts, crc32 and h are only 'in' records that have them
+    def __getitem__(self, key):
+        if key not in Record.KEYS:
+            raise KeyError(key)
+        v = getattr(self, key)
+        if v is None:
+            raise KeyError(key)
+        return v
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def as_dict(self):
+        ret = dict(d=self.d, f=self.f, e=self.e, mt=self.mt, sz=self.sz)
+        for k in ('crc32', 'h'):
+            v = getattr(self, k)
+            if v is not None:
+                ret[k] = v
+        return ret
+
+    def __repr__(self):
+        return repr(self.as_dict())
+
+    def __eq__(self, other):
+        if isinstance(other, Record):
+            return self.as_dict() == other.as_dict()
+        return NotImplemented
+
+
+# an entire inventory; rows are files. to look up records, use:
+#
+#   len(inv), inv[i] -> Record, iter(inv) -> Records
+#   inv.by_path: dict of dirname -> dict of filename -> row
+#   inv.by_filesize, inv.by_modtime, inv.by_crc32, inv.by_hash:
+#     dict of key -> list of rows (by_hash uses full-content 'h' hashes if
+#     the inventory has them, otherwise 'crc32' prefix hashes)
+#
+# each by_* index is built the first time it's used, so e.g. a tool that
+# only needs hashes never pays for a path index
+class Inventory(InventoryColumns):
+    def __getitem__(self, i):
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return Record(self, i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield Record(self, i)
+
+    def crc32_at(self, i):
+        if not self.crc32s:
+            return None
+        v = self.crc32s[i]
+        return None if v == NO_CRC32 else v
+
+    def path(self, i):
+        return (self.dirs[self.dir_ids[i]], self.names[self.name_ids[i]])
+
+    # returns the row of file fn in directory dn, or None
+    def lookup(self, dn, fn):
+        names = self.by_path.get(dn)
+        if names is None:
+            return None
+        return names.get(fn)
+
+    # two-level dict, so each directory string is stored only once and each
+    # file only costs one entry in its directory's dict
+    @cached_property
+    def by_path(self):
+        per_dir_id = [{} for d in self.dirs]
+        names = self.names
+        for i, (di, ni) in enumerate(zip(self.dir_ids, self.name_ids)):
+            d = per_dir_id[di]
+            fn = names[ni]
+            assert fn not in d, f'duplicate path: {self.dirs[di]}/{fn}'
+            d[fn] = i
+        return {dn: d for dn, d in zip(self.dirs, per_dir_id) if d}
+
+    def _group_rows(self, keys):
+        ret = defaultdict(list)
+        for i, k in enumerate(keys):
+            if k is not None:
+                ret[k].append(i)
+        return ret
+
+    @cached_property
+    def by_filesize(self):
+        return self._group_rows(self.sizes)
+
+    @cached_property
+    def by_modtime(self):
+        return self._group_rows(self.mtimes)
+
+    @cached_property
+    def by_crc32(self):
+        return self._group_rows(self.crc32_at(i) for i in range(len(self)))
+
+    @cached_property
+    def by_hash(self):
+        if self.hash_bytes is not None:
+            return self._group_rows(self.hash_at(i) for i in range(len(self)))
+        return self.by_crc32
+
+    # either the 'h' or 'crc32' hash of row i, whichever by_hash uses
+    def hash_key(self, i):
+        if self.hash_bytes is not None:
+            return self.hash_at(i)
+        return self.crc32_at(i)
@@ -0,0 +1,313 @@
+# created: 2026-10-18
+# see 'parser' for expected command-line arguments
+
+# goal: be FAST!!! (and small)
+
+''' a space-efficient archive of consecutive inventories of the same
+directory tree, e.g., one per day:
+
+python3 inventory_archive.py add archive-dir inventory-files_do-not-add-to-git/2018-12-01-mba.jsonl
+python3 inventory_archive.py add archive-dir inventory-files_do-not-add-to-git/2018-12-03-mba.jsonl
+python3 inventory_archive.py list archive-dir
+python3 inventory_archive.py get archive-dir 2018-12-01 /tmp/2018-12-01-mba.jsonl
+
+and the daily routine check: crawl the tree (or take an inventory file),
+compare it against the most recently archived inventory, and if you accept
+the changes, archive it as the new most recent one:
+
+python3 inventory_archive.py review archive-dir ~/Dropbox
+
+from one day to the next, almost all records stay the same, so storing a
+full inventory per day mostly stores the same records over and over.
+instead, an archive holds:
+
+- a full BASE snapshot every base_interval entries (and for the first one)
+- for every other entry, only a DELTA against the entry before it: the
+  records that were added or changed, plus the paths that were removed
+
+all files are gzipped .jsonl, sorted in path order (see
+compare_inventories.path_sort_key). to reconstruct an entry, compose the
+(small) deltas since its base into one in memory, then stream the base once
+and merge the composed delta into it. so reconstructing never needs more
+than one pass over one base, no matter how many deltas are involved
+
+reconstructed inventories come out in path order (metadata 'sorted'), and
+without create_inventory.py --record_dirs directory records
+
+layout of an archive directory:
+
+  archive.json                 index: list of entries, oldest first
+  <name>.base.jsonl.gz         metadata line + every record
+  <name>.delta.jsonl.gz        metadata line + changed/added records and
+                               {"d": ..., "f": ..., "removed": true} ones
+'''
+
+import argparse
+import datetime
+import gzip
+import json
+import os
+import sys
+import tempfile
+from binary_inventory import columns_from_records
+from compare_inventories import (iter_inventory_records, iter_sorted_records, path_sort_key,
+                                 merge_join, inventory_hash_algorithm, compare_inventories,
+                                 parse_inventory_file, clean_up_metadata, DEFAULT_SUMMARY_THRESHOLD)
+from create_inventory import iter_inventory
+from inventory import Inventory
+from inventory_io import RecordWriter
+from sort_inventory import sort_inventory
+
+# requires python >= 3.8 for inventory.Inventory
+# (NB: compare version_info, since sys.version[:3] is '3.1' on python 3.10+)
+assert sys.version_info >= (3, 8)
+
+INDEX_FILENAME = 'archive.json'
+
+# store a full base snapshot after this many deltas in a row
+DEFAULT_BASE_INTERVAL = 30
+
+# gzip level 6 compresses .jsonl inventories almost as well as 9 does, but
+# several times faster
+GZIP_LEVEL = 6
+
+# marks paths that a composed delta removes
+REMOVED = object()
+
+
+def _read_index(archive_dir):
+    fn = os.path.join(archive_dir, INDEX_FILENAME)
+    if not os.path.exists(fn):
+        return dict(base_interval=DEFAULT_BASE_INTERVAL, entries=[])
+    with open(fn) as f:
+        return json.load(f)
+
+
+# writes the index atomically, so an interrupted run never leaves behind an
+# index that refers to half-written files
+def _write_index(archive_dir, index):
+    fn = os.path.join(archive_dir, INDEX_FILENAME)
+    with open(fn + '.tmp', 'w') as f:
+        json.dump(index, f, indent=1)
+    os.replace(fn + '.tmp', fn)
+
+
+def _iter_gzip_records(filename):
+    with gzip.open(filename, 'rt') as f:
+        for line in f:
+            yield json.loads(line)
+
+
+def _find_entry(index, name):
+    for i, e in enumerate(index['entries']):
+        if e['name'] == name:
+            return i
+    raise KeyError(f'no archived inventory named {name}')
+
+
+# yields the metadata dict and then the records of archived inventory name
+# (default: the most recent one), in path order
+def iter_archived_inventory(archive_dir, name=None):
+    index = _read_index(archive_dir)
+    entries = index['entries']
+    assert entries, f'{archive_dir} has no archived inventories'
+    i = len(entries) - 1 if name is None else _find_entry(index, name)
+    base_i = i
+    while entries[base_i]['kind'] != 'base':
+        base_i -= 1
+
+    # compose all deltas since the base into one: key is the path, value is
+    # the newest record for it, or REMOVED
+    composed = {}
+    metadata = None
+    for e in entries[base_i+1:i+1]:
+        records = _iter_gzip_records(os.path.join(archive_dir, e['file']))
+        metadata = next(records)
+        for r in records:
+            composed[(r['d'], r['f'])] = REMOVED if r.get('removed') else r
+    delta = sorted(((path_sort_key(*k), r) for k, r in composed.items()),
+                   key=lambda e: e[0])
+    del composed
+
+    base_filename = os.path.join(archive_dir, entries[base_i]['file'])
+    base_records = _iter_gzip_records(base_filename)
+    base_metadata = next(base_records)
+    yield metadata if metadata is not None else base_metadata
+
+    for key, base_data, delta_data in merge_join(iter_sorted_records(base_filename, base_records), delta):
+        if delta_data is None:
+            yield base_data
+        elif delta_data is not REMOVED:
+            yield delta_data
+
+
+# returns the metadata dict and an iterator over (path_sort_key, record) of
+# inventory file filename in path order; sorts it into a temporary file in
+# tmpdir first if it isn't sorted yet
+def _sorted_inventory(filename, tmpdir):
+    records = iter_inventory_records(filename)
+    metadata = next(records)
+    if not metadata.get('sorted'):
+        sorted_filename = os.path.join(tmpdir, 'sorted.jsonl')
+        sort_inventory(filename, sorted_filename)
+        filename = sorted_filename
+        records = iter_inventory_records(filename)
+        metadata = next(records)
+    # per-directory records don't survive sorting (see sort_inventory.py)
+    metadata.pop('record_dirs', None)
+    metadata['sorted'] = True
+    return (metadata, iter_sorted_records(filename, records))
+
+
+def _default_entry_name(metadata):
+    return datetime.datetime.fromtimestamp(metadata['ts']).strftime('%Y-%m-%d')
+
+
+# appends inventory file filename to the archive as its most recent entry
+# (called name, default: its date) and returns the new index entry. it's
+# stored as a delta against the previous entry, unless it's time for a new
+# base (or the hash algorithm changed, which changes every record anyhow)
+def add_to_archive(archive_dir, filename, name=None, base_interval=None):
+    os.makedirs(archive_dir, exist_ok=True)
+    index = _read_index(archive_dir)
+    if base_interval is not None:
+        index['base_interval'] = base_interval
+    entries = index['entries']
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        metadata, new_iter = _sorted_inventory(filename, tmpdir)
+        if name is None:
+            name = _default_entry_name(metadata)
+        assert name not in set(e['name'] for e in entries), f'{name} is already archived'
+
+        n_deltas = 0
+        for e in reversed(entries):
+            if e['kind'] == 'base':
+                break
+            n_deltas += 1
+
+        prev = None
+        if entries and n_deltas < index['base_interval']:
+            prev = iter_archived_inventory(archive_dir)
+            prev_metadata = next(prev)
+            if inventory_hash_algorithm(prev_metadata) != inventory_hash_algorithm(metadata):
+                prev = None
+
+        kind = 'base' if prev is None else 'delta'
+        entry = dict(name=name, kind=kind, file=f'{name}.{kind}.jsonl.gz',
+                     n_files=0, n_added=0, n_removed=0, n_changed=0)
+        out_filename = os.path.join(archive_dir, entry['file'])
+        with gzip.open(out_filename + '.tmp', 'wt', compresslevel=GZIP_LEVEL) as out:
+            out.write(json.dumps(metadata) + '\n')
+            if prev is None:
+                for key, r in new_iter:
+                    entry['n_files'] += 1
+                    out.write(json.dumps(r) + '\n')
+            else:
+                prev_iter = ((path_sort_key(r['d'], r['f']), r) for r in prev)
+                for key, old_data, new_data in merge_join(prev_iter, new_iter):
+                    if new_data is None:
+                        entry['n_removed'] += 1
+                        out.write(json.dumps(dict(d=old_data['d'], f=old_data['f'], removed=True)) + '\n')
+                        continue
+                    entry['n_files'] += 1
+                    if old_data is None:
+                        entry['n_added'] += 1
+                    elif old_data != new_data:
+                        entry['n_changed'] += 1
+                    else:
+                        continue
+                    out.write(json.dumps(new_data) + '\n')
+        os.replace(out_filename + '.tmp', out_filename)
+
+    entry['n_bytes'] = os.path.getsize(out_filename)
+    entries.append(entry)
+    _write_index(archive_dir, index)
+    return entry
+
+
+# writes archived inventory name as a .jsonl inventory file (to stdout if
+# out_filename is None)
+def get_from_archive(archive_dir, name, out_filename=None):
+    out = open(out_filename, 'w') if out_filename else sys.stdout
+    try:
+        for r in iter_archived_inventory(archive_dir, name):
+            out.write(json.dumps(r) + '\n')
+    finally:
+        if out_filename:
+            out.close()
+
+
+# the daily routine check: compares source (a directory tree to crawl, or an
+# inventory file) against the most recent archived inventory, and if the
+# changes get accepted (interactively, unless accept is True), archives it
+# as the new most recent one
+def review(archive_dir, source, accept=False, label=None, name=None,
+           summary_threshold=DEFAULT_SUMMARY_THRESHOLD):
+    records = iter_archived_inventory(archive_dir)
+    metadata = next(records)
+    latest = columns_from_records(metadata, records, cls=Inventory)
+    if label is None:
+        label = metadata['label']
+    clean_up_metadata(latest.metadata)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        if os.path.isdir(source):
+            filename = os.path.join(tmpdir, 'crawl.jsonl')
+            with RecordWriter(filename) as writer:
+                for r in iter_inventory(source, label, hash_algorithm=inventory_hash_algorithm(metadata),
+                                        sort_paths=True):
+                    writer.write(r)
+        else:
+            filename = source
+
+        compare_inventories(latest, parse_inventory_file(filename), summary_threshold)
+        print('---')
+        if not accept:
+            accept = input('accept these changes and archive this inventory? [y/N] ').strip().lower() == 'y'
+        if accept:
+            entry = add_to_archive(archive_dir, filename, name)
+            print(f'archived as {entry["name"]} ({entry["kind"]}, {entry["n_bytes"]} bytes)')
+        else:
+            print('not archived')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    p = subparsers.add_parser('add', help="archive an inventory file as the most recent entry")
+    p.add_argument("archive_dir", help="archive directory (gets created if needed)")
+    p.add_argument("inventory_file", help="inventory file to archive")
+    p.add_argument("--name", help="name of the new entry (default: the inventory's date, e.g., 2018-12-01)")
+    p.add_argument("--base_interval", type=int,
+                   help=f"store a full base snapshot after this many deltas in a row (default: {DEFAULT_BASE_INTERVAL})")
+
+    p = subparsers.add_parser('get', help="reconstruct an archived inventory")
+    p.add_argument("archive_dir", help="archive directory")
+    p.add_argument("name", help="name of the entry to reconstruct")
+    p.add_argument("out_file", nargs='?', help=".jsonl inventory file to write (default: stdout)")
+
+    p = subparsers.add_parser('list', help="list all archived inventories")
+    p.add_argument("archive_dir", help="archive directory")
+
+    p = subparsers.add_parser('review', help="compare a tree or inventory file against the most recent archived inventory, and archive it if you accept the changes")
+    p.add_argument("archive_dir", help="archive directory")
+    p.add_argument("source", help="directory tree to crawl, or inventory file")
+    p.add_argument("--yes", action="store_true", help="accept the changes without asking")
+    p.add_argument("--label", help="label for the new inventory when crawling (default: the archived one's)")
+    p.add_argument("--name", help="name of the new entry (default: the inventory's date, e.g., 2018-12-01)")
+    p.add_argument("--summary_threshold", type=int, default=DEFAULT_SUMMARY_THRESHOLD,
+                   help="summarize a directory when it has more than N files")
+
+    args = parser.parse_args()
+    if args.command == 'add':
+        entry = add_to_archive(args.archive_dir, args.inventory_file, args.name, args.base_interval)
+        print(entry)
+    elif args.command == 'get':
+        get_from_archive(args.archive_dir, args.name, args.out_file)
+    elif args.command == 'list':
+        for e in _read_index(args.archive_dir)['entries']:
+            print(f'{e["name"]}  {e["kind"]:5}  {e["n_files"]} files  +{e["n_added"]} -{e["n_removed"]} ~{e["n_changed"]}  {e["n_bytes"]} bytes')
+    else:
+        review(args.archive_dir, args.source, args.yes, args.label, args.name, args.summary_threshold)
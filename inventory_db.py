@@ -0,0 +1,480 @@
+# created: 2026-10-18
+# see 'parser' for expected command-line arguments
+
+# goal: be FAST!!! -- for repeated questions about the same snapshots,
+# parsing a whole inventory (and rebuilding its indexes) every time costs
+# seconds to minutes per question. importing it into an indexed sqlite
+# database once makes each question a query that takes milliseconds
+
+''' imports inventory files into an indexed sqlite database, and answers
+questions about them with set-based queries:
+
+python3 inventory_db.py import inv.db inventory-files_do-not-add-to-git/2018-12-01-mba.jsonl
+python3 inventory_db.py import inv.db inventory-files_do-not-add-to-git/2018-12-03-mba.jsonl --name new
+python3 inventory_db.py list inv.db
+python3 inventory_db.py files inv.db 2018-12-01 --size 1048576
+python3 inventory_db.py files inv.db 2018-12-01 --under Documents/taxes --ext .pdf
+python3 inventory_db.py compare inv.db 2018-12-01 new --under Documents
+python3 inventory_db.py duplicates inv.db new
+python3 inventory_db.py containment inv.db 2018-12-01 new
+
+each imported inventory is a named SNAPSHOT (default name: its label and
+date). queries that need file contents (duplicates, and compare/containment
+by contents) use the inventory's hashes, so import inventories made with
+create_inventory.py --checksum or --hash for those. ignore rules (the same
+defaults as compare_inventories.py, plus --ignore and --ignore_rules) get
+applied to query results, not at import, so that changing them doesn't
+need a re-import
+
+tables:
+
+  snapshots  id, name, metadata (json), source file, import time, n_files
+  dirs       id, path -- each distinct directory stored only once, shared
+             by all snapshots
+  files      snapshot, dir_id, name, ext, size, mtime, hash (the 'h' hash,
+             or the 'crc32' one for crc32-prefix inventories)
+
+paths, names, and extensions are stored as BLOBs of their utf-8 bytes
+(with 'surrogatepass', like binary_inventory.py), since names that aren't
+valid utf-8 come out of os.scandir as surrogate-escaped strs, which sqlite
+TEXT can't hold
+
+'everything under directory D' is a range scan over dirs.path: D itself,
+plus all paths between 'D/' and 'D0' ('0' being the character right after
+'/')
+'''
+
+import argparse
+import datetime
+import json
+import os
+import sqlite3
+import sys
+import time
+from collections import defaultdict
+from compare_inventories import (iter_inventory_records, inventory_hash_algorithm, create_dirtree,
+                                 pretty_print_dirtree, plain_repr, DEFAULT_SUMMARY_THRESHOLD)
+from file_hashing import hash_record_key
+from ignore_rules import make_ignore_rules
+
+# requires python >= 3.7 for datetime.fromisoformat
+# (NB: compare version_info, since sys.version[:3] is '3.1' on python 3.10+)
+assert sys.version_info >= (3, 7)
+
+# how many records to insert per executemany call
+INSERT_BATCH_SIZE = 10000
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS snapshots (
+  id INTEGER PRIMARY KEY, name TEXT UNIQUE, metadata TEXT, source TEXT,
+  imported REAL, n_files INTEGER);
+CREATE TABLE IF NOT EXISTS dirs (
+  id INTEGER PRIMARY KEY, path BLOB UNIQUE);
+CREATE TABLE IF NOT EXISTS files (
+  snapshot INTEGER, dir_id INTEGER, name BLOB, ext BLOB, size INTEGER,
+  mtime REAL, hash,
+  PRIMARY KEY (snapshot, dir_id, name)) WITHOUT ROWID;
+'''
+
+# secondary indexes; they get (re)created after each bulk import, since
+# filling them as we go makes importing several times slower
+# (separate statements, since executescript() would COMMIT the import's
+# transaction first)
+INDEXES = (
+    'CREATE INDEX IF NOT EXISTS files_by_size_hash ON files (snapshot, size, hash)',
+    'CREATE INDEX IF NOT EXISTS files_by_name_size ON files (snapshot, name, size)',
+    'CREATE INDEX IF NOT EXISTS files_by_ext ON files (snapshot, ext)',
+    'CREATE INDEX IF NOT EXISTS files_by_mtime ON files (snapshot, mtime)',
+)
+
+# bumped whenever the schema changes incompatibly
+SCHEMA_VERSION = 1
+
+# dir ids of directory :under and everything below it (see _under_params)
+UNDER_DIR_IDS = '''
+SELECT id FROM dirs WHERE path = :under OR (path >= :under_lo AND path < :under_hi)
+'''
+
+
+# a str (path, filename, or extension) as stored in the database, and back
+def _to_db(s):
+    return s.encode('utf-8', 'surrogatepass')
+
+def _from_db(b):
+    return b.decode('utf-8', 'surrogatepass')
+
+
+# query parameters for UNDER_DIR_IDS
+def _under_params(under):
+    under = _to_db(under)
+    return dict(under=under, under_lo=under + b'/', under_hi=under + b'0')
+
+
+# a row of query results for one file
+def _file_dict(dirname, name, size, mtime, h=None):
+    return dict(d=_from_db(dirname), f=_from_db(name), sz=size, mt=mtime, h=h)
+
+
+class InventoryDB:
+    # filename: sqlite database file (created if it doesn't exist)
+    def __init__(self, filename):
+        self.conn = sqlite3.connect(filename)
+        # everything in here can be re-imported from the inventory files,
+        # so trade durability for speed
+        self.conn.execute('PRAGMA synchronous=OFF')
+        version = self.conn.execute('PRAGMA user_version').fetchone()[0]
+        if version == 0:
+            assert self.conn.execute("SELECT 1 FROM sqlite_master WHERE name='files'").fetchone() is None, \
+                f'{filename} is from an older version of inventory_db.py; delete it and re-import'
+            self.conn.executescript(SCHEMA)
+            self.conn.execute(f'PRAGMA user_version={SCHEMA_VERSION}')
+        else:
+            assert version == SCHEMA_VERSION, \
+                f'{filename} is from another version of inventory_db.py; delete it and re-import'
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    # returns (snapshot id, metadata dict) of snapshot name
+    def snapshot(self, name):
+        row = self.conn.execute('SELECT id, metadata FROM snapshots WHERE name=?', (name,)).fetchone()
+        assert row is not None, f'no snapshot named {name}'
+        return (row[0], json.loads(row[1]))
+
+    # returns a list of dicts with the name, source, import time, number of
+    # files, and metadata of every snapshot, oldest import first
+    def snapshots(self):
+        ret = []
+        for name, metadata, source, imported, n_files in self.conn.execute(
+                'SELECT name, metadata, source, imported, n_files FROM snapshots ORDER BY imported'):
+            ret.append(dict(name=name, source=source, imported=imported, n_files=n_files,
+                            metadata=json.loads(metadata)))
+        return ret
+
+    # imports inventory file filename (.jsonl, compressed, or binary) as
+    # snapshot name (default: its label and date, e.g., mba-2018-12-01),
+    # replacing an existing snapshot of that name only if replace is True.
+    # returns the name
+    def import_inventory(self, filename, name=None, replace=False):
+        records = iter_inventory_records(filename)
+        metadata = next(records)
+        if name is None:
+            date = datetime.datetime.fromtimestamp(metadata['ts']).strftime('%Y-%m-%d')
+            name = f'{metadata["label"]}-{date}'
+        hash_algorithm = inventory_hash_algorithm(metadata)
+        hash_key = hash_record_key(hash_algorithm) if hash_algorithm else None
+
+        conn = self.conn
+        with conn:
+            if replace:
+                self._drop(name)
+            assert conn.execute('SELECT 1 FROM snapshots WHERE name=?', (name,)).fetchone() is None, \
+                f'{name} already exists (use --replace to replace it)'
+            snapshot_id = conn.execute('INSERT INTO snapshots (name, source, imported) VALUES (?,?,?)',
+                                       (name, os.path.abspath(filename), time.time())).lastrowid
+
+            # key: dir path, value: dir id
+            dir_ids = {_from_db(path): i for path, i in conn.execute('SELECT path, id FROM dirs')}
+
+            def rows():
+                for r in records:
+                    if 'dir' in r: # create_inventory.py --record_dirs records
+                        continue
+                    d = r['d']
+                    dir_id = dir_ids.get(d)
+                    if dir_id is None:
+                        dir_id = dir_ids[d] = conn.execute('INSERT INTO dirs (path) VALUES (?)', (_to_db(d),)).lastrowid
+                    yield (snapshot_id, dir_id, _to_db(r['f']), _to_db(r['e']), r['sz'], r['mt'],
+                           r.get(hash_key) if hash_key else None)
+
+            n_files = 0
+            batch = []
+            for row in rows():
+                batch.append(row)
+                if len(batch) >= INSERT_BATCH_SIZE:
+                    conn.executemany('INSERT INTO files VALUES (?,?,?,?,?,?,?)', batch)
+                    n_files += len(batch)
+                    batch = []
+            conn.executemany('INSERT INTO files VALUES (?,?,?,?,?,?,?)', batch)
+            n_files += len(batch)
+
+            # (only now, since iter_inventory_records merges a trailing
+            # create_inventory.py --stats record into the metadata)
+            conn.execute('UPDATE snapshots SET metadata=?, n_files=? WHERE id=?',
+                         (json.dumps(metadata), n_files, snapshot_id))
+            for q in INDEXES:
+                conn.execute(q)
+        conn.execute('ANALYZE')
+        return name
+
+    def _drop(self, name):
+        row = self.conn.execute('SELECT id FROM snapshots WHERE name=?', (name,)).fetchone()
+        if row is None:
+            return False
+        self.conn.execute('DELETE FROM files WHERE snapshot=?', row)
+        self.conn.execute('DELETE FROM snapshots WHERE id=?', row)
+        return True
+
+    # deletes snapshot name (its directories stay, for other snapshots)
+    def drop(self, name):
+        with self.conn:
+            assert self._drop(name), f'no snapshot named {name}'
+
+    # returns the hash algorithm that both snapshots (with metadata a_meta
+    # and b_meta) were hashed with, or None if they weren't hashed the same
+    # way, which means their hashes can't be compared
+    @staticmethod
+    def _common_hash(a_meta, b_meta):
+        a = inventory_hash_algorithm(a_meta)
+        return a if a is not None and a == inventory_hash_algorithm(b_meta) else None
+
+    # yields a dict (d, f, sz, mt, h) for every file of snapshot name that
+    # matches all of the given conditions: exactly size bytes, at least
+    # min_size bytes, extension ext (e.g., '.pdf'), in directory under or
+    # below it, modified at or after modified_after (a unix timestamp),
+    # in path order
+    def files(self, name, size=None, min_size=None, ext=None, under='', modified_after=None):
+        snapshot_id = self.snapshot(name)[0]
+        conds = ['f.snapshot = :snapshot']
+        if size is not None:
+            conds.append('f.size = :size')
+        if min_size is not None:
+            conds.append('f.size >= :min_size')
+        if ext is not None:
+            conds.append('f.ext = :ext')
+        if under:
+            conds.append(f'f.dir_id IN ({UNDER_DIR_IDS})')
+        if modified_after is not None:
+            conds.append('f.mtime >= :modified_after')
+        q = f'''SELECT d.path, f.name, f.size, f.mtime, f.hash FROM files f JOIN dirs d ON d.id = f.dir_id
+                WHERE {' AND '.join(conds)} ORDER BY d.path, f.name'''
+        params = dict(snapshot=snapshot_id, size=size, min_size=min_size,
+                      ext=_to_db(ext) if ext is not None else None,
+                      modified_after=modified_after, **_under_params(under))
+        for row in self.conn.execute(q, params):
+            yield _file_dict(*row)
+
+    # yields (kind, old, new) for every file in directory under (default:
+    # everywhere) that differs between snapshots old_name and new_name,
+    # where kind is 'only_old', 'only_new', or 'changed', and old and new
+    # are dicts like files() yields (or None). like compare_inventories.py,
+    # a file counts as changed if its size changed; and if both snapshots
+    # were hashed the same way, also if its hash changed. ignore_rules works
+    # like for duplicates()
+    def compare(self, old_name, new_name, under='', ignore_rules=None):
+        old_id, old_meta = self.snapshot(old_name)
+        new_id, new_meta = self.snapshot(new_name)
+        if ignore_rules is None:
+            ignore_rules = make_ignore_rules()
+        params = dict(old=old_id, new=new_id, **_under_params(under))
+        use_hash = self._common_hash(old_meta, new_meta) is not None
+        under_cond = f'AND f.dir_id IN ({UNDER_DIR_IDS})' if under else ''
+
+        for kind, a, b in (('only_old', 'old', 'new'), ('only_new', 'new', 'old')):
+            q = f'''SELECT d.path, f.name, f.size, f.mtime, f.hash FROM files f JOIN dirs d ON d.id = f.dir_id
+                    WHERE f.snapshot = :{a} {under_cond}
+                      AND NOT EXISTS (SELECT 1 FROM files g WHERE g.snapshot = :{b}
+                                      AND g.dir_id = f.dir_id AND g.name = f.name)
+                    ORDER BY d.path, f.name'''
+            for row in self.conn.execute(q, params):
+                r = _file_dict(*row)
+                if not ignore_rules.ignore_file(r['d'], r['f']):
+                    yield (kind, r, None) if kind == 'only_old' else (kind, None, r)
+
+        hash_cond = ' OR f.hash IS NOT g.hash' if use_hash else ''
+        q = f'''SELECT d.path, f.name, f.size, f.mtime, f.hash, g.size, g.mtime, g.hash
+                FROM files f JOIN files g ON g.snapshot = :new AND g.dir_id = f.dir_id AND g.name = f.name
+                JOIN dirs d ON d.id = f.dir_id
+                WHERE f.snapshot = :old {under_cond}
+                  AND (f.size != g.size{hash_cond})
+                ORDER BY d.path, f.name'''
+        for dn, fn, sz, mt, h, new_sz, new_mt, new_h in self.conn.execute(q, params):
+            dn = _from_db(dn)
+            fn = _from_db(fn)
+            if ignore_rules.ignore_file(dn, fn):
+                continue
+            yield ('changed', _file_dict(dn, fn, sz, mt, h), _file_dict(dn, fn, new_sz, new_mt, new_h))
+
+    # returns a list of groups of duplicate files (dicts like files()
+    # yields) in snapshot name: files with the same size and hash, at least
+    # min_size bytes, and not ignored by ignore_rules (an
+    # ignore_rules.IgnoreRules; default: the default rules). like
+    # find_duplicates.py, groups with the most reclaimable bytes come first.
+    # NB: this only trusts the inventory's hashes and never reads any files,
+    # so crc32-prefix hashes can give false positives (find_duplicates.py
+    # double-checks those)
+    def duplicates(self, name, min_size=1, ignore_rules=None):
+        snapshot_id, metadata = self.snapshot(name)
+        assert inventory_hash_algorithm(metadata), \
+            f'{name} has no hashes; import an inventory made with --checksum or --hash, or use find_duplicates.py'
+        if ignore_rules is None:
+            ignore_rules = make_ignore_rules()
+
+        q = '''SELECT d.path, f.name, f.size, f.mtime, f.hash FROM files f JOIN dirs d ON d.id = f.dir_id
+               JOIN (SELECT size, hash FROM files WHERE snapshot = :snapshot AND size >= :min_size
+                     AND hash IS NOT NULL GROUP BY size, hash HAVING COUNT(*) > 1) g
+                 ON f.size = g.size AND f.hash = g.hash
+               WHERE f.snapshot = :snapshot
+               ORDER BY f.size, f.hash, d.path, f.name'''
+        groups = defaultdict(list)
+        for row in self.conn.execute(q, dict(snapshot=snapshot_id, min_size=min_size)):
+            r = _file_dict(*row)
+            if not ignore_rules.ignore_file(r['d'], r['f']):
+                groups[(r['sz'], r['h'])].append(r)
+        ret = [g for g in groups.values() if len(g) > 1]
+        ret.sort(key=lambda g: (-g[0]['sz'] * (len(g) - 1), g[0]['d'], g[0]['f']))
+        return ret
+
+    # yields (as dicts like files() yields) every file of snapshot
+    # needle_name that's nowhere in snapshot haystack_name: like
+    # containment_test.py, matched by size and hash if both snapshots were
+    # hashed the same way, else by basename and size. ignore_rules works
+    # like for duplicates()
+    def missing(self, needle_name, haystack_name, ignore_rules=None):
+        needle_id, needle_meta = self.snapshot(needle_name)
+        haystack_id, haystack_meta = self.snapshot(haystack_name)
+        if ignore_rules is None:
+            ignore_rules = make_ignore_rules()
+
+        by_name_size = 'NOT EXISTS (SELECT 1 FROM files g WHERE g.snapshot = :haystack AND g.name = f.name AND g.size = f.size)'
+        if self._common_hash(needle_meta, haystack_meta) is not None:
+            # (like containment_test.py, needle files without a hash fall
+            # back to matching by basename and size)
+            by_hash = 'NOT EXISTS (SELECT 1 FROM files g WHERE g.snapshot = :haystack AND g.size = f.size AND g.hash = f.hash)'
+            not_found = f'{by_hash} AND (f.hash IS NOT NULL OR {by_name_size})'
+        else:
+            # (only worth a warning if both have hashes, just not comparable ones)
+            needle_hash = inventory_hash_algorithm(needle_meta)
+            haystack_hash = inventory_hash_algorithm(haystack_meta)
+            if needle_hash and haystack_hash and needle_hash != haystack_hash:
+                print(f'WARNING: {needle_name} hashed with {needle_hash} but {haystack_name} with {haystack_hash}, so only matching files by basename and size',
+                      file=sys.stderr)
+            not_found = by_name_size
+        q = f'''SELECT d.path, f.name, f.size, f.mtime, f.hash FROM files f JOIN dirs d ON d.id = f.dir_id
+                WHERE f.snapshot = :needle AND {not_found}
+                ORDER BY d.path, f.name'''
+        for row in self.conn.execute(q, dict(needle=needle_id, haystack=haystack_id)):
+            r = _file_dict(*row)
+            if not ignore_rules.ignore_file(r['d'], r['f']):
+                yield r
+
+
+def _size_modtime(r):
+    return plain_repr(dict(size=r['sz'], modtime=r['mt']))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    def add_db_arg(p):
+        p.add_argument("db_file", help="sqlite database file (gets created if needed)")
+
+    def add_ignore_args(p):
+        p.add_argument("--ignore", nargs='+', dest="ignore_globs",
+                       help="also ignore paths matching the following gitignore-style globs: <list>")
+        p.add_argument("--ignore_rules", help="read more ignore rules from this file (see ignore_rules.py for its format)")
+
+    p = subparsers.add_parser('import', help="import an inventory file as a snapshot")
+    add_db_arg(p)
+    p.add_argument("inventory_file", help="inventory file to import")
+    p.add_argument("--name", help="name of the snapshot (default: the inventory's label and date, e.g., mba-2018-12-01)")
+    p.add_argument("--replace", action="store_true", help="replace an existing snapshot of that name")
+
+    p = subparsers.add_parser('list', help="list all snapshots")
+    add_db_arg(p)
+
+    p = subparsers.add_parser('drop', help="delete a snapshot")
+    add_db_arg(p)
+    p.add_argument("name", help="snapshot to delete")
+
+    p = subparsers.add_parser('files', help="list the files of a snapshot that match all of the given conditions")
+    add_db_arg(p)
+    p.add_argument("name", help="snapshot")
+    p.add_argument("--size", type=int, help="exactly this many bytes")
+    p.add_argument("--min_size", type=int, help="at least this many bytes")
+    p.add_argument("--ext", help="with this file extension, e.g., .pdf")
+    p.add_argument("--under", default='', help="in this directory (relative to the inventory's root) or below it")
+    p.add_argument("--modified_after", help="modified at or after this date/time (ISO format, e.g., 2018-12-01)")
+
+    p = subparsers.add_parser('compare', help="compare two snapshots, like compare_inventories.py")
+    add_db_arg(p)
+    p.add_argument("old", help="older snapshot")
+    p.add_argument("new", help="newer snapshot")
+    p.add_argument("--under", default='', help="only compare this directory (relative to the inventory's root) and below it")
+    add_ignore_args(p)
+
+    p = subparsers.add_parser('duplicates', help="find duplicate files in a snapshot by their hashes, like find_duplicates.py --no_read")
+    add_db_arg(p)
+    p.add_argument("name", help="snapshot")
+    p.add_argument("--min_size", type=int, default=1,
+                   help="ignore files smaller than this many bytes (default skips empty files)")
+    add_ignore_args(p)
+
+    p = subparsers.add_parser('containment', help="find the files of one snapshot that are nowhere in another, like containment_test.py")
+    add_db_arg(p)
+    p.add_argument("needle", help="snapshot whose files to look for")
+    p.add_argument("haystack", help="snapshot to look for them in")
+    p.add_argument("--summary_threshold", type=int, default=DEFAULT_SUMMARY_THRESHOLD,
+                   help="summarize a directory when it has more than N missing files")
+    add_ignore_args(p)
+
+    args = parser.parse_args()
+    ignore_rules = None
+    if args.command in ('compare', 'duplicates', 'containment'):
+        ignore_rules = make_ignore_rules(globs=args.ignore_globs, rules_file=args.ignore_rules)
+
+    with InventoryDB(args.db_file) as db:
+        if args.command == 'import':
+            name = db.import_inventory(args.inventory_file, args.name, args.replace)
+            print(f'imported {args.inventory_file} as {name}')
+        elif args.command == 'list':
+            for s in db.snapshots():
+                imported = datetime.datetime.fromtimestamp(s['imported']).strftime('%Y-%m-%d %H:%M:%S')
+                print(f'{s["name"]}  {s["n_files"]} files  {s["metadata"]["rootdir"]}  (imported {imported} from {s["source"]})')
+        elif args.command == 'drop':
+            db.drop(args.name)
+        elif args.command == 'files':
+            modified_after = None
+            if args.modified_after:
+                modified_after = datetime.datetime.fromisoformat(args.modified_after).timestamp()
+            n = 0
+            for r in db.files(args.name, args.size, args.min_size, args.ext, args.under, modified_after):
+                n += 1
+                print(f'{os.path.join(r["d"], r["f"])}    {_size_modtime(r)}')
+            print(f'{n} files')
+        elif args.command == 'compare':
+            counts = defaultdict(int)
+            for kind, old, new in db.compare(args.old, args.new, args.under, ignore_rules):
+                r = old or new
+                counts[kind] += 1
+                path = os.path.join(r['d'], r['f'])
+                if kind == 'changed':
+                    print(f'changed: {path}    {new["sz"] - old["sz"]:+} bytes')
+                else:
+                    print(f'only in {kind[5:]}: {path}    {_size_modtime(r)}')
+            print('---')
+            print(f'{counts["changed"]} changed, {counts["only_old"]} only in old, {counts["only_new"]} only in new')
+        elif args.command == 'duplicates':
+            groups = db.duplicates(args.name, args.min_size, ignore_rules)
+            total_reclaimable = 0
+            for g in groups:
+                r = g[0]['sz'] * (len(g) - 1)
+                total_reclaimable += r
+                print(f'[{len(g)} copies of {g[0]["sz"]} bytes, {r} bytes reclaimable]')
+                for e in g:
+                    print(os.path.join(e['d'], e['f']))
+                print()
+            print(f'{len(groups)} groups of duplicates, {total_reclaimable} bytes reclaimable in total')
+        else:
+            missing = [dict(dirs=r['d'].split('/'), fn=r['f'], size=r['sz'], modtime=r['mt'])
+                       for r in db.missing(args.needle, args.haystack, ignore_rules)]
+            if missing:
+                pretty_print_dirtree(create_dirtree(missing), args.summary_threshold, plain_repr)
+            print(f'{len(missing)} files of {args.needle} are nowhere in {args.haystack}')
@@ -0,0 +1,313 @@
+# created: 2026-10-18
+# fast writing (and compression-aware reading) of .jsonl inventory files
+
+# goal: be FAST!!! -- on a fast local SSD, a crawl spends a large share of
+# its time on print(json.dumps(data)) for every single file: generic JSON
+# encoding, then a write through the text layer of sys.stdout. instead:
+#
+# - format records with our fixed schema directly, using the same C string
+#   escaper that json uses, so the output is byte-for-byte what json.dumps
+#   would have produced
+# - batch thousands of lines into one big write
+# - write (and optionally compress) on a background thread, so neither
+#   blocks the crawl (zlib, bz2, and lzma all release the GIL while they
+#   compress)
+
+import bz2
+import gzip
+import io
+import json
+import lzma
+import os
+import queue
+import sys
+import threading
+import time
+from json.encoder import encode_basestring_ascii
+
+# compression name -> (file extension, class that wraps a binary file)
+COMPRESSIONS = {'gzip': ('.gz', gzip.GzipFile),
+                'bz2': ('.bz2', bz2.BZ2File),
+                'xz': ('.xz', lzma.LZMAFile)}
+
+# magic bytes at the start of each kind of compressed file
+COMPRESSION_MAGIC = {'gzip': b'\x1f\x8b',
+                     'bz2': b'BZh',
+                     'xz': b'\xfd7zXZ\x00'}
+
+# on-the-fly compression should keep up with the crawl: gzip level 1 runs
+# ~3x faster than the default level 6 (and faster than we can produce
+# records) for ~10% bigger files, and xz preset 0 runs several times faster
+# than the default preset 6 for ~3% bigger files. bz2 is slow at any level
+COMPRESSION_KWARGS = {'gzip': dict(compresslevel=1),
+                      'bz2': dict(compresslevel=9),
+                      'xz': dict(preset=0)}
+
+# number of records per write
+DEFAULT_BATCH_RECORDS = 4096
+
+# max number of batches waiting for the background writer thread
+DEFAULT_QUEUE_SIZE = 16
+
+
+# returns the name of the compression that filename's extension implies, or None
+def compression_for_filename(filename):
+    for name, (ext, cls) in COMPRESSIONS.items():
+        if filename.endswith(ext):
+            return name
+    return None
+
+
+# returns the name of the compression that filename's contents use, or None
+def detect_compression(filename):
+    with open(filename, 'rb') as f:
+        head = f.read(8)
+    for name, magic in COMPRESSION_MAGIC.items():
+        if head.startswith(magic):
+            return name
+    return None
+
+
+# a trailing record with create_inventory.py --stats's final stats starts
+# with this (every other record starts with '{"d": ' or '{"dir": ')
+STATS_LINE_PREFIX = '{"stats": '
+
+
+# a sharded inventory's manifest (see sharded_crawl.py) starts with this
+MANIFEST_PREFIX = b'{"manifest": '
+
+
+# opens a .jsonl inventory file for reading text, decompressing on the fly
+# if it's compressed
+def open_inventory_file(filename):
+    compression = detect_compression(filename)
+    if compression is None:
+        return open(filename)
+    cls = COMPRESSIONS[compression][1]
+    return io.TextIOWrapper(cls(filename, 'rb'))
+
+
+# yields the metadata dict and then one dict per record of an open .jsonl
+# inventory file f. a trailing stats record (see create_inventory.py
+# --stats) doesn't get yielded but merged into the metadata dict, as
+# 'stats', so it's there once all records have been read
+def iter_jsonl_records(f):
+    line = f.readline()
+    if not line:
+        return
+    metadata = json.loads(line)
+    yield metadata
+    for line in f:
+        if line.startswith(STATS_LINE_PREFIX):
+            metadata['stats'] = json.loads(line)['stats']
+            continue
+        yield json.loads(line)
+
+
+def is_manifest(filename):
+    with open(filename, 'rb') as f:
+        return f.read(len(MANIFEST_PREFIX)) == MANIFEST_PREFIX
+
+
+# reads the manifest of a sharded inventory; segment filenames in it are
+# relative to the manifest's own directory
+def read_manifest(filename):
+    with open(filename) as f:
+        return json.load(f)
+
+
+# yields the metadata dict and then one dict per record of a sharded
+# inventory (see sharded_crawl.py), as if it were one big inventory file:
+# the manifest's combined metadata, then every segment's records in order
+def iter_manifest_records(filename):
+    manifest = read_manifest(filename)
+    yield manifest['metadata']
+    segment_dir = os.path.dirname(filename)
+    for seg in manifest['segments']:
+        with open_inventory_file(os.path.join(segment_dir, seg['file'])) as f:
+            records = iter_jsonl_records(f)
+            next(records, None) # skip the segment's own metadata
+            yield from records
+
+
+# yields the metadata dict and then one dict per record of a .jsonl
+# inventory file (plain or compressed) or of a sharded inventory's manifest
+def iter_jsonl_inventory(filename):
+    if is_manifest(filename):
+        yield from iter_manifest_records(filename)
+    else:
+        with open_inventory_file(filename) as f:
+            yield from iter_jsonl_records(f)
+
+
+_float_repr = float.__repr__
+_int_repr = int.__repr__
+
+
+# json.dumps of a number (anything else goes through json.dumps itself)
+def _format_number(v):
+    if v.__class__ is float:
+        if v - v == 0: # i.e., neither NaN nor +/-inf
+            return _float_repr(v)
+        if v != v:
+            return 'NaN'
+        return 'Infinity' if v > 0 else '-Infinity'
+    if v.__class__ is int:
+        return _int_repr(v)
+    return json.dumps(v)
+
+
+# (the common case of a finite float modtime and an int size is inlined)
+def _format_file_prefix(r):
+    mt = r['mt']
+    sz = r['sz']
+    return (f'{{"d": {encode_basestring_ascii(r["d"])}, "f": {encode_basestring_ascii(r["f"])}, '
+            f'"e": {encode_basestring_ascii(r["e"])}, '
+            f'"mt": {_float_repr(mt) if mt.__class__ is float and mt - mt == 0 else _format_number(mt)}, '
+            f'"sz": {_int_repr(sz) if sz.__class__ is int else _format_number(sz)}')
+
+
+def _format_file_record(r):
+    return _format_file_prefix(r) + '}'
+
+
+def _format_crc32_record(r):
+    return f'{_format_file_prefix(r)}, "crc32": {_format_number(r["crc32"])}}}'
+
+
+def _format_hash_record(r):
+    return f'{_format_file_prefix(r)}, "h": {encode_basestring_ascii(r["h"])}}}'
+
+
+def _format_dir_record(r):
+    return f'{{"dir": {encode_basestring_ascii(r["dir"])}, "mt": {_format_number(r["mt"])}}}'
+
+
+# key: tuple of a record's keys in order, value: formatter for that schema
+_FORMATTERS = {('d', 'f', 'e', 'mt', 'sz'): _format_file_record,
+               ('d', 'f', 'e', 'mt', 'sz', 'crc32'): _format_crc32_record,
+               ('d', 'f', 'e', 'mt', 'sz', 'h'): _format_hash_record,
+               ('dir', 'mt'): _format_dir_record}
+
+
+# returns exactly what json.dumps(r) would, but much faster for the record
+# schemas that create_inventory.py produces
+def format_record(r):
+    fmt = _FORMATTERS.get(tuple(r))
+    if fmt is not None:
+        try:
+            return fmt(r)
+        except TypeError: # a value of an unexpected type, e.g., a non-str 'd'
+            pass
+    return json.dumps(r)
+
+
+# writes records (dicts) as .jsonl lines to filename (default: stdout),
+# compressed with compression (one of COMPRESSIONS; by default implied by
+# filename's extension, if any). use it as a context manager, or call
+# close() at the end
+#
+# records get formatted a batch at a time, so don't change a record after
+# passing it to write()
+#
+# if stats is an instrumentation.RunStats, count written records and time
+# the 'encode', 'write' (on the writer thread), and 'write_wait' (waiting
+# for the writer thread to catch up) phases
+class RecordWriter:
+    def __init__(self, filename=None, compression=None,
+                 batch_records=DEFAULT_BATCH_RECORDS, queue_size=DEFAULT_QUEUE_SIZE,
+                 stats=None):
+        if compression is None and filename:
+            compression = compression_for_filename(filename)
+        assert compression is None or compression in COMPRESSIONS, f'unknown compression: {compression}'
+
+        self.raw = open(filename, 'wb') if filename else sys.stdout.buffer
+        self.owns_raw = bool(filename)
+        if compression == 'gzip':
+            self.out = gzip.GzipFile(fileobj=self.raw, mode='wb', **COMPRESSION_KWARGS['gzip'])
+        elif compression:
+            self.out = COMPRESSIONS[compression][1](self.raw, 'wb', **COMPRESSION_KWARGS[compression])
+        else:
+            self.out = self.raw
+
+        self.batch_records = batch_records
+        self.stats = stats
+        self.records = []
+        self.n_records = 0
+        self.batches = queue.Queue(maxsize=queue_size)
+        self.error = None
+        self.thread = threading.Thread(target=self._write_batches, daemon=True)
+        self.thread.start()
+
+    def _write_batches(self):
+        while True:
+            lines = self.batches.get()
+            if lines is None:
+                self.batches.task_done()
+                return
+            if self.error is not None:
+                self.batches.task_done()
+                continue # keep draining so the producer never blocks
+            try:
+                t = time.perf_counter()
+                # json's output is pure ASCII (it escapes everything else)
+                self.out.write(('\n'.join(lines) + '\n').encode('ascii'))
+                if self.stats is not None:
+                    self.stats.add_secs('write', time.perf_counter() - t)
+                    self.stats.add(records_written=len(lines))
+            except Exception as e:
+                # hand the error to the writing thread so it can re-raise
+                self.error = e
+            self.batches.task_done()
+
+    def _check_error(self):
+        if self.error is not None:
+            raise self.error
+
+    def _flush_records(self):
+        if not self.records:
+            return
+        self._check_error()
+        if self.stats is None:
+            self.batches.put([format_record(r) for r in self.records])
+        else:
+            with self.stats.phase('encode'):
+                lines = [format_record(r) for r in self.records]
+            with self.stats.phase('write_wait'):
+                self.batches.put(lines)
+        self.records = []
+
+    # waits until everything written so far has been handed to the file
+    # (or compressor), e.g., so that stats include all of it
+    def drain(self):
+        self._flush_records()
+        if self.stats is None:
+            self.batches.join()
+        else:
+            with self.stats.phase('write_wait'):
+                self.batches.join()
+        self._check_error()
+
+    def write(self, data):
+        self.records.append(data)
+        self.n_records += 1
+        if len(self.records) >= self.batch_records:
+            self._flush_records()
+
+    def close(self):
+        self._flush_records()
+        self.batches.put(None)
+        self.thread.join()
+        if self.out is not self.raw:
+            self.out.close() # (doesn't close the raw file it wraps)
+        if self.owns_raw:
+            self.raw.close()
+        else:
+            self.raw.flush()
+        self._check_error()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
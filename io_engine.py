@@ -0,0 +1,114 @@
+# created: 2026-10-18
+# batched, concurrent stat/read calls for create_inventory.py
+
+# goal: be FAST!!! -- on cloud-mounted, FUSE, and network filesystems, each
+# stat() or open()/read() call spends most of its time waiting on a round
+# trip, not on bandwidth. issuing them strictly one at a time means paying
+# that latency once per file; keeping many calls in flight at once pays it
+# roughly once per batch instead
+#
+# (these are all blocking calls that asyncio would have to hand to a thread
+# pool anyhow, so this just uses the thread pool directly, like the rest of
+# the crawler)
+
+import sys
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_IO_THREADS = 32
+
+# max number of calls in flight per thread, by default
+IN_FLIGHT_PER_THREAD = 8
+
+
+class IOEngine:
+    def __init__(self, n_threads=DEFAULT_IO_THREADS, max_in_flight=None):
+        assert n_threads >= 1
+        self.n_threads = n_threads
+        self.max_in_flight = max_in_flight or n_threads * IN_FLIGHT_PER_THREAD
+        self.pool = ThreadPoolExecutor(max_workers=n_threads)
+        # key: kind of call (e.g., 'stat' or 'read'), value: number completed
+        self.counts = Counter()
+        self.counts_lock = threading.Lock()
+        self.start_time = time.perf_counter()
+        self.end_time = None
+
+    def _count(self, kind, n=1):
+        with self.counts_lock:
+            self.counts[kind] += n
+
+    # like ThreadPoolExecutor.submit, but counts the call as one op of kind
+    def submit(self, kind, fn, *args):
+        fut = self.pool.submit(fn, *args)
+        fut.add_done_callback(lambda f: self._count(kind))
+        return fut
+
+    # yields every item of groups (e.g., one per directory) in order, but
+    # only after fn(x) has run for every x in items_of(group). calls run on
+    # the thread pool, with up to max_in_flight of them at once, so one
+    # directory's calls overlap with the next ones'. the limit holds within
+    # a group too: a directory with 100k entries gets submitted as earlier
+    # calls finish, not all at once. fn is run for its side effects (like
+    # warming os.DirEntry's stat cache), and any exception it raises gets
+    # re-raised here
+    def prefetch(self, kind, groups, items_of, fn):
+        slots = threading.BoundedSemaphore(self.max_in_flight)
+        release = lambda f: slots.release()
+        pending = deque() # [group, futures, n done so far], oldest first
+
+        # (futures mostly finish in order, so remember how far along the
+        # oldest group is instead of re-checking all of its futures)
+        def oldest_done():
+            entry = pending[0]
+            futures = entry[1]
+            while entry[2] < len(futures) and futures[entry[2]].done():
+                entry[2] += 1
+            return entry[2] == len(futures)
+
+        def finish_oldest():
+            group, futures, _ = pending.popleft()
+            for f in futures:
+                f.result()
+            return group
+
+        for group in groups:
+            futures = []
+            for x in items_of(group):
+                if not slots.acquire(blocking=False):
+                    # at the limit: hand back finished groups while we wait
+                    while pending and oldest_done():
+                        yield finish_oldest()
+                    slots.acquire()
+                fut = self.submit(kind, fn, x)
+                fut.add_done_callback(release)
+                futures.append(fut)
+            pending.append([group, futures, 0])
+            while pending and oldest_done():
+                yield finish_oldest()
+        while pending:
+            yield finish_oldest()
+
+    def close(self):
+        self.pool.shutdown()
+        self.end_time = time.perf_counter()
+
+    # returns a dict of op counts per kind, plus total ops, elapsed seconds,
+    # and ops per second
+    def report(self):
+        end = self.end_time if self.end_time is not None else time.perf_counter()
+        secs = end - self.start_time
+        with self.counts_lock:
+            ret = dict(self.counts)
+        n_ops = sum(ret.values())
+        ret['ops'] = n_ops
+        ret['secs'] = round(secs, 3)
+        ret['ops_per_sec'] = round(n_ops / secs) if secs > 0 else 0
+        return ret
+
+    def print_report(self, file=sys.stderr):
+        r = self.report()
+        kinds = ', '.join(f'{r[k]} {k}' for k in sorted(self.counts))
+        print(f'io engine: {kinds} in {r["secs"]}s with {self.n_threads} threads '
+              f'(max {self.max_in_flight} in flight): {r["ops_per_sec"]} ops/sec', file=file)
@@ -1,6 +1,5 @@
 #!/bin/sh
 
-rm -f /tmp/left.txt /tmp/right.txt
-python3 create_inventory.py "$1" left > /tmp/left.txt
-python3 create_inventory.py "$2" right > /tmp/right.txt
-python3 compare_inventories.py /tmp/left.txt /tmp/right.txt
+# crawls both trees concurrently and compares them in one process, without
+# writing inventory files (see direct_compare.py)
+python3 direct_compare.py "$1" "$2"
@@ -0,0 +1,269 @@
+# created: 2026-10-18
+# see 'parser' for expected command-line arguments
+
+# goal: be FAST!!! -- one crawl process can only keep one disk busy at a
+# time, and hashing in it shares one GIL. a backup host with many volumes
+# can crawl them all at once: one process per shard, so each has its own
+# GIL, scheduled so that each device gets its own worker(s) instead of
+# several processes fighting over the same spindle
+
+''' crawls several roots (e.g., one per volume), or the top-level
+subdirectories of one root, in a pool of processes, and writes the result
+as a SHARDED inventory: one inventory segment per shard plus a manifest
+that every tool reads as one logical inventory:
+
+python3 sharded_crawl.py /tmp/backup-inv backup /mnt/disk1 /mnt/disk2 /mnt/disk3 --checksum
+python3 sharded_crawl.py /tmp/home-inv mba ~/ --split
+python3 compare_inventories.py /tmp/backup-inv/manifest.json /tmp/home-inv/manifest.json
+
+canonical paths in the logical inventory are relative to the roots' common
+parent (with --split, to the root itself), e.g., disk1/photos/... for the
+first example, so they're the same as if that common parent had been
+crawled with create_inventory.py (minus anything outside of the roots)
+
+output directory layout:
+
+  manifest.json          combined metadata, and the list of segments
+  segment-000.jsonl ...  create_inventory.py inventory of each shard (with
+                         canonical paths already relative to the logical
+                         root), compressed if --compress is given
+'''
+
+import argparse
+import functools
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from compare_inventories import path_sort_key
+from create_inventory import create_inventory, scan_directory, DEFAULT_IGNORE_DIRS
+from file_hashing import HASH_ALGORITHMS, DEFAULT_HASH_THREADS
+from ignore_rules import make_ignore_rules
+from inventory_io import COMPRESSIONS, open_inventory_file
+
+# requires python >= 3.6 for f-strings
+# (NB: compare version_info, since sys.version[:3] is '3.1' on python 3.10+)
+assert sys.version_info >= (3, 6)
+
+MANIFEST_FILENAME = 'manifest.json'
+
+# number of shards crawled at once on the same device, by default
+DEFAULT_WORKERS_PER_DEVICE = 1
+
+
+# one part of the logical tree to crawl in its own process
+class Shard:
+    def __init__(self, rootdir, canonical_root, extra_ignore_dirs=()):
+        self.rootdir = rootdir
+        self.canonical_root = canonical_root
+        # with --split, the root's own files are a shard too; it skips all
+        # subdirectories (which are shards of their own) by ignoring them
+        self.extra_ignore_dirs = tuple(extra_ignore_dirs)
+        self.device = os.stat(rootdir).st_dev
+
+
+# returns (logical rootdir, list of Shards) for crawling roots, each a
+# directory. with split=True, roots must be a single directory, whose
+# top-level subdirectories (minus ignored ones) each become a shard, plus
+# one for the files directly in it
+def plan_shards(roots, split=False, ignore_dirs=DEFAULT_IGNORE_DIRS, ignore_rules=None):
+    roots = [os.path.abspath(r) for r in roots]
+    for r in roots:
+        assert os.path.isdir(r), f'{r} is not a directory'
+
+    if split:
+        assert len(roots) == 1, '--split takes exactly one root'
+        root = roots[0]
+        listing = scan_directory(root, ignore_dirs)
+        assert listing is not None, f'can\'t list {root}'
+        subdir_names = listing[1]
+        if ignore_rules:
+            subdir_names = [e for e in subdir_names if not ignore_rules.ignore_subdir('', e)]
+        shards = [Shard(root, '', extra_ignore_dirs=subdir_names)]
+        shards.extend(Shard(os.path.join(root, e), e) for e in sorted(subdir_names))
+        return (root, shards)
+
+    assert len(set(roots)) == len(roots), 'the same root is given more than once'
+    if len(roots) == 1:
+        return (roots[0], [Shard(roots[0], '')])
+    logical_root = os.path.commonpath(roots)
+    shards = []
+    for r in roots:
+        canonical_root = os.path.relpath(r, logical_root).replace(os.sep, '/')
+        assert canonical_root != '.', f'{r} contains the other roots'
+        shards.append(Shard(r, canonical_root))
+    # roots inside of other roots would get crawled twice
+    by_path = sorted(shards, key=lambda s: s.canonical_root)
+    for a, b in zip(by_path, by_path[1:]):
+        assert not b.canonical_root.startswith(a.canonical_root + '/'), \
+            f'{b.rootdir} is inside of {a.rootdir}'
+    return (logical_root, shards)
+
+
+# crawls one shard into its segment file (runs in a worker process) and
+# returns the shard's stats (see instrumentation.RunStats.as_dict)
+def _crawl_shard(shard, label, ignore_globs, ignore_rules_file, kwargs):
+    ignore_rules = None
+    if ignore_globs or ignore_rules_file:
+        ignore_rules = make_ignore_rules(globs=ignore_globs, rules_file=ignore_rules_file,
+                                         use_defaults=False)
+    kwargs = dict(kwargs)
+    kwargs['ignore_dirs'] = tuple(kwargs.get('ignore_dirs', DEFAULT_IGNORE_DIRS)) + shard.extra_ignore_dirs
+    stats = create_inventory(shard.rootdir, label, output=shard.output, ignore_rules=ignore_rules,
+                             canonical_root=shard.canonical_root, **kwargs)
+    return stats.as_dict()
+
+
+# runs fn(shard) for every shard on a pool of n_processes processes, with
+# at most workers_per_device shards of the same device at once. returns the
+# results in the order of shards
+def run_per_device(shards, fn, n_processes, workers_per_device=DEFAULT_WORKERS_PER_DEVICE):
+    # key: device, value: indexes of its shards that haven't started yet
+    pending = {}
+    for i, s in enumerate(shards):
+        pending.setdefault(s.device, []).append(i)
+    for q in pending.values():
+        q.reverse() # (so that pop() takes them in order)
+    n_running = dict.fromkeys(pending, 0)
+    running = {} # future -> (shard index, device)
+    results = [None] * len(shards)
+
+    with ProcessPoolExecutor(max_workers=n_processes) as pool:
+        def start_more():
+            # round-robin across devices, so that all of them get going
+            started = True
+            while started:
+                started = False
+                for dev, q in pending.items():
+                    if q and n_running[dev] < workers_per_device and len(running) < n_processes:
+                        i = q.pop()
+                        running[pool.submit(fn, shards[i])] = (i, dev)
+                        n_running[dev] += 1
+                        started = True
+
+        start_more()
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                i, dev = running.pop(fut)
+                n_running[dev] -= 1
+                results[i] = fut.result()
+            start_more()
+    return results
+
+
+# crawls roots (see plan_shards) into a sharded inventory in out_dir, with
+# n_processes processes (default: workers_per_device per device). takes
+# create_inventory's keyword arguments (except for incremental_from and
+# hash_cache_file, which can't be shared across processes), plus
+# ignore_globs and ignore_rules_file for ignore rules. returns the manifest
+#
+# if record_stats is True, save each shard's full stats in the manifest
+# (see instrumentation.RunStats.as_dict) and print a line per shard to stderr
+def sharded_crawl(out_dir, label, roots, split=False, n_processes=None,
+                  workers_per_device=DEFAULT_WORKERS_PER_DEVICE, compression=None,
+                  ignore_globs=None, ignore_rules_file=None, record_stats=False, **kwargs):
+    assert not kwargs.get('incremental_from'), '--incremental isn\'t supported for sharded crawls'
+    assert not kwargs.get('hash_cache_file'), '--hash_cache isn\'t supported for sharded crawls'
+    ts = time.time()
+    ignore_rules = None
+    if ignore_globs or ignore_rules_file:
+        ignore_rules = make_ignore_rules(globs=ignore_globs, rules_file=ignore_rules_file,
+                                         use_defaults=False)
+    ignore_dirs = kwargs.get('ignore_dirs', DEFAULT_IGNORE_DIRS)
+    logical_root, shards = plan_shards(roots, split, ignore_dirs, ignore_rules)
+    # in path order, so that sorted segments make a sorted whole
+    shards.sort(key=lambda s: path_sort_key(s.canonical_root, ''))
+
+    n_devices = len(set(s.device for s in shards))
+    if n_processes is None:
+        n_processes = n_devices * workers_per_device
+    n_processes = max(1, min(n_processes, len(shards)))
+    print(f'crawling {len(shards)} shards on {n_devices} devices with {n_processes} processes', file=sys.stderr)
+
+    os.makedirs(out_dir, exist_ok=True)
+    ext = COMPRESSIONS[compression][0] if compression else ''
+    for i, s in enumerate(shards):
+        s.output = os.path.join(out_dir, f'segment-{i:03d}.jsonl{ext}')
+    fn = functools.partial(_crawl_shard, label=label, ignore_globs=ignore_globs,
+                           ignore_rules_file=ignore_rules_file,
+                           kwargs=dict(kwargs, compression=compression))
+    results = run_per_device(shards, fn, n_processes, workers_per_device)
+
+    # combined metadata: like the first segment's, but for the logical root
+    with open_inventory_file(shards[0].output) as f:
+        metadata = json.loads(f.readline())
+    metadata.pop('canonical_root', None)
+    metadata['ts'] = ts
+    metadata['rootdir'] = logical_root
+    metadata['ignore_dirs'] = list(ignore_dirs)
+    metadata['shards'] = len(shards)
+
+    segments = []
+    for s, r in zip(shards, results):
+        segments.append(dict(file=os.path.basename(s.output), rootdir=s.rootdir,
+                             canonical_root=s.canonical_root, device=s.device,
+                             files=r.get('files', 0), wall_secs=r['wall_secs']))
+        if record_stats:
+            segments[-1]['stats'] = r
+    manifest = dict(manifest=1, metadata=metadata, segments=segments)
+    # written last (and atomically), so a manifest always means a complete crawl
+    manifest_filename = os.path.join(out_dir, MANIFEST_FILENAME)
+    with open(manifest_filename + '.tmp', 'w') as f:
+        json.dump(manifest, f)
+        f.write('\n')
+    os.replace(manifest_filename + '.tmp', manifest_filename)
+
+    if record_stats:
+        print(f'stats: {len(shards)} shards in {time.time() - ts:.3f}s', file=sys.stderr)
+        for seg in segments:
+            r = seg['stats']
+            print(f'  {seg["file"]:<24} {r["wall_secs"]:10.3f}s {seg["files"]:>10} files  {r.get("files_per_sec", 0):>8}/s  {seg["canonical_root"] or "."}',
+                  file=sys.stderr)
+    return manifest
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+
+    # mandatory positional arguments:
+    parser.add_argument("out_dir", help="directory to write the manifest and segments to (gets created if needed)")
+    parser.add_argument("label", help="label name for this inventory")
+    parser.add_argument("roots", nargs='+', help="root directories to crawl (e.g., one per volume)")
+    parser.add_argument("--split", action="store_true",
+                        help="crawl each top-level subdirectory of the (single) root as its own shard")
+    parser.add_argument("--processes", type=int,
+                        help="max number of crawl processes (default: one per device, times --workers_per_device)")
+    parser.add_argument("--workers_per_device", type=int, default=DEFAULT_WORKERS_PER_DEVICE,
+                        help="max number of shards to crawl at once on the same device (raise it for SSDs and network filesystems)")
+    parser.add_argument("--checksum", help="take a crc32 checksum of first N bytes of files (SLOW!)",
+                        action="store_true")
+    parser.add_argument("--hash", choices=HASH_ALGORITHMS,
+                        help="hash files with this algorithm; all but crc32-prefix read the FULL contents (SLOWER!)")
+    parser.add_argument("--hash_threads", type=int, default=DEFAULT_HASH_THREADS,
+                        help="number of threads to hash files on, per process")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="crawl each shard with N threads")
+    parser.add_argument("--record_dirs", action="store_true",
+                        help="also record each directory's modtime")
+    parser.add_argument("--sorted", action="store_true",
+                        help="write files in path order, for compare_inventories.py --stream (can't be used with --workers)")
+    parser.add_argument("--compress", choices=sorted(COMPRESSIONS),
+                        help="compress the segments on the fly")
+    parser.add_argument("--ignore", nargs='+', dest="ignore_globs",
+                        help="don't inventory paths matching the following gitignore-style globs: <list>")
+    parser.add_argument("--ignore_rules", help="read more ignore rules from this file (see ignore_rules.py for its format)")
+    parser.add_argument("--stats", action="store_true",
+                        help="print how long each shard took, and save each shard's stats in the manifest")
+
+    args = parser.parse_args()
+    manifest = sharded_crawl(args.out_dir, args.label, args.roots, args.split, args.processes,
+                             args.workers_per_device, args.compress,
+                             args.ignore_globs, args.ignore_rules, args.stats,
+                             take_checksum=args.checksum, hash_algorithm=args.hash,
+                             n_hash_threads=args.hash_threads, n_workers=args.workers,
+                             record_dirs=args.record_dirs, sort_paths=args.sorted)
+    n_files = sum(seg['files'] for seg in manifest['segments'])
+    print(f'{n_files} files in {len(manifest["segments"])} segments; read it as {os.path.join(args.out_dir, MANIFEST_FILENAME)}',
+          file=sys.stderr)
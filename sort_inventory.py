@@ -0,0 +1,89 @@
+# created: 2026-10-18
+# see 'parser' for expected command-line arguments
+
+# goal: be FAST!!!
+
+''' externally sorts a .jsonl inventory into path order (see
+compare_inventories.path_sort_key) so that it can be used with
+compare_inventories.py --stream, using bounded memory no matter how large
+the inventory is:
+
+python3 sort_inventory.py inventory-files_do-not-add-to-git/2018-12-01-mba.jsonl /tmp/2018-12-01-mba.sorted.jsonl
+
+inventories made with create_inventory.py --sorted are already in path order
+'''
+
+import argparse
+import heapq
+import json
+import os
+import sys
+import tempfile
+from compare_inventories import iter_inventory_records, path_sort_key
+
+# requires python >= 3.6 for f-strings
+# (NB: compare version_info, since sys.version[:3] is '3.1' on python 3.10+)
+assert sys.version_info >= (3, 6)
+
+# how many records to sort in memory at once before spilling a sorted run
+# to a temporary file
+DEFAULT_RUN_SIZE = 1000000
+
+
+def _line_sort_key(line):
+    r = json.loads(line)
+    return path_sort_key(r['d'], r['f'])
+
+
+def sort_inventory(in_filename, out_filename, run_size=DEFAULT_RUN_SIZE):
+    records = iter_inventory_records(in_filename)
+    metadata = next(records)
+    # per-directory records only make sense right before their files in
+    # crawl order, so they don't survive sorting
+    metadata.pop('record_dirs', None)
+    metadata['sorted'] = True
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # phase 1: write sorted runs of at most run_size records each
+        run_filenames = []
+        run = []
+
+        def flush_run():
+            run.sort(key=lambda e: e[0])
+            fn = os.path.join(tmpdir, f'run{len(run_filenames)}.jsonl')
+            with open(fn, 'w') as f:
+                f.writelines(line for key, line in run)
+            run_filenames.append(fn)
+            run.clear()
+
+        for r in records:
+            if 'dir' in r:
+                continue
+            run.append((path_sort_key(r['d'], r['f']), json.dumps(r) + '\n'))
+            if len(run) >= run_size:
+                flush_run()
+        if run or not run_filenames:
+            flush_run()
+
+        # phase 2: k-way merge of all runs
+        run_files = [open(fn) for fn in run_filenames]
+        try:
+            with open(out_filename, 'w') as out:
+                out.write(json.dumps(metadata) + '\n')
+                out.writelines(heapq.merge(*run_files, key=_line_sort_key))
+        finally:
+            for f in run_files:
+                f.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+
+    # mandatory positional arguments:
+    parser.add_argument("in_file", help="inventory file to sort")
+    parser.add_argument("out_file", help="sorted .jsonl inventory file to write")
+    parser.add_argument("--run_size", type=int, default=DEFAULT_RUN_SIZE,
+                        help="number of records to sort in memory at once")
+
+    args = parser.parse_args()
+    sort_inventory(args.in_file, args.out_file, args.run_size)
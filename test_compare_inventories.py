@@ -0,0 +1,64 @@
+# created: 2026-10-18
+# run with: python3 -m pytest test_compare_inventories.py
+
+from binary_inventory import columns_from_records
+from compare_inventories import detect_moves
+from inventory import Inventory
+
+
+def make_inventory(records, **metadata):
+    return columns_from_records(dict(ts=0, **metadata), records, cls=Inventory)
+
+
+def rec(d, f, sz, mt=1000.0, **kwargs):
+    return dict(d=d, f=f, e='', mt=mt, sz=sz, **kwargs)
+
+
+def test_detect_moves_prefers_same_name():
+    first = make_inventory([rec('a', 'x', 0), rec('a', 'y', 0)])
+    second = make_inventory([rec('b', 'y', 0), rec('b', 'x', 0)])
+    moves, only_first, only_second = detect_moves(first, second, [0, 1], [0, 1])
+    assert moves == [(0, 1), (1, 0)]
+    assert only_first == [] and only_second == []
+
+
+def test_detect_moves_skips_ambiguous_bucket():
+    first = make_inventory([rec('a', 'x', 0)])
+    second = make_inventory([rec('b', 'y', 0), rec('b', 'z', 0)])
+    moves, only_first, only_second = detect_moves(first, second, [0], [0, 1])
+    assert moves == []
+    assert only_first == [0] and only_second == [0, 1]
+
+
+def test_detect_moves_single_candidate_renamed():
+    first = make_inventory([rec('a', 'x', 5)])
+    second = make_inventory([rec('b', 'y', 5)])
+    moves, only_first, only_second = detect_moves(first, second, [0], [0])
+    assert moves == [(0, 0)]
+
+
+# with --ignore_modtimes and no hashes, the same size alone isn't a move
+def test_detect_moves_ignore_modtimes_without_hashes_needs_same_name():
+    first = make_inventory([rec('a', 'x', 5, mt=1.0), rec('a', 'keep', 7, mt=1.0)])
+    second = make_inventory([rec('b', 'y', 5, mt=2.0), rec('b', 'keep', 7, mt=2.0)])
+    moves, only_first, only_second = detect_moves(first, second, [0, 1], [0, 1], ignore_modtimes=True)
+    assert moves == [(1, 1)]
+    assert only_first == [0] and only_second == [0]
+
+
+def test_detect_moves_ignore_modtimes_with_hashes_allows_renames():
+    metadata = dict(take_checksum=True, hash='crc32-prefix')
+    first = make_inventory([rec('a', 'x', 5, mt=1.0, crc32=123)], **metadata)
+    second = make_inventory([rec('b', 'y', 5, mt=2.0, crc32=123)], **metadata)
+    moves, only_first, only_second = detect_moves(first, second, [0], [0], ignore_modtimes=True)
+    assert moves == [(0, 0)]
+
+
+# many files with the same signature (e.g., empty files) must stay fast
+def test_detect_moves_large_bucket():
+    n = 50000
+    first = make_inventory([rec('a', f'x{k}', 0) for k in range(n)])
+    second = make_inventory([rec('b', f'x{k}', 0) for k in range(n)])
+    moves, only_first, only_second = detect_moves(first, second, list(range(n)), list(range(n)))
+    assert len(moves) == n
+    assert only_first == [] and only_second == []
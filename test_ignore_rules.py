@@ -0,0 +1,20 @@
+# created: 2026-10-18
+# run with: python3 -m pytest test_ignore_rules.py
+
+import fnmatch
+from ignore_rules import NameMatcher, make_ignore_rules
+
+NAMES = ['a', 'a.txt', 'b.tar.gz', '.hidden', 'x.', 'README', 'notes.TXT']
+
+
+# every fast path has to agree with plain fnmatch
+def test_name_matcher_matches_like_fnmatch():
+    for g in ('*', '*.txt', '*.gz', '*.tar.gz', '*.', '*E', 'RE*', 'a', '?.txt', '[ab]*'):
+        m = NameMatcher([g])
+        assert [n for n in NAMES if m.match(n)] == [n for n in NAMES if fnmatch.fnmatchcase(n, g)], g
+
+
+def test_ignore_everything():
+    rules = make_ignore_rules(globs=['*'], use_defaults=False)
+    assert rules.ignore_file('', 'a.txt')
+    assert rules.ignore_file('some/dir', 'b')
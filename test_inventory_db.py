@@ -0,0 +1,109 @@
+# created: 2026-10-18
+# run with: python3 -m pytest test_inventory_db.py
+
+import os
+import pytest
+from create_inventory import create_inventory
+from inventory_db import InventoryDB
+from inventory_io import iter_jsonl_inventory
+from sharded_crawl import sharded_crawl
+
+
+def write_file(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def crawl(root, out, label, **kwargs):
+    create_inventory(str(root), label, output=str(out), **kwargs)
+    return str(out)
+
+
+def make_tree(root, files):
+    for path, data in files.items():
+        write_file(os.path.join(root, path), data)
+    return root
+
+
+def file_keys(records):
+    return sorted((r['d'], r['f'], r['sz'], r['mt']) for r in records)
+
+
+def test_import_round_trip(tmp_path):
+    root = make_tree(str(tmp_path / 'tree'), {'a.txt': b'a', 'd/b.pdf': b'bb', 'd/e/c': b'ccc'})
+    inv = crawl(root, tmp_path / 'inv.jsonl', 'tree', take_checksum=True)
+    records = list(iter_jsonl_inventory(inv))[1:]
+
+    with InventoryDB(str(tmp_path / 'inv.db')) as db:
+        assert db.import_inventory(inv, 'tree') == 'tree'
+        assert file_keys(db.files('tree')) == file_keys(records)
+        assert [s['n_files'] for s in db.snapshots()] == [3]
+        assert [r['f'] for r in db.files('tree', under='d')] == ['b.pdf', 'c']
+        assert [r['f'] for r in db.files('tree', ext='.pdf')] == ['b.pdf']
+        assert [r['f'] for r in db.files('tree', min_size=2)] == ['b.pdf', 'c']
+
+        with pytest.raises(AssertionError):
+            db.import_inventory(inv, 'tree')
+        db.import_inventory(inv, 'tree', replace=True)
+        assert len(list(db.files('tree'))) == 3
+        db.drop('tree')
+        assert db.snapshots() == []
+
+
+def test_missing(tmp_path):
+    needle = make_tree(str(tmp_path / 'needle'), {'moved/a': b'aaaa', 'b': b'bbbb', 'only_here': b'xyz'})
+    haystack = make_tree(str(tmp_path / 'haystack'), {'elsewhere/renamed': b'aaaa', 'b': b'bbbb', 'only_here': b'zyx'})
+    with InventoryDB(str(tmp_path / 'inv.db')) as db:
+        for name, root, kwargs in (('needle', needle, dict(take_checksum=True)),
+                                   ('haystack', haystack, dict(take_checksum=True)),
+                                   ('needle_nohash', needle, {}),
+                                   ('haystack_nohash', haystack, {})):
+            db.import_inventory(crawl(root, tmp_path / f'{name}.jsonl', name, **kwargs), name)
+
+        # by size and hash: moved and renamed files are still there
+        assert [(r['d'], r['f']) for r in db.missing('needle', 'haystack')] == [('', 'only_here')]
+        # by basename and size: the renamed file isn't, and only_here (same
+        # name, same size, different contents) looks like it is
+        assert [(r['d'], r['f']) for r in db.missing('needle_nohash', 'haystack_nohash')] == [('moved', 'a')]
+
+
+def test_duplicates(tmp_path):
+    root = make_tree(str(tmp_path / 'tree'), {'a': b'same', 'd/b': b'same', 'c': b'diff', 'empty1': b'', 'empty2': b''})
+    with InventoryDB(str(tmp_path / 'inv.db')) as db:
+        db.import_inventory(crawl(root, tmp_path / 'inv.jsonl', 'tree', take_checksum=True), 'tree')
+        groups = db.duplicates('tree')
+        assert [[(r['d'], r['f']) for r in g] for g in groups] == [[('', 'a'), ('d', 'b')]]
+        assert len(db.duplicates('tree', min_size=0)) == 2
+
+
+def test_import_manifest(tmp_path):
+    root = os.fsencode(tmp_path / 'tree')
+    for path in (b'top', b'd1/a', b'd1/sub/b', b'd2/\xef', b'\xe9/c'):
+        write_file(os.path.join(root, path), path)
+    root = str(tmp_path / 'tree')
+    sharded_crawl(str(tmp_path / 'sharded'), 'tree', [root], split=True, n_processes=2, take_checksum=True)
+    plain = crawl(root, tmp_path / 'plain.jsonl', 'tree', take_checksum=True)
+
+    with InventoryDB(str(tmp_path / 'inv.db')) as db:
+        db.import_inventory(str(tmp_path / 'sharded' / 'manifest.json'), 'sharded')
+        db.import_inventory(plain, 'plain')
+        assert file_keys(db.files('sharded')) == file_keys(db.files('plain'))
+        assert len(list(db.files('sharded'))) == 5
+        assert list(db.compare('plain', 'sharded')) == []
+        assert list(db.missing('sharded', 'plain')) == []
+
+
+# os.scandir gives names that aren't valid utf-8 as surrogate-escaped strs
+def test_import_non_utf8_names(tmp_path):
+    root = os.fsencode(tmp_path / 'tree')
+    write_file(os.path.join(root, b'\xef'), b'x')
+    write_file(os.path.join(root, b'd\xe9', b'f.t\xe9xt'), b'yy')
+    inv = crawl(tmp_path / 'tree', tmp_path / 'inv.jsonl', 'tree', take_checksum=True)
+
+    with InventoryDB(str(tmp_path / 'inv.db')) as db:
+        db.import_inventory(inv, 'tree')
+        paths = [(r['d'], r['f']) for r in db.files('tree')]
+        assert paths == [('', '\udcef'), ('d\udce9', 'f.t\udce9xt')]
+        assert [r['f'] for r in db.files('tree', under='d\udce9', ext='.t\udce9xt')] == ['f.t\udce9xt']
+        assert list(db.missing('tree', 'tree')) == []